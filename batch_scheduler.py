@@ -0,0 +1,134 @@
+"""文件夹批处理调度器
+
+按预估耗时（时长 × 文件大小）从大到小排列任务（最长任务优先，缩短总耗时），
+流复制任务 ('io'，受磁盘带宽限制) 和重编码任务 ('cpu'，受 CPU 限制) 分别使用
+独立的并发上限，全部完成后汇总吞吐量。
+"""
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from media_probe import probe_many
+
+# 流复制任务主要受磁盘带宽限制，少量并发即可跑满
+DEFAULT_IO_WORKERS = 4
+
+# 重编码任务中 ffmpeg 自身会使用多线程，每个任务按约 4 个核心估算
+DEFAULT_CPU_WORKERS = max(1, (os.cpu_count() or 1) // 4)
+
+
+def make_job(name, func, args=(), kwargs=None, kind='io', input_file=None):
+    """
+    创建一个批处理任务
+
+    参数:
+        name: 显示名称
+        func: 执行函数，返回 True 表示成功
+        args, kwargs: 传给 func 的参数
+        kind: 'io'（流复制）或 'cpu'（重编码）
+        input_file: 输入文件，用于估算耗时和统计吞吐量
+
+    返回:
+        任务字典
+    """
+    return {
+        'name': name,
+        'func': func,
+        'args': tuple(args),
+        'kwargs': dict(kwargs or {}),
+        'kind': kind,
+        'input_file': input_file,
+        'bytes': 0,
+        'duration': 0.0,
+        'cost': 0.0,
+    }
+
+
+def estimate_costs(jobs):
+    """并行探测输入文件，填入 bytes / duration / cost"""
+    files = [job['input_file'] for job in jobs if job['input_file']]
+    infos = dict(zip(files, probe_many(files)))
+
+    for job in jobs:
+        input_file = job['input_file']
+        if not input_file:
+            continue
+        try:
+            job['bytes'] = os.path.getsize(input_file)
+        except OSError:
+            job['bytes'] = 0
+        info = infos.get(input_file)
+        try:
+            job['duration'] = float(info['format']['duration'])
+        except (TypeError, KeyError, ValueError):
+            job['duration'] = 0.0
+        # 无法获取时长时只按文件大小估算
+        job['cost'] = job['bytes'] * (job['duration'] or 1.0)
+
+
+def _run_job(job):
+    """执行单个任务，异常视为失败"""
+    try:
+        return bool(job['func'](*job['args'], **job['kwargs']))
+    except Exception as e:
+        print(f"任务 '{job['name']}' 发生错误: {e}")
+        return False
+
+
+def run_batch(jobs, io_workers=DEFAULT_IO_WORKERS, cpu_workers=DEFAULT_CPU_WORKERS):
+    """
+    并发执行批处理任务
+
+    参数:
+        jobs: make_job 创建的任务列表
+        io_workers: 流复制任务的并发数
+        cpu_workers: 重编码任务的并发数
+
+    返回:
+        (成功数, 失败数)
+    """
+    if not jobs:
+        return 0, 0
+
+    estimate_costs(jobs)
+    ordered = sorted(jobs, key=lambda job: job['cost'], reverse=True)
+
+    io_count = sum(1 for job in jobs if job['kind'] == 'io')
+    cpu_count = len(jobs) - io_count
+    print(f"\n调度 {len(jobs)} 个任务 (流复制 {io_count} 个 / 并发 {io_workers}, "
+          f"重编码 {cpu_count} 个 / 并发 {cpu_workers})，按预估耗时从大到小执行")
+
+    pools = {
+        'io': ThreadPoolExecutor(max_workers=max(1, io_workers)),
+        'cpu': ThreadPoolExecutor(max_workers=max(1, cpu_workers)),
+    }
+    success_count = 0
+    fail_count = 0
+    done_bytes = 0
+    done_duration = 0.0
+    start_time = time.time()
+
+    try:
+        futures = {pools[job['kind']].submit(_run_job, job): job for job in ordered}
+        for future in as_completed(futures):
+            job = futures[future]
+            if future.result():
+                success_count += 1
+                done_bytes += job['bytes']
+                done_duration += job['duration']
+                status = "完成"
+            else:
+                fail_count += 1
+                status = "失败"
+            print(f"\n[{success_count + fail_count}/{len(jobs)}] {status}: {job['name']}")
+    finally:
+        for pool in pools.values():
+            pool.shutdown(wait=True)
+
+    elapsed = max(time.time() - start_time, 1e-6)
+    print(f"\n总耗时: {elapsed:.1f}s")
+    print(f"吞吐量: {done_bytes / elapsed / (1024 * 1024):.1f} MB/s, "
+          f"{done_duration / elapsed:.1f}x 实时速度 (共处理 {done_duration / 60:.1f}min 视频)")
+
+    return success_count, fail_count
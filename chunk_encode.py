@@ -0,0 +1,180 @@
+"""长视频分块并行编码 (split-encode-stitch)
+
+单个 ffmpeg/libx264 进程在核心很多的机器上无法跑满所有核心。这里按关键帧把源视频
+切成多个块，用多个 ffmpeg 进程同时编码，再用 concat demuxer 无损拼接；音频单独
+编码一次后与拼接好的视频封装在一起。所有块使用相同的编码参数，拼接列表中写明
+每块的时长，保证输出时间戳连续。
+"""
+
+import os
+import bisect
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from ffmpeg_runner import run_ffmpeg
+from output_profile import output_target
+from media_probe import probe_media, get_stream
+from smart_cut import EPSILON
+from subtitles import burn_filter
+
+# 所有块共用的视频编码参数，与普通 CPU 编码模式一致
+VIDEO_ARGS = ['-c:v', 'libx264', '-crf', '23', '-preset', 'medium']
+AUDIO_ARGS = ['-c:a', 'aac', '-b:a', '128k']
+
+# 每块的最短时长（秒），太短时进程启动和码率控制的开销占比过高
+MIN_CHUNK_SECONDS = 30
+
+# 块数为并发数的若干倍，先完成的进程可以继续领取新块，避免最后只剩一个进程在跑
+CHUNKS_PER_WORKER = 4
+
+
+def default_workers():
+    """默认并发数: libx264 单进程约 4 个线程效率最高"""
+    return max(2, (os.cpu_count() or 1) // 4)
+
+
+def plan_chunks(keyframes, duration, chunk_count):
+    """
+    在最接近等分点的关键帧处切块
+
+    参数:
+        keyframes: 升序排列的关键帧时间列表
+        duration: 视频总时长
+        chunk_count: 期望的块数
+
+    返回:
+        块列表 [(start, end), ...]，首尾相接覆盖 [0, duration]
+    """
+    bounds = [0.0]
+    for i in range(1, chunk_count):
+        target = duration * i / chunk_count
+        idx = bisect.bisect_left(keyframes, target)
+        candidates = keyframes[max(0, idx - 1):idx + 1]
+        if not candidates:
+            continue
+        key = min(candidates, key=lambda k: abs(k - target))
+        if key - bounds[-1] >= MIN_CHUNK_SECONDS and duration - key >= MIN_CHUNK_SECONDS:
+            bounds.append(key)
+    bounds.append(duration)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _encode_chunk(input_file, start, end, chunk_file, threads, subtitle_file=None):
+    """编码一个视频块（不含音频），指定字幕时同时烧录这一段的字幕"""
+    # 块边界在关键帧上，起点稍微提前，保证关键帧本身落在这一块而不是上一块
+    seek = start - EPSILON if start > 0 else 0.0
+    cmd = [
+        'ffmpeg', '-v', 'error', '-y', '-nostdin',
+        '-ss', f"{seek:.6f}", '-i', input_file,
+        '-t', f"{end - start:.6f}",
+        '-map', '0:v:0', '-an', '-sn', '-dn',
+    ]
+    if subtitle_file:
+        cmd += ['-vf', burn_filter(subtitle_file, seek)]
+    cmd += VIDEO_ARGS + ['-threads', str(threads), chunk_file]
+    run_ffmpeg(cmd, label=f"块 {start:.0f}s-{end:.0f}s", duration=end - start, check=True)
+
+
+def _encode_audio(input_file, audio_file, duration):
+    """整条音轨单独编码一次"""
+    cmd = [
+        'ffmpeg', '-v', 'error', '-y', '-nostdin',
+        '-i', input_file,
+        '-map', '0:a:0', '-vn', '-sn', '-dn',
+    ] + AUDIO_ARGS + [audio_file]
+    run_ffmpeg(cmd, label="音频", duration=duration, check=True)
+
+
+def chunk_encode(input_file, output_file, workers=None, profile=None, subtitle_file=None):
+    """
+    分块并行编码一个视频文件
+
+    参数:
+        input_file: 输入视频文件
+        output_file: 输出文件
+        workers: 同时编码的块数，默认为 CPU 核心数的 1/4
+        profile: MP4 输出格式 (output_profile.PROFILES)，None 表示默认格式
+        subtitle_file: 烧录到画面中的字幕文件，每块编码时只渲染这一段的字幕
+
+    返回:
+        成功返回 True，失败返回 False
+    """
+    info = probe_media(input_file, keyframes=True)
+    if info is None:
+        return False
+
+    if get_stream(info, 'video') is None:
+        print("错误: 没有找到视频流")
+        return False
+    has_audio = get_stream(info, 'audio') is not None
+
+    try:
+        duration = float(info['format']['duration'])
+    except (KeyError, ValueError):
+        print("错误: 无法获取视频时长")
+        return False
+
+    workers = workers or default_workers()
+    chunk_count = max(1, min(int(duration // MIN_CHUNK_SECONDS), workers * CHUNKS_PER_WORKER))
+    chunks = plan_chunks(info['keyframes'], duration, chunk_count)
+    workers = min(workers, len(chunks))
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    print(f"\n分块并行编码: {len(chunks)} 个块, 并发 {workers} 个, 每个 {threads} 线程")
+
+    output_dir = os.path.dirname(output_file) or '.'
+    temp_dir = tempfile.mkdtemp(prefix='chunks_', dir=output_dir)
+
+    try:
+        chunk_files = [os.path.join(temp_dir, f"chunk_{i:04d}.ts") for i in range(len(chunks))]
+        audio_file = os.path.join(temp_dir, 'audio.m4a')
+
+        # 音频编码很快，与视频块一起提交，不单独占用一个并发
+        with ThreadPoolExecutor(max_workers=workers + int(has_audio)) as executor:
+            futures = {}
+            if has_audio:
+                futures[executor.submit(_encode_audio, input_file, audio_file, duration)] = "音频"
+            for i, ((start, end), chunk_file) in enumerate(zip(chunks, chunk_files)):
+                future = executor.submit(_encode_chunk, input_file, start, end, chunk_file, threads,
+                                         subtitle_file)
+                futures[future] = f"块 {i+1}/{len(chunks)} ({start:.2f}s - {end:.2f}s)"
+
+            try:
+                done = 0
+                for future in as_completed(futures):
+                    future.result()
+                    done += 1
+                    print(f"  [{done}/{len(futures)}] 完成: {futures[future]}")
+            except BaseException:
+                for other in futures:
+                    other.cancel()
+                raise
+
+        # 写明每块的时长，拼接后的时间戳与源文件一致且连续
+        list_file = os.path.join(temp_dir, 'chunks.txt')
+        with open(list_file, 'w', encoding='utf-8') as f:
+            f.write("ffconcat version 1.0\n")
+            for (start, end), chunk_file in zip(chunks, chunk_files):
+                f.write(f"file '{os.path.basename(chunk_file)}'\n")
+                f.write(f"duration {end - start:.6f}\n")
+
+        cmd = ['ffmpeg', '-v', 'error', '-y', '-nostdin',
+               '-f', 'concat', '-safe', '0', '-i', list_file]
+        if has_audio:
+            cmd += ['-i', audio_file, '-map', '0:v:0', '-map', '1:a:0']
+        target_args, stdout = output_target(output_file, profile)
+        cmd += ['-c', 'copy'] + target_args
+
+        print(f"\n开始拼接 {len(chunks)} 个块...")
+        run_ffmpeg(cmd, label="拼接", duration=duration, check=True, stdout=stdout)
+        return True
+
+    except subprocess.CalledProcessError as e:
+        print(f"分块编码失败: {e}")
+        return False
+    except FileNotFoundError:
+        print("错误: 未找到 ffmpeg，请确保已安装 ffmpeg 并添加到系统 PATH")
+        return False
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
@@ -1,12 +1,50 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-"""视频转 MP4 格式工具"""
+"""视频转 MP4 格式工具
+
+不带参数运行时为交互模式；带参数时批量转换，例如:
+    python convert_to_mp4.py legacy_videos -r --mode=auto --output-dir=converted
+"""
 
 import os
 import sys
+import glob
 import subprocess
 from pathlib import Path
 
+from batch_scheduler import make_job, run_batch, DEFAULT_IO_WORKERS, DEFAULT_CPU_WORKERS
+from chunk_encode import chunk_encode, VIDEO_ARGS, AUDIO_ARGS
+from encoders import hardware_video_args, calibrate, parse_codecs, DEFAULT_GPU_JOBS
+from ffmpeg_runner import run_ffmpeg
+from job_journal import (journal_path_for, partial_path, commit_output, discard_partial,
+                         is_partial_file, input_identity, load_journal, is_completed,
+                         journal_outputs, run_journaled)
+from media_probe import get_video_duration, probe_media, probe_many, get_stream
+from output_profile import (PROFILES, STDOUT_OUTPUT, output_args, output_target,
+                            is_stream_output, use_stdout_for_data)
+from subtitles import pick_sidecar, burn_filter, format_of
+from transcode_cache import transcode_cached, export_cached, evict_cache, fingerprint
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mkv', '.mov', '.flv', '.wmv', '.webm', '.ts', '.m4v',
+                    '.mpg', '.mpeg', '.3gp', '.rm', '.rmvb', '.vob')
+
+# 可以直接复制到 MP4 容器中、常见播放器都支持的编码
+MP4_VIDEO_CODECS = ('h264', 'hevc', 'mpeg4', 'av1')
+MP4_AUDIO_CODECS = ('aac', 'mp3', 'ac3', 'eac3', 'alac')
+
+# 文本字幕可以转换为 MP4 的 mov_text；图形字幕 (PGS / VobSub / DVB) 无法放入 MP4，只能丢弃
+TEXT_SUBTITLE_CODECS = ('subrip', 'srt', 'ass', 'ssa', 'webvtt', 'mov_text', 'text')
+
+STREAM_KIND_NAMES = {'video': '视频', 'audio': '音频', 'subtitle': '字幕', 'attachment': '附件',
+                     'data': '数据'}
+
+# 逐流转换时重新编码音频的码率（每声道），上限为 5.1 声道的常用码率
+AUDIO_BITRATE_PER_CHANNEL = 64
+MAX_AUDIO_BITRATE = 384
+
+# 命令行编码器名称 -> 转换模式
+ENCODER_MODES = {'cpu': 2, 'gpu': 3, 'chunked': 4, 'auto': 5}
+
 
 def check_ffmpeg():
     """检查 ffmpeg 是否安装"""
@@ -20,66 +58,542 @@ def check_ffmpeg():
         return False
 
 
-def get_output_path(input_path):
-    """生成输出文件路径"""
+def get_output_path(input_path, output_dir=None, claimed=None):
+    """生成输出文件路径
+    
+    参数:
+        input_path: 输入文件
+        output_dir: 输出文件夹，默认为输入文件所在文件夹
+        claimed: 本批次已分配的输出路径集合，同名的 a.avi 和 a.flv 不会写到同一个文件
+    """
     input_file = Path(input_path)
-    output_path = input_file.with_suffix('.mp4')
+    output_path = Path(output_dir or input_file.parent) / f"{input_file.stem}.mp4"
+    claimed = set() if claimed is None else claimed
     
-    # 如果输出文件已存在且不是输入文件本身
-    if output_path.exists() and output_path != input_file:
-        output_path = input_file.with_name(f"{input_file.stem}_converted.mp4")
-        print(f"注意: 目标文件已存在，将保存为 {output_path.name}")
+    # 如果输出文件已存在（包括重新编码 MP4 时与输入文件同名）
+    number = 1
+    while output_path.exists() or str(output_path) in claimed:
+        suffix = "_converted" if number == 1 else f"_converted{number}"
+        output_path = output_path.with_name(f"{input_file.stem}{suffix}.mp4")
+        number += 1
+    if output_path.name != f"{input_file.stem}.mp4":
+        print(f"注意: 目标文件已存在，{input_file.name} 将保存为 {output_path.name}")
     
+    claimed.add(str(output_path))
     return output_path
 
 
-def convert_video(input_path, mode):
-    """转换视频"""
-    output_path = get_output_path(input_path)
+def plan_stream_args(info, video_args=VIDEO_ARGS):
+    """
+    逐流决定复制还是重新编码
+    
+    参数:
+        info: probe_media 的探测结果
+        video_args: 视频流需要重新编码时使用的编码参数
+    
+    返回:
+        (ffmpeg 参数列表, 各流处理说明列表, 是否有流需要重新编码)
+    """
+    args = []
+    actions = []
+    transcoding = False
+    output_index = 0
+    for stream in info['streams']:
+        codec = stream.get('codec_name') or '?'
+        kind = stream.get('codec_type')
+        index = stream['index']
+        kind_name = STREAM_KIND_NAMES.get(kind, kind)
+        if kind == 'video' and stream.get('disposition', {}).get('attached_pic'):
+            actions.append(f"#{index} 封面图片 ({codec}): 丢弃")
+            continue
+        
+        if kind == 'video':
+            args += ['-map', f'0:{index}']
+            if codec in MP4_VIDEO_CODECS:
+                args += [f'-c:{output_index}', 'copy']
+                action = "复制"
+                if codec == 'hevc':
+                    # Apple 设备只识别 hvc1 标签的 HEVC
+                    args += [f'-tag:{output_index}', 'hvc1']
+            else:
+                # video_args 为 ['-c:v', 编码器, 选项, 值, ...]，选项加上输出流序号，只作用于这一条流
+                args += [f'-c:{output_index}', video_args[1]]
+                for option, value in zip(video_args[2::2], video_args[3::2]):
+                    args += [f"{option}:{output_index}", value]
+                action = f"重新编码为 {video_args[1]}"
+                transcoding = True
+        elif kind == 'audio':
+            if codec in MP4_AUDIO_CODECS:
+                args += ['-map', f'0:{index}', f'-c:{output_index}', 'copy']
+                action = "复制"
+            else:
+                channels = stream.get('channels') or 2
+                bitrate = min(MAX_AUDIO_BITRATE, AUDIO_BITRATE_PER_CHANNEL * channels)
+                args += ['-map', f'0:{index}', f'-c:{output_index}', 'aac',
+                         f'-b:{output_index}', f'{bitrate}k']
+                action = f"重新编码为 AAC {bitrate}k"
+                transcoding = True
+        elif kind == 'subtitle':
+            if codec in TEXT_SUBTITLE_CODECS:
+                args += ['-map', f'0:{index}', f'-c:{output_index}', 'mov_text']
+                action = "复制" if codec == 'mov_text' else "转换为 mov_text"
+            else:
+                actions.append(f"#{index} 字幕 ({codec}): MP4 不支持图形字幕，丢弃")
+                continue
+        else:
+            # 附件 (字体)、数据流
+            actions.append(f"#{index} {kind_name} ({codec}): 丢弃")
+            continue
+        
+        actions.append(f"#{index} {kind_name} ({codec}): {action}")
+        output_index += 1
+    return args, actions, transcoding
+
+
+def convert_video(input_path, mode, target_speed=None, output_path=None, profile=None,
+                  burn_subtitles=None, max_bitrate=None, use_cache=False, codecs=None):
+    """转换视频
+
+    mode 5 先试编码一小段，按 target_speed（相对实时的倍数）和 max_bitrate（码率上限，
+    kbits/s，None 表示不限）自动选择编码器和预设；
+    mode 6 逐流转换: MP4 能直接容纳的流复制，其余流才重新编码；
+    output_path 为 None 时由 get_output_path 生成，'-' 表示写到标准输出；
+    profile 为 MP4 输出格式 (output_profile.PROFILES)，None 表示默认格式；
+    burn_subtitles 为烧录到画面中的字幕文件，在同一次编码中渲染，不需要单独再编码一遍；
+    use_cache 为 True 时重新编码的结果先存入转码缓存再导出，否则直接编码到输出文件；
+    codecs 为 mode 5 允许选择的软件编码器，None 表示只用 libx264
+    """
+    streaming = output_path is not None and is_stream_output(str(output_path))
+    if streaming:
+        output_path = str(output_path)
+    else:
+        output_path = Path(output_path) if output_path else get_output_path(input_path)
     
     print(f"\n开始转换...")
     print(f"输入: {input_path}")
     print(f"输出: {output_path}\n")
     
-    # 构建 ffmpeg 命令
+    duration = get_video_duration(str(input_path))
+    label = Path(input_path).name
+    
+    if burn_subtitles:
+        print(f"烧录字幕: {burn_subtitles}")
+        if mode in (1, 6):
+            print("烧录字幕需要重新编码视频，改用 CPU 编码模式")
+            mode = 2
+    
+    # 构建 ffmpeg 编码参数，只复制流时为 None
+    remux_args = ['-c', 'copy']
     if mode == 1:
         print("使用快速模式...")
-        cmd = [
-            'ffmpeg', '-i', str(input_path),
-            '-c', 'copy',
-            '-y', str(output_path)
-        ]
+        codec_args = None
     elif mode == 2:
         print("使用 CPU 编码模式 (libx264)...")
-        cmd = [
-            'ffmpeg', '-i', str(input_path),
+        codec_args = [
             '-c:v', 'libx264', '-crf', '23', '-preset', 'medium',
             '-c:a', 'aac', '-b:a', '128k',
-            '-y', str(output_path)
         ]
     elif mode == 3:
-        print("使用 AMD 显卡加速模式 (h264_amf)...")
-        cmd = [
-            'ffmpeg', '-i', str(input_path),
-            '-c:v', 'h264_amf', '-quality', 'balanced', '-rc', 'cqp', '-qp', '23',
-            '-c:a', 'aac', '-b:a', '128k',
-            '-y', str(output_path)
-        ]
+        # 没有可用的显卡编码器时回退到 libx264
+        name, video_args = hardware_video_args()
+        print(f"使用显卡加速模式 ({name})...")
+        codec_args = video_args + ['-c:a', 'aac', '-b:a', '128k']
+    elif mode == 4:
+        print("使用 CPU 分块并行编码模式 (libx264)...")
+        codec_args = VIDEO_ARGS + AUDIO_ARGS
+    elif mode == 5:
+        plan = calibrate(str(input_path), target_speed or 1.0, max_bitrate, codecs)
+        if plan is None:
+            print("无法试编码，使用 CPU 编码模式 (libx264)...")
+            codec_args = VIDEO_ARGS + AUDIO_ARGS
+        else:
+            print(f"使用自动选择的编码参数 ({plan['codec']} {plan['preset']}，{plan['threads']} 线程)...")
+            codec_args = plan['video_args'] + ['-threads', str(plan['threads'])] + AUDIO_ARGS
+    elif mode == 6:
+        print("使用逐流转换模式 (只重新编码 MP4 不支持的流)...")
+        info = probe_media(str(input_path))
+        if info is None:
+            return None
+        stream_args, actions, transcoding = plan_stream_args(info)
+        for action in actions:
+            print(f"  {action}")
+        if '-map' not in stream_args:
+            print("\n错误: 没有可以放入 MP4 的流")
+            return None
+        # 所有流都能复制时与快速模式一样只转换容器，但会保留所有音轨和字幕
+        codec_args = stream_args if transcoding else None
+        remux_args = stream_args
     else:
         print("无效模式，使用快速模式...")
-        cmd = [
-            'ffmpeg', '-i', str(input_path),
-            '-c', 'copy',
-            '-y', str(output_path)
-        ]
+        codec_args = None
     
-    # 执行转换
-    try:
-        result = subprocess.run(cmd, check=True)
-        return output_path if output_path.exists() else None
-    except subprocess.CalledProcessError as e:
-        print(f"\n错误: 转换失败 (退出码: {e.returncode})")
+    if codec_args is None:
+        # 先写入临时文件，批量转换中断时不会留下不完整的输出文件
+        write_file = partial_path(str(output_path))
+        target_args, stdout = output_target(write_file, profile)
+        cmd = ['ffmpeg', '-i', str(input_path)] + remux_args + ['-y'] + target_args
+        try:
+            run_ffmpeg(cmd, label=label, duration=duration, check=True, stdout=stdout)
+            commit_output(write_file, str(output_path))
+            return output_path
+        except subprocess.CalledProcessError as e:
+            discard_partial(write_file)
+            print(f"\n错误: 转换失败 (退出码: {e.returncode})")
+            return None
+    
+    def produce(write_file):
+        if mode == 4:
+            return chunk_encode(str(input_path), write_file, profile=profile,
+                                subtitle_file=burn_subtitles)
+        target_args, stdout = output_target(write_file, profile)
+        filter_args = ['-vf', burn_filter(burn_subtitles)] if burn_subtitles else []
+        cmd = ['ffmpeg', '-i', str(input_path)] + filter_args + codec_args + ['-y'] + target_args
+        try:
+            run_ffmpeg(cmd, label=label, duration=duration, check=True, stdout=stdout)
+            return True
+        except subprocess.CalledProcessError as e:
+            print(f"\n错误: 转换失败 (退出码: {e.returncode})")
+            return False
+    
+    if streaming:
+        return output_path if produce(output_path) else None
+    
+    if not use_cache:
+        # 直接编码到临时文件，完成后重命名为输出文件
+        write_file = partial_path(str(output_path))
+        if not produce(write_file):
+            discard_partial(write_file)
+            return None
+        commit_output(write_file, str(output_path))
+        return output_path
+    
+    # 结果存入转码缓存，相同文件用相同参数再次转换时直接复用
+    # 输出格式只影响文件内的索引位置，但缓存的文件会原样导出，所以计入缓存参数
+    params = {'args': codec_args, 'chunked': mode == 4}
+    movflags = output_args(str(output_path), profile)
+    if movflags:
+        params['movflags'] = movflags
+    if burn_subtitles:
+        # 按字幕内容区分，字幕修改后重新编码
+        params['subtitles'] = fingerprint(burn_subtitles)
+    cached_file, hit = transcode_cached(str(input_path), params, produce)
+    if cached_file is None:
         return None
+    if hit:
+        print("已有相同参数的转换结果，直接使用缓存")
+    
+    export_cached(cached_file, str(output_path))
+    evict_cache(keep=[cached_file])
+    return output_path if output_path.exists() else None
+
+
+def collect_inputs(paths, recursive=False):
+    """
+    展开命令行中的文件、文件夹和通配符
+    
+    参数:
+        paths: 文件 / 文件夹 / 通配符（Windows 命令行不会自动展开，例如 "videos/*.flv"）
+        recursive: 是否扫描子文件夹
+    
+    返回:
+        [(输入文件, 相对于扫描文件夹的子目录), ...]，子目录用于在输出文件夹中保持原有结构
+    """
+    inputs = []
+    seen = set()
+    
+    def add(video_file, relative_dir):
+        key = os.path.abspath(video_file)
+        if key not in seen and not is_partial_file(video_file):
+            seen.add(key)
+            inputs.append((video_file, relative_dir))
+    
+    for path in paths:
+        matches = glob.glob(path, recursive=True) if glob.has_magic(path) else [path]
+        if not matches:
+            print(f"警告: 没有匹配的文件: {path}")
+        for match in sorted(matches):
+            if os.path.isfile(match):
+                add(match, '')
+            elif os.path.isdir(match):
+                for root, dirs, files in os.walk(match):
+                    dirs.sort()
+                    if not recursive:
+                        dirs.clear()
+                    for filename in sorted(files):
+                        if filename.lower().endswith(VIDEO_EXTENSIONS):
+                            add(os.path.join(root, filename), os.path.relpath(root, match))
+            else:
+                print(f"警告: 路径不存在: {match}")
+    return inputs
+
+
+def choose_auto_modes(video_files, encode_mode):
+    """
+    自动模式: 视频编码已兼容 MP4 的文件逐流转换（复制视频，只重新编码不兼容的音频、
+    转换字幕），其余文件完整重新编码
+    
+    返回:
+        与 video_files 顺序一致的转换模式列表
+    """
+    modes = []
+    for info in probe_many(video_files):
+        video = get_stream(info, 'video') if info else None
+        compatible = video is not None and video.get('codec_name') in MP4_VIDEO_CODECS
+        modes.append(6 if compatible else encode_mode)
+    return modes
+
+
+def print_usage():
+    print("用法: python convert_to_mp4.py <文件/文件夹/通配符>... [选项]")
+    print("      不带参数运行时进入交互模式")
+    print("\n选项:")
+    print("  -r, --recursive       扫描子文件夹")
+    print("  --mode=copy|encode|auto")
+    print("                        copy 只转换容器 (默认); encode 重新编码;")
+    print("                        auto 视频已兼容 MP4 的文件逐流转换（只重新编码不兼容的音频、")
+    print("                        转换文本字幕），其余文件重新编码")
+    print("  --encoder=cpu|gpu|chunked|auto")
+    print("                        重新编码使用的编码器 (默认 cpu)，auto 先试编码再选择预设")
+    print("  --speed=N             --encoder=auto 的目标编码速度 (相对实时的倍数，默认 1)")
+    print("  --max-bitrate=N       --encoder=auto 的码率上限 (kbits/s)，只选择不超过该码率的预设")
+    print("  --codecs=列表         --encoder=auto 可选择的编码器，逗号分隔 (默认 libx264)，")
+    print("                        例如 libx264,libx265,libsvtav1,libvpx-vp9")
+    print("  --output-dir=文件夹   输出文件夹 (默认与输入文件相同)，扫描子文件夹时保持原有结构")
+    print(f"  --jobs=N              只转换容器的任务并发数 (默认 {DEFAULT_IO_WORKERS})")
+    print(f"  --cpu-jobs=N          重新编码的任务并发数 (默认 {DEFAULT_CPU_WORKERS}，"
+          f"gpu 为 {DEFAULT_GPU_JOBS}，chunked 为 1)")
+    print("  --profile=plain|faststart|fragmented")
+    print("                        MP4 输出格式: faststart 把索引放在文件开头，适合网页播放;")
+    print("                        fragmented 分片输出，可以边写边播")
+    print("  --output=-            只有一个输入文件时把结果写到标准输出 (分片格式)")
+    print("  --burn-subtitles[=语言|字幕文件]")
+    print("                        重新编码时把外挂字幕 (video.srt / video.zh.ass 等) 烧录到画面中，")
+    print("                        只需编码一次; 可指定语言后缀 (例如 zh)，只有一个输入文件时也可")
+    print("                        直接指定字幕文件。需要 --mode=encode 或 auto")
+    print("  --no-resume           忽略断点续传日志，重新处理所有文件")
+    print("  --cache               重新编码的结果同时存入转码缓存，再次转换相同文件时直接复用")
+    print("                        (缓存与输出不在同一磁盘时需要多写一份)")
+    print("\n示例:")
+    print("  # 把文件夹及子文件夹中的视频转换到 converted 文件夹，能直接转换容器的不重新编码")
+    print("  python convert_to_mp4.py legacy_videos -r --mode=auto --output-dir=converted")
+    print()
+    print("  # 用显卡重新编码所有 FLV 文件")
+    print("  python convert_to_mp4.py \"videos/*.flv\" --mode=encode --encoder=gpu")
+    print()
+    print("  # 转换后直接通过管道交给其他程序")
+    print("  python convert_to_mp4.py input.mkv --output=- | ffplay -")
+    print()
+    print("  # 重新编码时烧录中文字幕 (lecture.zh.srt)")
+    print("  python convert_to_mp4.py lecture.mkv --mode=encode --burn-subtitles=zh")
+
+
+def run_cli(argv):
+    """
+    命令行批量转换
+    
+    返回:
+        退出码，全部成功为 0
+    """
+    mode_name = 'copy'
+    encoder = 'cpu'
+    target_speed = 1.0
+    max_bitrate = None
+    output_dir = None
+    recursive = False
+    io_jobs = DEFAULT_IO_WORKERS
+    cpu_jobs = None
+    resume = True
+    profile = None
+    output_file = None
+    burn_spec = None
+    use_cache = False
+    codecs = None
+    paths = []
+    invalid = None
+    for arg in argv:
+        try:
+            if arg in ('-r', '--recursive'):
+                recursive = True
+            elif arg.startswith('--mode='):
+                mode_name = arg.split('=', 1)[1]
+            elif arg.startswith('--encoder='):
+                encoder = arg.split('=', 1)[1]
+            elif arg.startswith('--speed='):
+                target_speed = float(arg.split('=', 1)[1])
+            elif arg.startswith('--max-bitrate='):
+                max_bitrate = float(arg.split('=', 1)[1])
+            elif arg.startswith('--codecs='):
+                codecs = parse_codecs(arg.split('=', 1)[1])
+            elif arg.startswith('--output-dir='):
+                output_dir = arg.split('=', 1)[1]
+            elif arg.startswith('--jobs='):
+                io_jobs = int(arg.split('=', 1)[1])
+            elif arg.startswith('--cpu-jobs='):
+                cpu_jobs = int(arg.split('=', 1)[1])
+            elif arg.startswith('--profile='):
+                profile = arg.split('=', 1)[1]
+            elif arg.startswith('--output='):
+                output_file = arg.split('=', 1)[1]
+            elif arg == '--burn-subtitles':
+                burn_spec = ''
+            elif arg.startswith('--burn-subtitles='):
+                burn_spec = arg.split('=', 1)[1]
+            elif arg == '--no-resume':
+                resume = False
+            elif arg == '--cache':
+                use_cache = True
+            elif arg in ('-h', '--help'):
+                print_usage()
+                return 0
+            else:
+                paths.append(arg)
+        except ValueError:
+            invalid = invalid or f"无效的参数值: {arg}"
+    if invalid is None and (io_jobs < 1 or (cpu_jobs is not None and cpu_jobs < 1)):
+        invalid = "--jobs / --cpu-jobs 必须大于 0"
+    elif invalid is None and (target_speed <= 0 or (max_bitrate is not None and max_bitrate <= 0)):
+        invalid = "--speed / --max-bitrate 必须大于 0"
+    
+    if (invalid or not paths or mode_name not in ('copy', 'encode', 'auto')
+            or encoder not in ENCODER_MODES or (profile is not None and profile not in PROFILES)):
+        if invalid:
+            print(f"错误: {invalid}")
+        print_usage()
+        return 1
+    
+    if burn_spec is not None and mode_name == 'copy':
+        print("错误: 烧录字幕需要重新编码，请同时使用 --mode=encode 或 --mode=auto")
+        return 1
+    
+    if output_file == STDOUT_OUTPUT:
+        # 视频数据占用标准输出，提示信息改为写到标准错误
+        use_stdout_for_data()
+    
+    if not check_ffmpeg():
+        print("错误: 未找到 ffmpeg，请先安装 ffmpeg 并添加到系统 PATH")
+        return 1
+    
+    encode_mode = ENCODER_MODES[encoder]
+    if cpu_jobs is None:
+        # 分块编码的单个任务已经用满所有核心
+        cpu_jobs = {'gpu': DEFAULT_GPU_JOBS, 'chunked': 1}.get(encoder, DEFAULT_CPU_WORKERS)
+    
+    inputs = collect_inputs(paths, recursive)
+    # --burn-subtitles 的值是已存在的字幕文件时直接使用，否则作为语言后缀选择外挂字幕
+    burn_file = None
+    if burn_spec and format_of(burn_spec) and os.path.isfile(burn_spec):
+        if len(inputs) != 1:
+            print("错误: 指定字幕文件时只能转换一个输入文件")
+            return 1
+        burn_file = burn_spec
+    
+    def subtitle_for(video_file):
+        if burn_spec is None:
+            return None
+        return burn_file or pick_sidecar(video_file, burn_spec or None)
+    
+    if output_file:
+        # 指定输出文件时只转换一个文件，不使用批量任务和断点续传日志
+        if len(inputs) != 1:
+            print("错误: --output 只能用于一个输入文件")
+            return 1
+        video_file = inputs[0][0]
+        subtitle_file = subtitle_for(video_file)
+        if mode_name == 'copy':
+            mode = 1
+        elif mode_name == 'encode' or subtitle_file:
+            mode = encode_mode
+        else:
+            mode = choose_auto_modes([video_file], encode_mode)[0]
+        result = convert_video(video_file, mode, target_speed, output_file, profile,
+                               subtitle_file, max_bitrate, use_cache, codecs)
+        return 0 if result else 1
+    
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    
+    # 断点续传日志放在输出文件夹（未指定时为当前文件夹）
+    journal_file = journal_path_for(output_dir or '.')
+    journal = load_journal(journal_file) if resume else {}
+    previous_outputs = journal_outputs(journal)
+    params = {'tool': 'convert_to_mp4', 'mode': mode_name, 'encoder': encoder}
+    if encoder == 'auto':
+        params['speed'] = target_speed
+        if max_bitrate:
+            params['max_bitrate'] = max_bitrate
+        if codecs:
+            params['codecs'] = list(codecs)
+    if profile and profile != 'plain':
+        params['profile'] = profile
+    if burn_spec is not None:
+        params['burn_subtitles'] = burn_spec
+    
+    def params_for(subtitle_file):
+        # 烧录的字幕内容也影响输出，字幕修改、新增或删除后重新转换
+        if subtitle_file is None:
+            return params
+        return dict(params, subtitles=fingerprint(subtitle_file))
+    
+    pending = []
+    skipped_count = 0
+    for video_file, relative_dir in inputs:
+        if os.path.abspath(video_file) in previous_outputs:
+            continue
+        # 只转换容器时跳过已经是 MP4 的文件
+        if mode_name == 'copy' and video_file.lower().endswith('.mp4'):
+            continue
+        if is_completed(journal, input_identity(video_file, params_for(subtitle_for(video_file)))):
+            skipped_count += 1
+            continue
+        pending.append((video_file, relative_dir))
+    if skipped_count:
+        print(f"\n跳过 {skipped_count} 个已完成的文件 (使用 --no-resume 重新处理)")
+    if not pending:
+        print("没有需要转换的文件")
+        return 0
+    
+    video_files = [video_file for video_file, _ in pending]
+    if mode_name == 'copy':
+        modes = [1] * len(pending)
+    elif mode_name == 'encode':
+        modes = [encode_mode] * len(pending)
+    else:
+        modes = choose_auto_modes(video_files, encode_mode)
+        stream_count = modes.count(6)
+        print(f"\n自动模式: {stream_count} 个文件逐流转换，{len(modes) - stream_count} 个文件重新编码视频")
+    
+    subtitle_files = [subtitle_for(video_file) for video_file in video_files]
+    if burn_spec is not None:
+        # 有字幕要烧录的文件必须重新编码视频
+        modes = [encode_mode if subtitle_file else mode
+                 for mode, subtitle_file in zip(modes, subtitle_files)]
+        burn_count = len(subtitle_files) - subtitle_files.count(None)
+        print(f"\n烧录字幕: {burn_count} 个文件找到外挂字幕，"
+              f"{len(subtitle_files) - burn_count} 个文件没有字幕")
+    
+    # 预先分配所有输出路径，避免并行任务写到同一个文件
+    claimed = set()
+    jobs = []
+    for (video_file, relative_dir), mode, subtitle_file in zip(pending, modes, subtitle_files):
+        target_dir = os.path.join(output_dir, relative_dir) if output_dir else None
+        if target_dir:
+            os.makedirs(target_dir, exist_ok=True)
+        output_path = get_output_path(video_file, target_dir, claimed)
+        jobs.append(make_job(
+            os.path.basename(video_file), run_journaled,
+            (journal_file, video_file, params_for(subtitle_file), str(output_path),
+             convert_video, video_file, mode, target_speed, output_path, profile, subtitle_file,
+             max_bitrate, use_cache, codecs),
+            # 逐流转换最多重新编码音频，与只转换容器一样主要受磁盘限制
+            kind='io' if mode in (1, 6) else 'cpu', input_file=video_file))
+    
+    success_count, fail_count = run_batch(jobs, io_workers=io_jobs, cpu_workers=cpu_jobs)
+    
+    print(f"\n{'='*60}")
+    print(f"批量转换完成!")
+    print(f"成功: {success_count} 个, 失败: {fail_count} 个, 跳过: {skipped_count} 个")
+    print(f"{'='*60}")
+    return 1 if fail_count else 0
 
 
 def main():
@@ -130,14 +644,40 @@ def main():
         print("选择转换模式:")
         print("1. 快速模式 (只转换容器，不重新编码，速度快)")
         print("2. CPU 编码 (libx264，兼容性最好但速度慢)")
-        print("3. AMD 显卡加速 (h264_amf，速度快，需要 AMD 显卡)")
+        print("3. 显卡加速 (AMD/NVIDIA/Intel，速度快，没有可用显卡时自动改用 CPU 编码)")
+        print("4. CPU 分块并行编码 (libx264，长视频切块后多进程同时编码，适合多核无显卡的机器)")
+        print("5. 自动选择编码参数 (先试编码一小段，按目标速度选择压缩率最高的预设)")
+        print("6. 逐流转换 (MP4 支持的流直接复制，只重新编码不兼容的音频 / 视频，文本字幕转为 mov_text)")
         print()
         
-        mode_input = input("请选择 (1/2/3，默认1): ").strip()
-        mode = int(mode_input) if mode_input in ['1', '2', '3'] else 1
+        mode_input = input("请选择 (1/2/3/4/5/6，默认1): ").strip()
+        mode = int(mode_input) if mode_input in ['1', '2', '3', '4', '5', '6'] else 1
+        
+        target_speed = None
+        max_bitrate = None
+        if mode == 5:
+            speed_input = input("目标编码速度 (相对实时的倍数，例如 2，默认1): ").strip()
+            try:
+                target_speed = float(speed_input) if speed_input else 1.0
+            except ValueError:
+                target_speed = 1.0
+            bitrate_input = input("码率上限 (kbits/s，例如 4000，留空不限): ").strip()
+            try:
+                max_bitrate = float(bitrate_input) if bitrate_input else None
+            except ValueError:
+                max_bitrate = None
+        
+        burn_subtitles = None
+        sidecar = pick_sidecar(input_path) if mode in (2, 3, 4, 5) else None
+        if sidecar:
+            burn_input = input(f"发现外挂字幕 {os.path.basename(sidecar)}，是否烧录到画面中? "
+                               f"(y/N): ").strip().lower()
+            if burn_input == 'y':
+                burn_subtitles = sidecar
         
         # 执行转换
-        output_path = convert_video(input_path, mode)
+        output_path = convert_video(input_path, mode, target_speed, burn_subtitles=burn_subtitles,
+                                    max_bitrate=max_bitrate)
         
         # 显示结果
         print("\n" + "=" * 40)
@@ -160,6 +700,8 @@ def main():
 
 
 if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        sys.exit(run_cli(sys.argv[1:]))
     try:
         main()
     except KeyboardInterrupt:
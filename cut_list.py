@@ -0,0 +1,286 @@
+"""剪切列表读取和时间区间运算
+
+时间区间统一表示为按开始时间排序的 [(start, end), ...] 列表（单位: 秒）。
+合并、求补、裁剪等运算都只需一次排序加线性扫描，复杂度 O(n log n)，
+可以处理广告检测等流程输出的成千上万个剪切区间。
+
+支持的剪切列表文件格式:
+  - CSV:  每行 "开始,结束"，可带表头，时间可以是秒数或 HH:MM:SS
+  - JSON: [[开始, 结束], ...] 或 [{"start": .., "end": ..}, ...]，
+          也可以是 {"segments": [...]} 形式
+  - EDL:  MPlayer EDL ("开始 结束 动作"，单位秒，只读取动作 0 跳过的行，
+          静音等其他动作忽略) 或 CMX3600 EDL (使用源入点/出点时间码 HH:MM:SS:FF)
+"""
+
+import os
+import csv
+import json
+import bisect
+
+
+# CMX3600 EDL 没有标注帧率时使用的帧率；"FCM: DROP FRAME" 表示 29.97
+DEFAULT_EDL_FPS = 25.0
+DROP_FRAME_FPS = 30000 / 1001
+
+
+def parse_time(time_str):
+    """
+    解析时间字符串为秒数
+    支持格式: HH:MM:SS, MM:SS, SS
+
+    参数:
+        time_str: 时间字符串，例如 "1:30", "1:30:45"
+
+    返回:
+        秒数（浮点数）
+    """
+    parts = str(time_str).strip().split(':')
+    parts = [float(p) for p in parts]
+
+    if len(parts) == 1:  # SS
+        return parts[0]
+    elif len(parts) == 2:  # MM:SS
+        return parts[0] * 60 + parts[1]
+    elif len(parts) == 3:  # HH:MM:SS
+        return parts[0] * 3600 + parts[1] * 60 + parts[2]
+    else:
+        raise ValueError(f"无效的时间格式: {time_str}")
+
+
+def parse_timecode(timecode, fps):
+    """解析 EDL 时间码 HH:MM:SS:FF（或 HH:MM:SS;FF）为秒数"""
+    hours, minutes, seconds, frames = (int(p) for p in timecode.replace(';', ':').split(':'))
+    return hours * 3600 + minutes * 60 + seconds + frames / fps
+
+
+def merge_intervals(intervals):
+    """
+    合并重叠或相接的区间，丢弃无效区间 (start >= end)
+
+    返回:
+        按开始时间排序、互不重叠的区间列表
+    """
+    merged = []
+    for start, end in sorted(i for i in intervals if i[0] < i[1]):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def clip_intervals(intervals, lower, upper):
+    """把已合并的区间裁剪到 [lower, upper] 范围内"""
+    clipped = []
+    for start, end in intervals:
+        start = max(start, lower)
+        end = min(end, upper)
+        if start < end:
+            clipped.append((start, end))
+    return clipped
+
+
+def complement_intervals(intervals, duration):
+    """
+    求已合并区间在 [0, duration] 内的补集
+
+    参数:
+        intervals: merge_intervals 返回的区间列表
+        duration: 总时长
+
+    返回:
+        补集区间列表
+    """
+    result = []
+    current = 0.0
+    for start, end in intervals:
+        if start >= duration:
+            break
+        if current < start:
+            result.append((current, start))
+        current = max(current, end)
+    if current < duration:
+        result.append((current, duration))
+    return result
+
+
+def drop_short_intervals(intervals, min_length):
+    """
+    丢弃短于 min_length 的区间
+
+    用于保留段时，相当于把夹在两个删除段之间的极短保留段并入删除段，
+    避免产生大量几乎为空的片段和对应的 ffmpeg 调用。
+    """
+    if min_length <= 0:
+        return list(intervals)
+    return [(start, end) for start, end in intervals if end - start >= min_length]
+
+
+def compute_keep_segments(remove_segments, duration, min_keep=0.0):
+    """
+    根据要删除的时间段计算要保留的时间段
+
+    参数:
+        remove_segments: 要删除的时间段列表（可以无序、可以重叠）
+        duration: 视频总时长
+        min_keep: 短于该时长（秒）的保留段会被并入删除段
+
+    返回:
+        要保留的时间段列表
+    """
+    keep = complement_intervals(merge_intervals(remove_segments), duration)
+    return drop_short_intervals(keep, min_keep)
+
+
+def batch_keep_segments(remove_segments, durations, min_keep=0.0):
+    """
+    对大量文件一次性计算保留段（所有文件使用同一份删除列表）
+
+    删除列表只合并一次，先求出 [0, ∞) 上的补集，再对每个文件的时长二分查找截断位置，
+    总复杂度 O(n log n + m log n)，n 为删除区间数，m 为文件数。
+
+    参数:
+        remove_segments: 要删除的时间段列表
+        durations: 各文件时长列表（无法获取时长的为 None）
+        min_keep: 短于该时长（秒）的保留段会被并入删除段
+
+    返回:
+        与 durations 顺序一致的保留段列表（时长为 None 的对应 None）
+    """
+    keep_all = complement_intervals(merge_intervals(remove_segments), float('inf'))
+    starts = [start for start, _ in keep_all]
+
+    results = []
+    for duration in durations:
+        if duration is None:
+            results.append(None)
+            continue
+        # 开始时间小于 duration 的保留段都在前 count 个
+        count = bisect.bisect_left(starts, duration)
+        keep = keep_all[:count]
+        if keep and keep[-1][1] > duration:
+            keep[-1] = (keep[-1][0], duration)
+        results.append(drop_short_intervals(keep, min_keep))
+    return results
+
+
+def _load_csv(path):
+    segments = []
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        for row in csv.reader(f):
+            if len(row) < 2 or not row[0].strip() or row[0].strip().startswith('#'):
+                continue
+            try:
+                segments.append((parse_time(row[0]), parse_time(row[1])))
+            except ValueError:
+                # 表头或无法解析的行
+                continue
+    return segments
+
+
+def _load_json(path):
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = data.get('segments', [])
+
+    segments = []
+    for item in data:
+        if isinstance(item, dict):
+            segments.append((parse_time(item['start']), parse_time(item['end'])))
+        else:
+            segments.append((parse_time(item[0]), parse_time(item[1])))
+    return segments
+
+
+def _load_edl(path, fps):
+    segments = []
+    drop_frame = False
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        for line in f:
+            fields = line.split()
+            if not fields:
+                continue
+            if fields[0].upper() == 'FCM:':
+                # CMX3600 帧计数模式，丢帧时间码只用于 29.97 帧
+                drop_frame = 'NON' not in line.upper()
+                continue
+            # CMX3600: 编号 卷名 轨道 转场 源入点 源出点 录制入点 录制出点
+            timecodes = [field for field in fields if field.count(':') + field.count(';') == 3]
+            if fields[0].isdigit() and len(timecodes) >= 2:
+                edl_fps = fps or (DROP_FRAME_FPS if drop_frame else DEFAULT_EDL_FPS)
+                segments.append((parse_timecode(timecodes[0], edl_fps),
+                                 parse_timecode(timecodes[1], edl_fps)))
+                continue
+            # MPlayer EDL: 开始 结束 [动作]，动作 0 为跳过，1 为静音等，只有跳过的片段要删除
+            if len(fields) > 2 and fields[2] != '0':
+                continue
+            try:
+                segments.append((float(fields[0]), float(fields[1])))
+            except (ValueError, IndexError):
+                continue
+    return segments
+
+
+def load_cut_list(path, fps=None):
+    """
+    读取剪切列表文件
+
+    参数:
+        path: .csv / .json / .edl 文件
+        fps: CMX3600 EDL 时间码的帧率，None 表示按 FCM 标记判断
+             （DROP FRAME 为 29.97，否则为 DEFAULT_EDL_FPS）
+
+    返回:
+        要删除的时间段列表（未合并）
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.csv':
+        return _load_csv(path)
+    elif ext == '.json':
+        return _load_json(path)
+    elif ext == '.edl':
+        return _load_edl(path, fps)
+    else:
+        raise ValueError(f"不支持的剪切列表格式: {ext}")
+
+
+def format_time(seconds):
+    """把秒数格式化为 H:MM:SS.mmm，可被 parse_time 解析"""
+    millis = int(round(seconds * 1000))
+    hours, millis = divmod(millis, 3600 * 1000)
+    minutes, millis = divmod(millis, 60 * 1000)
+    return f"{hours}:{minutes:02d}:{millis / 1000:06.3f}"
+
+
+def format_segments(segments):
+    """把时间段列表格式化为 remove_segments 使用的字符串，例如 "0:01:00.000-0:02:00.000,..." """
+    return ','.join(f"{format_time(start)}-{format_time(end)}" for start, end in segments)
+
+
+def save_cut_list(path, segments):
+    """
+    把时间段列表保存为剪切列表文件，格式由扩展名决定 (.csv / .json / .edl)
+    """
+    ext = os.path.splitext(path)[1].lower()
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        if ext == '.csv':
+            writer = csv.writer(f)
+            writer.writerow(['start', 'end'])
+            for start, end in segments:
+                writer.writerow([f"{start:.3f}", f"{end:.3f}"])
+        elif ext == '.json':
+            json.dump([{'start': round(start, 3), 'end': round(end, 3)} for start, end in segments],
+                      f, indent=2)
+        elif ext == '.edl':
+            # MPlayer EDL，动作 0 表示跳过
+            for start, end in segments:
+                f.write(f"{start:.3f} {end:.3f} 0\n")
+        else:
+            raise ValueError(f"不支持的剪切列表格式: {ext}")
+
+
+def is_cut_list_file(path):
+    """判断参数是否为剪切列表文件"""
+    return os.path.isfile(path) and os.path.splitext(path)[1].lower() in ('.csv', '.json', '.edl')
@@ -0,0 +1,247 @@
+"""自动检测静音 / 黑场片段，生成 remove_segments 可用的删除列表
+
+只解码需要的部分: 静音检测只解码音频（单声道、降采样），黑场检测把画面缩小到
+很低的分辨率和帧率后再分析。长视频按时间切成多个块并行分析，结果按文件缓存，
+文件未变化时再次检测直接读缓存。
+"""
+
+import os
+import re
+import sys
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from cut_list import parse_time, merge_intervals, clip_intervals, format_segments, save_cut_list
+from ffmpeg_runner import run_ffmpeg
+from media_probe import get_video_duration, get_cached_analysis, put_cached_analysis
+
+# 每个分析块的最短时长（秒），太短时进程启动开销占比过高
+MIN_CHUNK_SECONDS = 120
+
+SILENCE_START_RE = re.compile(r'silence_start:\s*(-?[\d.]+)')
+SILENCE_END_RE = re.compile(r'silence_end:\s*(-?[\d.]+)')
+BLACK_RE = re.compile(r'black_start:\s*(-?[\d.]+)\s+black_end:\s*(-?[\d.]+)')
+DETECT_LINE_RE = re.compile(r'silence_start|silence_end|black_start')
+
+
+def split_chunks(duration, workers, overlap):
+    """
+    把 [0, duration] 切成最多 workers 个分析块，相邻块重叠 overlap 秒，
+    保证跨越块边界的片段至少在一个块中完整出现
+
+    返回:
+        [(start, length), ...]
+    """
+    count = max(1, min(workers, int(duration // MIN_CHUNK_SECONDS)))
+    size = duration / count
+    return [(i * size, min(size + overlap, duration - i * size)) for i in range(count)]
+
+
+def _analyze_chunk(video_file, start, length, filter_args):
+    """分析一个块，返回 ffmpeg 输出中检测结果所在的行"""
+    cmd = [
+        'ffmpeg', '-hide_banner', '-nostdin',
+        '-ss', f"{start:.3f}", '-t', f"{length:.3f}",
+        '-i', video_file,
+    ] + filter_args + ['-f', 'null', '-']
+    # 运行器只保留日志末尾，检测结果在读取时逐行收集
+    found = []
+
+    def collect(line):
+        if DETECT_LINE_RE.search(line):
+            found.append(line)
+
+    run_ffmpeg(cmd, label=f"分析 {start:.0f}s-{start + length:.0f}s", duration=length,
+               check=True, line_handler=collect)
+    return ''.join(found)
+
+
+def _parse_silence(stderr, chunk_start, chunk_end):
+    """解析 silencedetect 输出（时间相对块起点）"""
+    intervals = []
+    current = None
+    for line in stderr.splitlines():
+        match = SILENCE_START_RE.search(line)
+        if match:
+            current = max(0.0, float(match.group(1))) + chunk_start
+            continue
+        match = SILENCE_END_RE.search(line)
+        if match and current is not None:
+            intervals.append((current, float(match.group(1)) + chunk_start))
+            current = None
+    # 块结束时仍处于静音
+    if current is not None:
+        intervals.append((current, chunk_end))
+    return intervals
+
+
+def _parse_black(stderr, chunk_start):
+    """解析 blackdetect 输出（时间相对块起点）"""
+    return [(max(0.0, float(start)) + chunk_start, float(end) + chunk_start)
+            for start, end in BLACK_RE.findall(stderr)]
+
+
+def detect_intervals(video_file, kind, min_duration=2.0, noise='-30dB', black_threshold=0.10,
+                     workers=None, use_cache=True):
+    """
+    检测静音或黑场片段
+
+    参数:
+        video_file: 视频文件
+        kind: 'silence' 或 'black'
+        min_duration: 片段最短时长（秒）
+        noise: 静音阈值，例如 '-30dB'
+        black_threshold: 黑场像素亮度阈值 (0-1)
+        workers: 并行分析的进程数，默认为 CPU 核心数
+        use_cache: 是否使用分析结果缓存
+
+    返回:
+        合并后的片段列表 [(start, end), ...]，失败时返回 None
+    """
+    if kind == 'silence':
+        params = {'min_duration': min_duration, 'noise': noise}
+        # 只解码第一条音轨，单声道 8kHz 足够判断音量
+        filter_args = ['-vn', '-sn', '-dn', '-map', '0:a:0', '-ac', '1',
+                       '-af', f"aresample=8000,silencedetect=n={noise}:d={min_duration}"]
+    elif kind == 'black':
+        params = {'min_duration': min_duration, 'black_threshold': black_threshold}
+        # 缩小到 160 像素宽、5 fps 后再分析
+        filter_args = ['-an', '-sn', '-dn', '-map', '0:v:0',
+                       '-vf', f"fps=5,scale=160:-2,blackdetect=d={min_duration}:pix_th={black_threshold}"]
+    else:
+        raise ValueError(f"未知的检测类型: {kind}")
+
+    if use_cache:
+        cached = get_cached_analysis(video_file, kind, params)
+        if cached is not None:
+            return [tuple(i) for i in cached]
+
+    duration = get_video_duration(video_file)
+    if duration is None:
+        return None
+
+    workers = workers or os.cpu_count() or 1
+    chunks = split_chunks(duration, workers, overlap=min_duration)
+
+    try:
+        with ThreadPoolExecutor(max_workers=len(chunks)) as executor:
+            outputs = list(executor.map(
+                lambda chunk: _analyze_chunk(video_file, chunk[0], chunk[1], filter_args), chunks))
+    except subprocess.CalledProcessError as e:
+        print(f"分析失败: {e}")
+        return None
+    except FileNotFoundError:
+        print("错误: 未找到 ffmpeg，请确保已安装 ffmpeg 并添加到系统 PATH")
+        return None
+
+    intervals = []
+    for (start, length), stderr in zip(chunks, outputs):
+        if kind == 'silence':
+            intervals += _parse_silence(stderr, start, start + length)
+        else:
+            intervals += _parse_black(stderr, start)
+    intervals = clip_intervals(merge_intervals(intervals), 0.0, duration)
+
+    if use_cache:
+        put_cached_analysis(video_file, kind, params, intervals)
+    return intervals
+
+
+def detect_cuts(video_file, kinds=('silence',), min_duration=2.0, padding=0.25, **kwargs):
+    """
+    检测要删除的片段
+
+    参数:
+        video_file: 视频文件
+        kinds: 检测类型，可包含 'silence' 和 'black'，结果取并集
+        min_duration: 片段最短时长（秒）
+        padding: 每个片段两端各保留的时长（秒），避免切得太紧
+        其余参数传给 detect_intervals
+
+    返回:
+        要删除的时间段列表，失败时返回 None
+    """
+    intervals = []
+    for kind in kinds:
+        found = detect_intervals(video_file, kind, min_duration=min_duration, **kwargs)
+        if found is None:
+            return None
+        intervals += found
+
+    padded = [(start + padding, end - padding) for start, end in merge_intervals(intervals)]
+    return merge_intervals(padded)
+
+
+if __name__ == '__main__':
+    kinds = []
+    options = {}
+    output_file = None
+    args = []
+    invalid = None
+    for arg in sys.argv[1:]:
+        try:
+            if arg == '--silence':
+                kinds.append('silence')
+            elif arg == '--black':
+                kinds.append('black')
+            elif arg.startswith('--min-duration='):
+                options['min_duration'] = parse_time(arg.split('=', 1)[1])
+            elif arg.startswith('--padding='):
+                options['padding'] = parse_time(arg.split('=', 1)[1])
+            elif arg.startswith('--noise='):
+                options['noise'] = arg.split('=', 1)[1]
+            elif arg.startswith('--black-threshold='):
+                options['black_threshold'] = float(arg.split('=', 1)[1])
+            elif arg.startswith('--workers='):
+                options['workers'] = int(arg.split('=', 1)[1])
+            elif arg.startswith('--output='):
+                output_file = arg.split('=', 1)[1]
+            elif arg == '--no-cache':
+                options['use_cache'] = False
+            else:
+                args.append(arg)
+        except ValueError:
+            invalid = invalid or f"无效的参数值: {arg}"
+    if invalid is None and options.get('workers', 1) < 1:
+        invalid = "--workers 必须大于 0"
+    elif invalid is None and min(options.get('min_duration', 0), options.get('padding', 0)) < 0:
+        invalid = "--min-duration / --padding 不能为负数"
+    elif invalid is None and not 0 <= options.get('black_threshold', 0) <= 1:
+        invalid = "--black-threshold 必须在 0 到 1 之间"
+
+    if invalid or len(args) < 1:
+        if invalid:
+            print(f"错误: {invalid}")
+        print("用法: python detect_cuts.py <视频文件> [--silence] [--black] [选项]")
+        print("\n选项:")
+        print("  --silence              检测静音片段（未指定类型时默认）")
+        print("  --black                检测黑场片段")
+        print("  --min-duration=秒数    片段最短时长 (默认 2)")
+        print("  --padding=秒数         片段两端各保留的时长 (默认 0.25)")
+        print("  --noise=-30dB          静音阈值")
+        print("  --black-threshold=0.1  黑场像素亮度阈值 (0-1)")
+        print("  --workers=N            并行分析的进程数 (默认为 CPU 核心数)")
+        print("  --output=cuts.csv      保存为剪切列表文件 (.csv / .json / .edl)")
+        print("  --no-cache             不使用分析结果缓存")
+        print("\n示例:")
+        print("  # 检测静音和黑场，保存为剪切列表后删除")
+        print("  python detect_cuts.py lecture.mp4 --silence --black --output=cuts.csv")
+        print("  python remove_segments.py lecture.mp4 cuts.csv")
+        sys.exit(1)
+
+    video_file = args[0]
+    if not os.path.isfile(video_file):
+        print(f"错误: 文件 '{video_file}' 不存在")
+        sys.exit(1)
+
+    cuts = detect_cuts(video_file, tuple(kinds) or ('silence',), **options)
+    if cuts is None:
+        sys.exit(1)
+
+    total = sum(end - start for start, end in cuts)
+    print(f"检测到 {len(cuts)} 个片段，共 {total:.2f}s ({total/60:.2f}min)")
+    if output_file:
+        save_cut_list(output_file, cuts)
+        print(f"已保存剪切列表: {output_file}")
+    elif cuts:
+        print(format_segments(cuts))
@@ -0,0 +1,375 @@
+"""编码器探测和自动选择
+
+不同机器上的 ffmpeg 编译选项和硬件不同: 没有 AMD 显卡的机器无法使用 h264_amf，
+有的版本没有编译 libsvtav1。这里先查询本机 ffmpeg 实际支持的编码器（结果缓存，
+ffmpeg 程序变化后重新查询），硬件编码器再用几帧测试画面确认能否真正打开。
+
+GPU 模式依次尝试 h264_amf / h264_nvenc / h264_qsv / h264_videotoolbox，都不可用时
+回退到 libx264，不会在批量转换中途失败。
+
+自动模式从输入文件中间截取一小段试编码，按目标速度（相对实时的倍数）和码率上限
+在允许的编码器和预设中选择压缩率最高的一组，再找出仍能达到目标速度的最少线程数
+（空出的核心可以同时转换其他文件），结果按文件缓存。
+"""
+
+import os
+import re
+import json
+import time
+import shutil
+import tempfile
+import subprocess
+
+from ffmpeg_runner import run_ffmpeg
+from media_probe import CACHE_DIR, get_video_duration, get_cached_analysis, put_cached_analysis
+
+ENCODER_CACHE_FILE = os.path.join(CACHE_DIR, 'encoders.json')
+
+# 软件编码器: 固定参数，预设参数名，预设列表（从慢到快，越慢压缩率越高）
+SOFTWARE_ENCODERS = {
+    'libx264': {
+        'args': ['-crf', '23'],
+        'preset_option': '-preset',
+        'presets': ['slow', 'medium', 'fast', 'faster', 'veryfast', 'superfast', 'ultrafast'],
+        'default_preset': 'medium',
+    },
+    'libx265': {
+        'args': ['-crf', '28'],
+        'preset_option': '-preset',
+        'presets': ['slow', 'medium', 'fast', 'faster', 'veryfast', 'superfast', 'ultrafast'],
+        'default_preset': 'medium',
+    },
+    'libsvtav1': {
+        'args': ['-crf', '35'],
+        'preset_option': '-preset',
+        'presets': ['4', '6', '8', '10', '12'],
+        'default_preset': '8',
+    },
+    'libvpx-vp9': {
+        'args': ['-crf', '33', '-b:v', '0', '-row-mt', '1', '-deadline', 'good'],
+        'preset_option': '-cpu-used',
+        'presets': ['1', '2', '4', '6', '8'],
+        'default_preset': '4',
+    },
+}
+
+# 硬件 H.264 编码器，按优先顺序
+HARDWARE_ENCODERS = {
+    'h264_amf': ['-quality', 'balanced', '-rc', 'cqp', '-qp', '23'],
+    'h264_nvenc': ['-preset', 'p4', '-rc', 'constqp', '-qp', '23'],
+    'h264_qsv': ['-preset', 'medium', '-global_quality', '23'],
+    'h264_videotoolbox': ['-q:v', '60'],
+}
+
+# GPU 编码器同时支持的会话数有限，并行转换默认只开 2 个
+DEFAULT_GPU_JOBS = 2
+
+# 默认只在 H.264 中选择，输出与其它模式的文件兼容，可以直接合并
+DEFAULT_CODECS = ('libx264',)
+
+# 试编码片段时长（秒）
+CALIBRATION_SECONDS = 10
+
+# 编码器检测失败（例如显卡驱动暂时出错、NVENC 会话被占满）后，超过该时间（秒）重新检测
+USABLE_RETRY_SECONDS = 3600
+
+ENCODER_LINE_RE = re.compile(r'^\s*([VAS])[\w.]{5}\s+(\S+)')
+
+# 进程内缓存
+_encoders = None
+_usable = {}
+# 检测失败的编码器 -> 检测时间
+_failed_at = {}
+
+
+def _ffmpeg_identity():
+    """ffmpeg 程序的路径、大小和修改时间，变化后重新查询编码器"""
+    path = shutil.which('ffmpeg')
+    if path is None:
+        return None
+    stat = os.stat(path)
+    return [os.path.realpath(path), stat.st_size, stat.st_mtime_ns]
+
+
+def available_encoders():
+    """
+    本机 ffmpeg 支持的编码器
+
+    返回:
+        编码器名称集合，未找到 ffmpeg 时为空集合
+    """
+    global _encoders
+    if _encoders is not None:
+        return _encoders
+
+    identity = _ffmpeg_identity()
+    if identity is None:
+        return set()
+
+    try:
+        with open(ENCODER_CACHE_FILE, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+        if cached.get('ffmpeg') == identity:
+            _encoders = set(cached['encoders'])
+            _usable.update({name: True for name, usable in cached.get('usable', {}).items() if usable})
+            # 检测失败的结果只在一段时间内有效，之后重新检测
+            now = time.time()
+            for name, failed_at in cached.get('failed', {}).items():
+                if name not in _usable and now - failed_at < USABLE_RETRY_SECONDS:
+                    _usable[name] = False
+                    _failed_at[name] = failed_at
+            return _encoders
+    except (OSError, ValueError, KeyError):
+        pass
+
+    try:
+        result = subprocess.run(['ffmpeg', '-hide_banner', '-encoders'],
+                                capture_output=True, text=True, errors='ignore')
+    except OSError:
+        return set()
+    _encoders = set()
+    for line in result.stdout.splitlines():
+        match = ENCODER_LINE_RE.match(line)
+        # 跳过说明部分的 "V..... = Video" 一类行
+        if match and match.group(2) != '=':
+            _encoders.add(match.group(2))
+    _save_encoder_cache()
+    return _encoders
+
+
+def _save_encoder_cache():
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(ENCODER_CACHE_FILE, 'w', encoding='utf-8') as f:
+            json.dump({'ffmpeg': _ffmpeg_identity(), 'encoders': sorted(_encoders),
+                       'usable': {name: True for name, usable in _usable.items() if usable},
+                       'failed': _failed_at}, f)
+    except OSError:
+        pass
+
+
+def encoder_usable(name):
+    """
+    编码器是否真正可用: ffmpeg 支持，并且能用测试画面编码几帧
+    （例如没有对应显卡时硬件编码器虽然编译进了 ffmpeg，但打开时会失败）
+
+    检测成功的结果一直缓存到 ffmpeg 程序变化；检测失败可能只是暂时的，
+    USABLE_RETRY_SECONDS 后重新检测
+    """
+    if name not in available_encoders():
+        return False
+    expired = name in _failed_at and time.time() - _failed_at[name] >= USABLE_RETRY_SECONDS
+    if name not in _usable or expired:
+        cmd = ['ffmpeg', '-v', 'error', '-nostdin', '-f', 'lavfi',
+               '-i', 'testsrc2=size=256x144:rate=25:duration=0.2',
+               '-c:v', name] + HARDWARE_ENCODERS.get(name, []) + ['-f', 'null', '-']
+        result = run_ffmpeg(cmd, label=f"检测 {name}", show_progress=False)
+        _usable[name] = result.returncode == 0
+        if _usable[name]:
+            _failed_at.pop(name, None)
+        else:
+            _failed_at[name] = time.time()
+        _save_encoder_cache()
+    return _usable[name]
+
+
+def hardware_video_args():
+    """
+    GPU 模式的视频编码参数: 第一个可用的硬件 H.264 编码器，都不可用时回退到 libx264
+
+    返回:
+        (编码器名称, 参数列表)
+
+    每次都重新查询 encoder_usable（结果有缓存，检测失败的编码器过期后重新检测），
+    常驻进程中显卡暂时不可用后恢复时也能重新用上
+    """
+    for name, args in HARDWARE_ENCODERS.items():
+        if encoder_usable(name):
+            return name, ['-c:v', name] + args
+    print("警告: 没有可用的显卡编码器，改用 CPU 编码 (libx264)")
+    return 'libx264', software_video_args('libx264')
+
+
+def software_video_args(codec, preset=None, threads=None):
+    """软件编码器的视频编码参数"""
+    spec = SOFTWARE_ENCODERS[codec]
+    args = ['-c:v', codec] + spec['args'] + [spec['preset_option'], preset or spec['default_preset']]
+    if threads:
+        args += ['-threads', str(threads)]
+    return args
+
+
+def _measure(sample_file, sample_seconds, codec, preset, threads, temp_dir):
+    """用一组参数编码试编码片段，返回 {'speed': 相对实时倍数, 'bitrate_kbps': 码率}，失败返回 None"""
+    output = os.path.join(temp_dir, f"{codec}_{preset}.mkv")
+    cmd = (['ffmpeg', '-v', 'error', '-nostdin', '-y', '-i', sample_file]
+           + software_video_args(codec, preset, threads) + [output])
+    start = time.time()
+    result = run_ffmpeg(cmd, label=f"试编码 {codec} {preset}", show_progress=False)
+    elapsed = time.time() - start
+    if result.returncode != 0 or not os.path.exists(output):
+        return None
+    return {
+        'speed': sample_seconds / max(elapsed, 0.001),
+        'bitrate_kbps': os.path.getsize(output) * 8 / 1000 / sample_seconds,
+    }
+
+
+def _calibrate_codec(sample_file, sample_seconds, codec, target_speed, threads, temp_dir):
+    """
+    二分查找满足目标速度的最慢预设（预设越快速度越快，只需试编码 log(n) 次）
+
+    返回:
+        [(预设, 测量结果), ...]，按试编码顺序
+    """
+    presets = SOFTWARE_ENCODERS[codec]['presets']
+    low, high = 0, len(presets) - 1
+    measured = []
+    while low <= high:
+        middle = (low + high) // 2
+        stats = _measure(sample_file, sample_seconds, codec, presets[middle], threads, temp_dir)
+        if stats is None:
+            break
+        measured.append((presets[middle], stats))
+        if stats['speed'] >= target_speed:
+            high = middle - 1
+        else:
+            low = middle + 1
+    return measured
+
+
+def _calibrate_threads(sample_file, sample_seconds, codec, preset, stats, target_speed,
+                       max_bitrate_kbps, threads, temp_dir):
+    """
+    线程数减半试编码，找出仍满足目标速度和码率上限的最少线程数
+
+    返回:
+        (线程数, 测量结果)
+    """
+    best = (threads, stats)
+    candidate = threads // 2
+    while candidate >= 1:
+        measured = _measure(sample_file, sample_seconds, codec, preset, candidate, temp_dir)
+        if (measured is None or measured['speed'] < target_speed
+                or (max_bitrate_kbps is not None and measured['bitrate_kbps'] > max_bitrate_kbps)):
+            break
+        print(f"  {codec} {preset} {candidate} 线程: {measured['speed']:.2f}x")
+        best = (candidate, measured)
+        candidate //= 2
+    return best
+
+
+def parse_codecs(value):
+    """
+    解析逗号分隔的软件编码器列表，例如 "libx264,libx265"
+
+    返回:
+        编码器元组，有未知的编码器时抛出 ValueError
+    """
+    codecs = tuple(codec.strip() for codec in value.split(',') if codec.strip())
+    unknown = [codec for codec in codecs if codec not in SOFTWARE_ENCODERS]
+    if not codecs or unknown:
+        raise ValueError(f"未知的编码器: {', '.join(unknown) or value}")
+    return codecs
+
+
+def calibrate(input_file, target_speed=1.0, max_bitrate_kbps=None, codecs=DEFAULT_CODECS,
+              threads=None, use_cache=True):
+    """
+    试编码输入文件的一小段，选择满足目标速度和码率上限的编码器和预设
+
+    参数:
+        input_file: 输入文件（从中间截取 CALIBRATION_SECONDS 秒）
+        target_speed: 目标编码速度（相对实时的倍数，2 表示 1 小时的视频 30 分钟编完）
+        max_bitrate_kbps: 码率上限，None 表示不限
+        codecs: 允许的软件编码器，按优先顺序
+        threads: 每个 ffmpeg 最多使用的编码线程数（并行转换多个文件时平分核心），默认为全部核心
+        use_cache: 是否使用缓存的试编码结果
+
+    返回:
+        编码方案字典 {'codec', 'preset', 'threads', 'speed', 'bitrate_kbps', 'video_args'}，
+        threads 为满足目标速度的最少线程数，video_args 不含线程数，无法试编码时返回 None
+    """
+    threads = threads or os.cpu_count() or 1
+    codecs = codecs or DEFAULT_CODECS
+    codecs = [codec for codec in codecs if codec in SOFTWARE_ENCODERS and codec in available_encoders()]
+    if not codecs:
+        print("警告: 没有可用的软件编码器")
+        return None
+
+    params = {'target_speed': target_speed, 'max_bitrate_kbps': max_bitrate_kbps, 'codecs': codecs,
+              'threads': threads, 'ffmpeg': _ffmpeg_identity()}
+    if use_cache:
+        cached = get_cached_analysis(input_file, 'encoder', params)
+        if cached is not None:
+            return cached
+
+    duration = get_video_duration(input_file)
+    if duration is None:
+        return None
+    sample_seconds = min(CALIBRATION_SECONDS, duration)
+    sample_start = max(0.0, duration / 2 - sample_seconds / 2)
+
+    print(f"\n试编码 {sample_seconds:.0f} 秒片段，选择编码参数 (目标速度 {target_speed}x"
+          + (f"，码率上限 {max_bitrate_kbps} kbits/s" if max_bitrate_kbps else "") + ")...")
+
+    temp_dir = tempfile.mkdtemp(prefix='calibrate_')
+    try:
+        # 先把片段无损复制出来，每次试编码不用重新在大文件中定位
+        sample_file = os.path.join(temp_dir, 'sample.mkv')
+        result = run_ffmpeg(['ffmpeg', '-v', 'error', '-nostdin', '-y',
+                             '-ss', f"{sample_start:.3f}", '-t', f"{sample_seconds:.3f}",
+                             '-i', input_file, '-map', '0:v:0', '-c', 'copy', sample_file],
+                            label="截取试编码片段", show_progress=False)
+        if result.returncode != 0:
+            return None
+
+        choice = fallback = None
+        for codec in codecs:
+            measured = _calibrate_codec(sample_file, sample_seconds, codec, target_speed,
+                                        threads, temp_dir)
+            for preset, stats in measured:
+                print(f"  {codec} {preset}: {stats['speed']:.2f}x, {stats['bitrate_kbps']:.0f} kbits/s")
+            fits = [(preset, stats) for preset, stats in measured
+                    if stats['speed'] >= target_speed
+                    and (max_bitrate_kbps is None or stats['bitrate_kbps'] <= max_bitrate_kbps)]
+            if fits:
+                # 满足条件的预设中最慢（压缩率最高）的一个
+                presets = SOFTWARE_ENCODERS[codec]['presets']
+                preset, stats = min(fits, key=lambda item: presets.index(item[0]))
+                threads, stats = _calibrate_threads(sample_file, sample_seconds, codec, preset,
+                                                    stats, target_speed, max_bitrate_kbps,
+                                                    threads, temp_dir)
+                choice = (codec, preset, stats)
+                break
+            if measured and fallback is None:
+                fallback = (codec,) + max(measured, key=lambda item: item[1]['speed'])
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    if choice is None:
+        if fallback is None:
+            return None
+        # 没有满足条件的组合时使用最快的一组，有码率上限时再限制码率
+        choice = fallback
+        print("警告: 没有满足条件的编码参数，使用测得最快的一组")
+
+    codec, preset, stats = choice
+    # 线程数不写入参数，由调用方按实际并发数设置（也不影响转码缓存的键）
+    video_args = software_video_args(codec, preset)
+    if max_bitrate_kbps and stats['bitrate_kbps'] > max_bitrate_kbps:
+        video_args += ['-maxrate', f"{max_bitrate_kbps}k", '-bufsize', f"{2 * max_bitrate_kbps}k"]
+
+    plan = {
+        'codec': codec,
+        'preset': preset,
+        'threads': threads,
+        'speed': stats['speed'],
+        'bitrate_kbps': stats['bitrate_kbps'],
+        'video_args': video_args,
+    }
+    print(f"选择: {codec} {preset}，{threads} 线程 (试编码 {stats['speed']:.2f}x，"
+          f"{stats['bitrate_kbps']:.0f} kbits/s)")
+    if use_cache:
+        put_cached_analysis(input_file, 'encoder', params, plan)
+    return plan
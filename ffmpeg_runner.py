@@ -0,0 +1,490 @@
+"""ffmpeg 运行器: 实时进度和吞吐量统计
+
+所有工具通过这里启动 ffmpeg。命令中自动加入 `-progress pipe:2 -nostats`，
+后台线程逐行读取 stderr，把进度块 (frame / fps / speed / total_size / bitrate /
+out_time) 解析出来显示为实时进度，其余行作为日志保留。
+
+同时只有一个 ffmpeg 在运行时，进度显示在同一行内刷新；多个并行运行时，
+每个任务每隔几秒输出一行，互不覆盖。
+
+设置环境变量 VIDEO_TRIMMER_METRICS=文件路径 后，每个任务的进度和结束统计会以
+JSON Lines 格式追加到该文件，便于汇总不同机器、不同模式的处理速度。
+
+日志内存占用有上限: 只保留最后 STDERR_TAIL_LINES 行，另外按错误 / 警告分类统计
+（相同的消息只计数），几个小时的编码产生大量警告时也不会占满内存。被挤出末尾
+窗口的错误行单独保留几条，失败原因不会丢失。需要完整日志时设置环境变量
+VIDEO_TRIMMER_FFMPEG_LOG_DIR=目录，或调用时传入 log_file，日志边读边写到磁盘。
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import socket
+import threading
+import subprocess
+from collections import deque
+
+# 指标文件，未设置时不写
+METRICS_FILE = os.environ.get('VIDEO_TRIMMER_METRICS')
+
+# 任务标识，由调用方（例如任务服务器）通过环境变量传入，写入每条指标记录
+JOB_ID = os.environ.get('VIDEO_TRIMMER_JOB_ID')
+
+# 单任务时进度刷新间隔 / 并行时每个任务输出一行的间隔（秒）
+PROGRESS_INTERVAL = 0.5
+PARALLEL_PROGRESS_INTERVAL = 5.0
+
+# 写入指标文件的进度记录间隔（秒）
+METRICS_INTERVAL = 2.0
+
+# 完整日志保存目录，未设置时不保存
+LOG_DIR = os.environ.get('VIDEO_TRIMMER_FFMPEG_LOG_DIR')
+
+# 内存中保留的最后几行日志
+STDERR_TAIL_LINES = 200
+
+# 被挤出末尾窗口后仍保留的错误行数
+MAX_EARLY_ERROR_LINES = 20
+
+# 分类统计中每类最多记录的不同消息数，超出的只计入总数
+MAX_SUMMARY_MESSAGES = 50
+
+PROGRESS_RE = re.compile(r'^(\w+)=(.*)$')
+PROGRESS_KEYS = {
+    'frame', 'fps', 'bitrate', 'total_size', 'out_time_us', 'out_time_ms', 'out_time',
+    'dup_frames', 'drop_frames', 'speed', 'progress',
+}
+
+# 日志行分类，按顺序匹配，先匹配警告类的特例（解码错误会被隐藏，不影响结果）
+WARNING_RE = re.compile(
+    r'concealing|error while decoding|non[- ]monoton|past duration|deprecated|'
+    r'discarding|skipping|corrupt|missing picture|invalid dts|invalid pts|'
+    r'queue input is backward|timestamps are unset|warning', re.IGNORECASE)
+ERROR_RE = re.compile(
+    r'\berror\b|failed|invalid|no such file|not found|could not|cannot|unable to|'
+    r'unknown encoder|unsupported|permission denied|does not contain any stream|'
+    r'out of memory|no space left|broken pipe', re.IGNORECASE)
+
+# 去掉消息中的组件地址，例如 "[h264 @ 0x55d0c8a4c2c0]" -> "[h264]"
+ADDRESS_RE = re.compile(r' @ 0x[0-9a-fA-F]+\]')
+REPEATED_RE = re.compile(r'Last message repeated (\d+) times')
+
+_lock = threading.Lock()
+_log_counter = 0
+# 正在运行且显示进度的任务
+_active = set()
+# 正在同一行内刷新进度的任务
+_inline_job = None
+
+
+def classify_line(line):
+    """
+    判断一行 ffmpeg 日志的类别
+
+    返回:
+        'error'、'warning' 或 None（普通信息）
+    """
+    if WARNING_RE.search(line):
+        return 'warning'
+    if ERROR_RE.search(line):
+        return 'error'
+    return None
+
+
+def normalize_message(line):
+    """统一消息格式，相同的消息只计数一次"""
+    return ADDRESS_RE.sub(']', line.strip())
+
+
+def new_summary():
+    """空的分类统计: 每类的总行数和 {消息: 次数}"""
+    return {'error': {'count': 0, 'messages': {}}, 'warning': {'count': 0, 'messages': {}}}
+
+
+def add_to_summary(summary, kind, line, count=1):
+    """把一行日志计入分类统计，不同消息数超过上限时只增加总数"""
+    entry = summary[kind]
+    entry['count'] += count
+    message = normalize_message(line)
+    if message in entry['messages']:
+        entry['messages'][message] += count
+    elif len(entry['messages']) < MAX_SUMMARY_MESSAGES:
+        entry['messages'][message] = count
+
+
+def _summarize_line(summary, last, line):
+    """
+    把一行日志计入分类统计
+
+    参数:
+        last: 上一条消息的 {'kind', 'line'}，"Last message repeated N times" 计入上一条消息
+
+    返回:
+        该行的类别
+    """
+    repeated = REPEATED_RE.search(line)
+    if repeated and last.get('kind'):
+        add_to_summary(summary, last['kind'], last['line'], int(repeated.group(1)))
+        return None
+    kind = classify_line(line)
+    last['kind'], last['line'] = kind, line
+    if kind:
+        add_to_summary(summary, kind, line)
+    return kind
+
+
+def summarize_stderr(stderr):
+    """
+    从日志文本中提取错误和警告
+
+    参数:
+        stderr: ffmpeg 日志文本（run_ffmpeg 返回的 stderr）
+
+    返回:
+        分类统计，格式同 new_summary
+    """
+    summary = new_summary()
+    last = {}
+    for line in (stderr or '').splitlines():
+        if line.strip():
+            _summarize_line(summary, last, line)
+    return summary
+
+
+def format_summary(summary, kind='error', limit=5):
+    """
+    把某一类的统计格式化为显示用的行
+
+    参数:
+        summary: 分类统计
+        kind: 'error' 或 'warning'
+        limit: 最多显示的不同消息数
+
+    返回:
+        行列表，重复出现的消息后面标出次数
+    """
+    entry = summary[kind]
+    lines = []
+    for message, count in list(entry['messages'].items())[:limit]:
+        lines.append(f"{message} (x{count})" if count > 1 else message)
+    shown = sum(list(entry['messages'].values())[:limit])
+    if entry['count'] > shown:
+        lines.append(f"... 另有 {entry['count'] - shown} 条")
+    return lines
+
+
+def _open_log(job, log_file):
+    """打开完整日志文件，未请求时返回 None"""
+    global _log_counter
+    if log_file is None and LOG_DIR:
+        with _lock:
+            _log_counter += 1
+            number = _log_counter
+        name = re.sub(r'[^\w.-]+', '_', job['label'] or 'ffmpeg')[:60]
+        log_file = os.path.join(LOG_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}_{os.getpid()}_"
+                                         f"{number}_{name}.log")
+    if log_file is None:
+        return None
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(log_file)), exist_ok=True)
+        f = open(log_file, 'w', encoding='utf-8')
+    except OSError as e:
+        print(f"警告: 无法写入 ffmpeg 日志 {log_file}: {e}")
+        return None
+    f.write(' '.join(job['cmd']) + '\n\n')
+    job['log_file'] = log_file
+    return f
+
+
+def _with_progress(cmd):
+    """在 ffmpeg 命令中加入进度输出参数（进度写到 stderr，stdout 可能用于输出数据）"""
+    return [cmd[0], '-progress', 'pipe:2', '-nostats'] + list(cmd[1:])
+
+
+def _parse_number(value):
+    """解析进度值中的数字，例如 '1.52x'、'2500.1kbits/s'，无法解析时返回 None"""
+    match = re.match(r'\s*(-?[\d.]+)', value or '')
+    return float(match.group(1)) if match else None
+
+
+def _format_seconds(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+def _snapshot(job):
+    """当前进度的统计数据"""
+    progress = job['progress']
+    out_time = None
+    if _parse_number(progress.get('out_time_us')) is not None:
+        out_time = max(0.0, _parse_number(progress['out_time_us']) / 1000000)
+    stats = {
+        'frame': _parse_number(progress.get('frame')),
+        'fps': _parse_number(progress.get('fps')),
+        'speed': _parse_number(progress.get('speed')),
+        'total_size': _parse_number(progress.get('total_size')),
+        'bitrate_kbps': _parse_number(progress.get('bitrate')),
+        'out_time': out_time,
+        'elapsed': time.time() - job['start_time'],
+    }
+    if out_time is not None and job['duration']:
+        stats['percent'] = min(100.0, out_time / job['duration'] * 100)
+        if stats['speed']:
+            stats['eta'] = max(0.0, (job['duration'] - out_time) / stats['speed'])
+    return stats
+
+
+def _format_progress(job, stats):
+    parts = []
+    if 'percent' in stats:
+        parts.append(f"{stats['percent']:5.1f}%")
+    elif stats['out_time'] is not None:
+        parts.append(_format_seconds(stats['out_time']))
+    if stats['frame']:
+        parts.append(f"{int(stats['frame'])} 帧")
+    if stats['fps']:
+        parts.append(f"{stats['fps']:.1f} fps")
+    if stats['speed']:
+        parts.append(f"{stats['speed']:.2f}x")
+    if stats['total_size']:
+        parts.append(f"{stats['total_size'] / (1024 * 1024):.1f} MB")
+    if stats['bitrate_kbps']:
+        parts.append(f"{stats['bitrate_kbps']:.0f} kbits/s")
+    if 'eta' in stats:
+        parts.append(f"剩余 {_format_seconds(stats['eta'])}")
+    label = f"{job['label']} " if job['label'] else ""
+    return f"  {label}" + " | ".join(parts)
+
+
+def _write_metrics(job, event, stats, returncode=None):
+    """追加一条 JSON Lines 指标记录"""
+    if not METRICS_FILE:
+        return
+    record = {
+        'event': event,
+        'time': time.time(),
+        'host': socket.gethostname(),
+        'pid': os.getpid(),
+        'job': JOB_ID,
+        'tool': os.path.basename(sys.argv[0]) if sys.argv and sys.argv[0] else None,
+        'label': job['label'],
+        'duration': job['duration'],
+    }
+    record.update(stats)
+    if returncode is not None:
+        record['returncode'] = returncode
+    line = json.dumps(record, ensure_ascii=False) + '\n'
+    try:
+        with _lock:
+            with open(METRICS_FILE, 'a', encoding='utf-8') as f:
+                f.write(line)
+    except OSError:
+        pass
+
+
+def _report(job):
+    """每个进度块结束时调用，按间隔刷新显示和写入指标"""
+    global _inline_job
+    now = time.time()
+    stats = None
+
+    if job['show_progress']:
+        with _lock:
+            parallel = len(_active) > 1
+            interval = PARALLEL_PROGRESS_INTERVAL if parallel else PROGRESS_INTERVAL
+            if now - job['last_shown'] >= interval:
+                job['last_shown'] = now
+                stats = _snapshot(job)
+                text = _format_progress(job, stats)
+                if parallel:
+                    if _inline_job is not None:
+                        sys.stdout.write('\n')
+                        _inline_job = None
+                    sys.stdout.write(text + '\n')
+                else:
+                    _inline_job = job
+                    sys.stdout.write('\r' + text.ljust(job['last_width']))
+                    job['last_width'] = len(text)
+                sys.stdout.flush()
+
+    if METRICS_FILE and now - job['last_metrics'] >= METRICS_INTERVAL:
+        job['last_metrics'] = now
+        _write_metrics(job, 'progress', stats or _snapshot(job))
+
+
+def _read_stderr(job):
+    """后台线程: 解析进度块，其余行分类统计并保留末尾部分"""
+    tail = job['stderr_lines']
+    last = {}
+    log = job['log']
+    try:
+        for raw in job['process'].stderr:
+            line = raw.decode('utf-8', errors='ignore')
+            match = PROGRESS_RE.match(line.strip())
+            if match and (match.group(1) in PROGRESS_KEYS or match.group(1).startswith('stream_')):
+                job['progress'][match.group(1)] = match.group(2)
+                if match.group(1) == 'progress':
+                    _report(job)
+                continue
+
+            if log is not None:
+                log.write(line)
+            if job['line_handler'] is not None:
+                job['line_handler'](line)
+            if not line.strip():
+                continue
+
+            _summarize_line(job['summary'], last, line)
+
+            if len(tail) == tail.maxlen:
+                # 即将被挤出窗口的错误行单独保留
+                dropped = tail[0]
+                if (classify_line(dropped) == 'error'
+                        and len(job['early_errors']) < MAX_EARLY_ERROR_LINES):
+                    job['early_errors'].append(dropped)
+            tail.append(line)
+    finally:
+        if log is not None:
+            log.close()
+
+
+def start_ffmpeg(cmd, label=None, duration=None, stdin=None, stdout=subprocess.DEVNULL,
+                 show_progress=True, log_file=None, line_handler=None):
+    """
+    启动 ffmpeg 并开始读取进度
+
+    参数:
+        cmd: ffmpeg 命令列表
+        label: 进度显示和指标记录中的任务名称
+        duration: 输出的预期时长（秒），用于计算百分比和剩余时间
+        stdin, stdout: 传给 subprocess.Popen，stdout 可用于管道输出数据
+        show_progress: 是否在终端显示进度
+        log_file: 完整日志的保存路径，默认只在设置了 VIDEO_TRIMMER_FFMPEG_LOG_DIR 时保存
+        line_handler: 每读到一行日志（不含进度信息）时调用，用于需要完整输出的分析
+
+    返回:
+        任务字典，传给 finish_ffmpeg 等待结束
+    """
+    process = subprocess.Popen(_with_progress(cmd), stdin=stdin, stdout=stdout,
+                               stderr=subprocess.PIPE)
+    job = {
+        'cmd': cmd,
+        'process': process,
+        'label': label,
+        'duration': duration,
+        'show_progress': show_progress,
+        'progress': {},
+        'stderr_lines': deque(maxlen=STDERR_TAIL_LINES),
+        'early_errors': [],
+        'summary': new_summary(),
+        'line_handler': line_handler,
+        'log_file': None,
+        'start_time': time.time(),
+        'last_shown': 0.0,
+        'last_metrics': 0.0,
+        'last_width': 0,
+    }
+    job['log'] = _open_log(job, log_file)
+    if show_progress:
+        with _lock:
+            _active.add(id(job))
+    job['reader'] = threading.Thread(target=_read_stderr, args=(job,), daemon=True)
+    job['reader'].start()
+    return job
+
+
+def finish_ffmpeg(job, cancel_event=None, check=False):
+    """
+    等待 ffmpeg 结束
+
+    参数:
+        job: start_ffmpeg 返回的任务
+        cancel_event: threading.Event，被设置时终止 ffmpeg
+        check: 为 True 时失败抛出 subprocess.CalledProcessError，并显示错误汇总
+
+    返回:
+        subprocess.CompletedProcess，stderr 为不含进度信息的日志末尾部分（前面加上
+        被挤出末尾窗口的错误行），summary 属性为整个运行过程的错误 / 警告分类统计
+    """
+    global _inline_job
+    process = job['process']
+    try:
+        while True:
+            try:
+                process.wait(timeout=0.5)
+                break
+            except subprocess.TimeoutExpired:
+                if cancel_event is not None and cancel_event.is_set():
+                    process.terminate()
+    except BaseException:
+        process.kill()
+        process.wait()
+        raise
+    finally:
+        job['reader'].join()
+        with _lock:
+            _active.discard(id(job))
+            if _inline_job is job:
+                sys.stdout.write('\n')
+                sys.stdout.flush()
+                _inline_job = None
+
+    summary = job['summary']
+    stats = _snapshot(job)
+    stats['errors'] = summary['error']['count']
+    stats['warnings'] = summary['warning']['count']
+    if summary['error']['count']:
+        stats['error_messages'] = format_summary(summary, 'error')
+    if job['log_file']:
+        stats['log_file'] = job['log_file']
+    _write_metrics(job, 'end', stats, process.returncode)
+
+    stderr = ''.join(job['early_errors']) + ''.join(job['stderr_lines'])
+    if check and process.returncode != 0:
+        lines = format_summary(summary, 'error') or [l.rstrip() for l in list(job['stderr_lines'])[-5:]]
+        for line in lines:
+            print(f"   {line}")
+        if job['log_file']:
+            print(f"   完整日志: {job['log_file']}")
+        error = subprocess.CalledProcessError(process.returncode, job['cmd'], stderr=stderr)
+        error.summary = summary
+        raise error
+    result = subprocess.CompletedProcess(job['cmd'], process.returncode, stderr=stderr)
+    result.summary = summary
+    return result
+
+
+def run_ffmpeg(cmd, label=None, duration=None, check=False, cancel_event=None, input_data=None,
+               stdout=subprocess.DEVNULL, show_progress=True, log_file=None, line_handler=None):
+    """
+    运行 ffmpeg 并显示实时进度，用法类似 subprocess.run
+
+    参数:
+        cmd: ffmpeg 命令列表
+        label: 进度显示和指标记录中的任务名称
+        duration: 输出的预期时长（秒），用于计算百分比和剩余时间
+        check: 为 True 时失败抛出 subprocess.CalledProcessError
+        cancel_event: threading.Event，被设置时终止 ffmpeg
+        input_data: 写入 ffmpeg stdin 的文本（例如 concat 脚本）
+        stdout: ffmpeg 的标准输出（默认丢弃），可传入已打开的文件
+        show_progress: 是否在终端显示进度
+        log_file: 完整日志的保存路径
+        line_handler: 每读到一行日志时调用
+
+    返回:
+        subprocess.CompletedProcess，见 finish_ffmpeg
+    """
+    stdin = subprocess.PIPE if input_data is not None else subprocess.DEVNULL
+    job = start_ffmpeg(cmd, label, duration, stdin=stdin, stdout=stdout,
+                       show_progress=show_progress, log_file=log_file, line_handler=line_handler)
+    if input_data is not None:
+        def feed():
+            try:
+                job['process'].stdin.write(input_data.encode('utf-8'))
+                job['process'].stdin.close()
+            except OSError:
+                pass
+        threading.Thread(target=feed, daemon=True).start()
+    return finish_ffmpeg(job, cancel_event, check)
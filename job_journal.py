@@ -0,0 +1,162 @@
+"""批处理断点续传日志及原子输出
+
+日志为 JSON Lines 文件，每处理完一个输入文件追加一条记录，包含输入文件的身份
+(路径、大小、修改时间)、处理参数和校验过的输出文件。重新运行同一批任务时，
+已完成的文件直接跳过，中断时正在处理的文件会重新处理。
+
+输出先写入临时文件名，完成后再原子重命名，中途崩溃不会留下看似完整的截断文件。
+"""
+
+import os
+import json
+import threading
+
+from output_profile import is_stream_output
+
+JOURNAL_NAME = '.video_trimmer_journal.jsonl'
+
+# 未完成输出文件名的标记
+PARTIAL_MARK = '.partial'
+
+_lock = threading.Lock()
+
+
+def journal_path_for(directory):
+    """返回目录下的日志文件路径"""
+    return os.path.join(directory, JOURNAL_NAME)
+
+
+def partial_path(output_file):
+    """
+    返回输出文件对应的临时文件名（同目录、隐藏、保留扩展名以便 ffmpeg 识别格式）
+
+    例如: out/video_trimmed.mp4 -> out/.video_trimmed.partial.mp4
+    输出到标准输出或管道时直接写入，返回 output_file 本身
+    """
+    if is_stream_output(output_file):
+        return output_file
+    directory, name = os.path.split(output_file)
+    stem, ext = os.path.splitext(name)
+    return os.path.join(directory, f".{stem}{PARTIAL_MARK}{ext}")
+
+
+def is_partial_file(filename):
+    """判断文件是否为 partial_path 生成的未完成输出"""
+    name = os.path.basename(filename)
+    return name.startswith('.') and PARTIAL_MARK in name
+
+
+def commit_output(partial_file, output_file):
+    """把已写完的临时文件原子重命名为最终输出文件"""
+    if partial_file != output_file:
+        os.replace(partial_file, output_file)
+
+
+def discard_partial(partial_file):
+    """删除失败任务留下的临时文件"""
+    if partial_file and os.path.exists(partial_file) and not is_stream_output(partial_file):
+        os.remove(partial_file)
+
+
+def input_identity(input_file, params):
+    """
+    生成输入文件的身份信息
+
+    参数:
+        input_file: 输入文件
+        params: 影响输出结果的处理参数（可 JSON 序列化）
+    """
+    stat = os.stat(input_file)
+    return {
+        'input': os.path.abspath(input_file),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'params': params,
+    }
+
+
+def load_journal(journal_file):
+    """
+    读取日志
+
+    返回:
+        {输入文件绝对路径: 最后一条记录}
+    """
+    records = {}
+    if not os.path.exists(journal_file):
+        return records
+
+    with open(journal_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # 崩溃时可能只写了半行
+                continue
+            records[record['input']] = record
+    return records
+
+
+def append_record(journal_file, identity, status, output_file=None):
+    """
+    追加一条记录并立即落盘
+
+    参数:
+        status: 'started' / 'done' / 'failed'
+        output_file: status 为 'done' 时的输出文件
+    """
+    record = dict(identity, status=status)
+    if output_file is not None:
+        record['output'] = os.path.abspath(output_file)
+        record['output_size'] = os.path.getsize(output_file)
+
+    with _lock:
+        with open(journal_file, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def is_completed(journal, identity):
+    """输入文件是否已用相同参数处理完成，且输出文件仍然完好"""
+    record = journal.get(identity['input'])
+    if not record or record.get('status') != 'done':
+        return False
+    if (record.get('size') != identity['size'] or record.get('mtime_ns') != identity['mtime_ns']
+            or record.get('params') != identity['params']):
+        return False
+    output_file = record.get('output')
+    return (bool(output_file) and os.path.exists(output_file)
+            and os.path.getsize(output_file) == record.get('output_size'))
+
+
+def journal_outputs(journal):
+    """日志中记录的所有输出文件，扫描输入时用于排除上次的输出"""
+    return {record['output'] for record in journal.values() if record.get('output')}
+
+
+def run_journaled(journal_file, input_file, params, output_file, func, *args, **kwargs):
+    """
+    执行一个任务并在日志中记录开始和结果
+
+    参数:
+        journal_file: 日志文件
+        input_file: 输入文件
+        params: 影响输出结果的处理参数
+        output_file: 任务成功后应存在的输出文件
+        func: 任务函数，返回 True 表示成功
+
+    返回:
+        func 的返回值
+    """
+    identity = input_identity(input_file, params)
+    append_record(journal_file, identity, 'started')
+    success = func(*args, **kwargs)
+    if success and os.path.exists(output_file):
+        append_record(journal_file, identity, 'done', output_file)
+    else:
+        append_record(journal_file, identity, 'failed')
+    return success
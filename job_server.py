@@ -0,0 +1,750 @@
+"""本地任务服务器: 通过 HTTP/JSON 提交裁剪、删除片段、合并、转换和字幕任务
+
+常驻运行，监听本机 TCP 端口或 Unix socket。提交的任务保存在 SQLite 数据库中，
+按优先级（高的先执行）和提交顺序排队，服务器重启后未完成的任务重新排队。流复制
+任务和重编码任务分别限制并发。
+
+任务在常驻的工作进程中执行: 工作进程启动时就导入所有工具模块，之后逐个接收任务，
+在进程内直接调用工具的 run_cli，不再为每个任务启动 Python 解释器、重新导入模块；
+ffmpeg 仍由工具以子进程运行。工作进程把任务的输出写入任务日志，通过
+VIDEO_TRIMMER_METRICS 指标文件报告 ffmpeg 的实时进度。取消任务时结束整个工作进程
+（连同 ffmpeg），再按需启动新的工作进程。
+
+接口:
+    POST   /jobs              提交任务（对象或对象数组），返回任务编号
+    GET    /jobs              任务列表，可带 ?status=queued&limit=100
+    GET    /jobs/<id>         任务状态和进度
+    GET    /jobs/<id>/log     任务输出的最后部分
+    POST   /jobs/<id>/cancel  取消任务（DELETE /jobs/<id> 相同）
+    GET    /health            队列和运行中的任务数
+
+任务示例:
+    {"tool": "trim", "priority": 10,
+     "args": {"input": "D:/rec/a.mp4", "start": "1:00", "end": "32:00", "smart": true}}
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import sqlite3
+import asyncio
+import importlib
+import traceback
+import subprocess
+from collections import deque
+from urllib.parse import urlsplit, parse_qs
+
+from batch_scheduler import DEFAULT_IO_WORKERS, DEFAULT_CPU_WORKERS
+from encoders import parse_codecs
+from output_profile import PROFILES, STDOUT_OUTPUT
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+# 数据库、任务日志和指标文件所在的文件夹
+DEFAULT_STATE_DIR = os.environ.get('VIDEO_TRIMMER_SERVER_DIR') or os.path.join(
+    os.path.expanduser('~'), '.video_trimmer_server')
+
+# 请求体大小上限
+MAX_BODY_BYTES = 4 * 1024 * 1024
+
+# 取消任务时先发送中断信号，超时后强制结束
+CANCEL_GRACE_SECONDS = 10.0
+
+# /jobs/<id>/log 返回的行数
+LOG_TAIL_LINES = 200
+
+# 任务类型 -> 提供 run_cli(argv) 的工具模块
+TOOLS = {
+    'trim': 'trim_edges',
+    'remove': 'remove_segments',
+    'merge': 'merge_videos',
+    'convert': 'convert_to_mp4',
+    'subtitle': 'subtitles',
+}
+
+STATUS_TEXT = {200: 'OK', 201: 'Created', 400: 'Bad Request', 404: 'Not Found',
+               405: 'Method Not Allowed', 409: 'Conflict', 413: 'Payload Too Large',
+               500: 'Internal Server Error'}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    tool TEXT NOT NULL,
+    args TEXT NOT NULL,
+    argv TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    returncode INTEGER,
+    progress TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, kind, priority DESC, id);
+"""
+
+
+def _require(args, key):
+    value = args.get(key)
+    if value in (None, ''):
+        raise ValueError(f"缺少参数: {key}")
+    return str(value)
+
+
+def _inputs(args):
+    inputs = args.get('inputs')
+    if inputs is None:
+        return [_require(args, 'input')]
+    # 字符串会被逐个字符当作文件名
+    if not isinstance(inputs, list) or not inputs:
+        raise ValueError("inputs 必须是非空的数组")
+    return [str(path) for path in inputs]
+
+
+def _output(args):
+    output = args.get('output')
+    if output in (None, ''):
+        return None
+    if str(output) == STDOUT_OUTPUT:
+        raise ValueError("任务不能输出到标准输出，请指定输出文件")
+    return str(output)
+
+
+def _profile_flag(args):
+    profile = args.get('profile')
+    if profile is None:
+        return []
+    if profile not in PROFILES:
+        raise ValueError(f"未知的输出格式: {profile}")
+    return [f"--profile={profile}"]
+
+
+def _burn_flag(args):
+    # true 使用默认的外挂字幕，字符串为语言后缀
+    burn = args.get('burn_subtitles')
+    if not burn:
+        return []
+    if burn is True:
+        return ['--burn-subtitles']
+    return [f"--burn-subtitles={burn}"]
+
+
+def _codecs_flag(args):
+    # 编码器列表可以是数组或逗号分隔的字符串，在提交时检查
+    codecs = args.get('codecs')
+    if not codecs:
+        return []
+    if isinstance(codecs, list):
+        codecs = ','.join(str(codec) for codec in codecs)
+    return [f"--codecs={','.join(parse_codecs(codecs))}"]
+
+
+def build_command(tool, args):
+    """
+    把任务参数转换为工具的命令行
+
+    参数:
+        tool: TOOLS 中的任务类型
+        args: 任务参数字典
+
+    返回:
+        (命令行参数列表（不含解释器和脚本）, 任务类型 'io'/'cpu')
+
+    异常:
+        ValueError: 参数不正确
+    """
+    if tool not in TOOLS:
+        raise ValueError(f"未知的任务类型: {tool} (可选: {', '.join(TOOLS)})")
+    if not isinstance(args, dict):
+        raise ValueError("args 必须是对象")
+
+    if tool == 'trim':
+        argv = [_require(args, 'input'), str(args.get('start') or '0'), str(args.get('end') or '')]
+        if _output(args):
+            argv.append(_output(args))
+        smart = bool(args.get('smart'))
+        if smart:
+            argv.append('--smart')
+        if args.get('subtitles') is False:
+            argv.append('--no-subtitles')
+        return argv + _profile_flag(args), 'cpu' if smart else 'io'
+
+    if tool == 'remove':
+        argv = [_require(args, 'input'), _require(args, 'segments')]
+        if _output(args):
+            argv.append(_output(args))
+        cut_mode = args.get('cut_mode', 'copy')
+        if cut_mode == 'smart':
+            argv.append('--smart')
+        elif cut_mode == 'single_pass':
+            argv.append('--single-pass')
+        elif cut_mode != 'copy':
+            raise ValueError(f"未知的裁剪方式: {cut_mode}")
+        if args.get('min_keep'):
+            argv.append(f"--min-keep={args['min_keep']}")
+        if args.get('fps'):
+            argv.append(f"--fps={float(args['fps'])}")
+        if args.get('workers'):
+            argv.append(f"--workers={int(args['workers'])}")
+        if args.get('subtitles') is False:
+            argv.append('--no-subtitles')
+        return argv + _profile_flag(args), 'cpu' if cut_mode == 'smart' else 'io'
+
+    if tool == 'merge':
+        mode = int(args.get('mode', 1))
+        argv = [_require(args, 'directory'), f"--mode={mode}"]
+        if _output(args):
+            argv.append(f"--output={_output(args)}")
+        if args.get('jobs'):
+            argv.append(f"--jobs={int(args['jobs'])}")
+        if args.get('encoder'):
+            argv.append(f"--encoder={args['encoder']}")
+        if args.get('speed'):
+            argv.append(f"--speed={float(args['speed'])}")
+        if args.get('max_bitrate'):
+            argv.append(f"--max-bitrate={float(args['max_bitrate'])}")
+        if args.get('overwrite'):
+            argv.append('--overwrite')
+        # 快速合并、智能合并和追加只复制流
+        return (argv + _profile_flag(args) + _burn_flag(args) + _codecs_flag(args),
+                'io' if mode in (1, 5, 8) else 'cpu')
+
+    if tool == 'convert':
+        _output(args)
+        mode = args.get('mode', 'copy')
+        argv = _inputs(args) + [f"--mode={mode}", '--no-resume']
+        for key in ('encoder', 'speed', 'max_bitrate', 'output_dir', 'output'):
+            if args.get(key):
+                argv.append(f"--{key.replace('_', '-')}={args[key]}")
+        if args.get('recursive'):
+            argv.append('-r')
+        if args.get('cache'):
+            argv.append('--cache')
+        return (argv + _profile_flag(args) + _burn_flag(args) + _codecs_flag(args),
+                'io' if mode == 'copy' else 'cpu')
+
+    # subtitle
+    argv = _inputs(args) + [f"--to={args.get('to', 'ass')}"]
+    if args.get('output_dir'):
+        argv.append(f"--output-dir={args['output_dir']}")
+    return argv, 'io'
+
+
+def open_database(state_dir):
+    """打开任务数据库，上次中断时正在运行的任务重新排队"""
+    os.makedirs(os.path.join(state_dir, 'logs'), exist_ok=True)
+    db = sqlite3.connect(os.path.join(state_dir, 'jobs.db'), isolation_level=None)
+    db.row_factory = sqlite3.Row
+    db.execute('PRAGMA journal_mode=WAL')
+    db.executescript(SCHEMA)
+    requeued = db.execute("UPDATE jobs SET status='queued', started=NULL WHERE status='running'").rowcount
+    if requeued:
+        print(f"重新排队 {requeued} 个上次未完成的任务")
+    return db
+
+
+def new_server(state_dir, io_workers=DEFAULT_IO_WORKERS, cpu_workers=DEFAULT_CPU_WORKERS):
+    """创建服务器状态"""
+    return {
+        'state_dir': state_dir,
+        'db': open_database(state_dir),
+        'limits': {'io': max(1, io_workers), 'cpu': max(1, cpu_workers)},
+        # 运行中的任务: id -> {'process', 'kind', 'metrics_file', 'offset', 'steps', 'current', 'cancelled'}
+        # process 为执行该任务的工作进程
+        'running': {},
+        # 空闲的工作进程
+        'idle_workers': [],
+        'wake': asyncio.Event(),
+    }
+
+
+def _log_file(server, job_id):
+    return os.path.join(server['state_dir'], 'logs', f"{job_id}.log")
+
+
+def _metrics_file(server, job_id):
+    return os.path.join(server['state_dir'], 'logs', f"{job_id}.metrics.jsonl")
+
+
+def submit_jobs(server, specs):
+    """
+    提交一批任务，全部检查通过后在同一个事务中写入
+
+    参数:
+        specs: [{'tool': ..., 'args': {...}, 'priority': 整数}, ...]
+
+    返回:
+        任务编号列表
+
+    异常:
+        ValueError: 任一任务的参数不正确（此时不提交任何任务）
+    """
+    rows = []
+    now = time.time()
+    for spec in specs:
+        if not isinstance(spec, dict):
+            raise ValueError("任务必须是对象")
+        tool = spec.get('tool')
+        args = spec.get('args') or {}
+        argv, kind = build_command(tool, args)
+        rows.append((tool, json.dumps(args, ensure_ascii=False), json.dumps(argv, ensure_ascii=False),
+                     kind, int(spec.get('priority', 0)), now))
+
+    db = server['db']
+    ids = []
+    db.execute('BEGIN')
+    try:
+        for row in rows:
+            ids.append(db.execute(
+                "INSERT INTO jobs (tool, args, argv, kind, priority, status, created) "
+                "VALUES (?, ?, ?, ?, ?, 'queued', ?)", row).lastrowid)
+        db.execute('COMMIT')
+    except sqlite3.Error:
+        db.execute('ROLLBACK')
+        raise
+    server['wake'].set()
+    return ids
+
+
+def read_progress(server, job_id):
+    """读取运行中任务新写入的指标记录，返回当前进度"""
+    state = server['running'].get(job_id)
+    if state is None:
+        return None
+    try:
+        with open(state['metrics_file'], 'r', encoding='utf-8') as f:
+            f.seek(state['offset'])
+            for line in f:
+                if not line.endswith('\n'):
+                    # 写了一半的行下次再读
+                    break
+                state['offset'] += len(line.encode('utf-8'))
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get('event') == 'end':
+                    state['steps'] += 1
+                    state['current'] = None
+                elif record.get('event') == 'progress':
+                    state['current'] = record
+    except OSError:
+        pass
+
+    progress = {'steps_done': state['steps']}
+    current = state['current']
+    if current:
+        for key in ('label', 'percent', 'speed', 'eta', 'out_time', 'duration', 'fps'):
+            if current.get(key) is not None:
+                progress[key] = current[key]
+    return progress
+
+
+def job_record(server, row):
+    """数据库中的一行转换为接口返回的字典"""
+    job = {key: row[key] for key in ('id', 'tool', 'kind', 'priority', 'status', 'created',
+                                     'started', 'finished', 'returncode')}
+    job['args'] = json.loads(row['args'])
+    if row['status'] == 'running':
+        job['progress'] = read_progress(server, row['id'])
+    elif row['progress']:
+        job['progress'] = json.loads(row['progress'])
+    return job
+
+
+def get_job(server, job_id):
+    row = server['db'].execute("SELECT * FROM jobs WHERE id=?", (job_id,)).fetchone()
+    return job_record(server, row) if row else None
+
+
+def list_jobs(server, status=None, limit=100):
+    if status:
+        rows = server['db'].execute(
+            "SELECT * FROM jobs WHERE status=? ORDER BY priority DESC, id LIMIT ?", (status, limit))
+    else:
+        rows = server['db'].execute("SELECT * FROM jobs ORDER BY id DESC LIMIT ?", (limit,))
+    return [job_record(server, row) for row in rows.fetchall()]
+
+
+def _terminate(process, force=False):
+    """结束任务进程及其启动的 ffmpeg"""
+    if process is None or process.returncode is not None:
+        return
+    try:
+        if os.name == 'nt':
+            # taskkill /T 同时结束子进程
+            subprocess.run(['taskkill', '/T', '/F', '/PID', str(process.pid)],
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        else:
+            # 先发送中断信号，工具和 ffmpeg 可以删除临时文件后退出
+            os.killpg(process.pid, signal.SIGKILL if force else signal.SIGINT)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+async def cancel_job(server, job_id):
+    """
+    取消任务
+
+    返回:
+        取消后的状态，任务不存在时返回 None
+    """
+    row = server['db'].execute("SELECT status FROM jobs WHERE id=?", (job_id,)).fetchone()
+    if row is None:
+        return None
+    if row['status'] == 'queued':
+        server['db'].execute("UPDATE jobs SET status='cancelled', finished=? WHERE id=? AND status='queued'",
+                             (time.time(), job_id))
+        return 'cancelled'
+    state = server['running'].get(job_id)
+    if row['status'] != 'running' or state is None:
+        return row['status']
+
+    state['cancelled'] = True
+    _terminate(state['process'])
+
+    async def force_kill():
+        await asyncio.sleep(CANCEL_GRACE_SECONDS)
+        _terminate(state['process'], force=True)
+
+    asyncio.ensure_future(force_kill())
+    return 'cancelling'
+
+
+async def start_worker():
+    """启动一个工作进程（独立的进程组，取消任务时连同它启动的 ffmpeg 一起结束）"""
+    options = {}
+    if os.name == 'nt':
+        options['creationflags'] = subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        options['start_new_session'] = True
+    env = dict(os.environ, PYTHONIOENCODING='utf-8', PYTHONUNBUFFERED='1')
+    return await asyncio.create_subprocess_exec(
+        sys.executable, os.path.abspath(__file__), '--worker',
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, env=env, **options)
+
+
+async def _retire_worker(process):
+    _terminate(process, force=True)
+    await process.wait()
+
+
+async def run_job(server, row, state):
+    """在空闲的工作进程中运行一个任务，结束后记录结果"""
+    job_id = row['id']
+    returncode = None
+    process = None
+    try:
+        if os.path.exists(state['metrics_file']):
+            os.remove(state['metrics_file'])
+        idle = server['idle_workers']
+        while idle and idle[-1].returncode is not None:
+            # 意外退出的空闲工作进程
+            idle.pop()
+        process = idle.pop() if idle else await start_worker()
+        if state['cancelled']:
+            # 启动工作进程期间收到取消请求，工作进程留给下一个任务
+            idle.append(process)
+            process = None
+        else:
+            state['process'] = process
+            request = {'tool': row['tool'], 'argv': json.loads(row['argv']), 'id': job_id,
+                       'log_file': _log_file(server, job_id), 'metrics_file': state['metrics_file']}
+            process.stdin.write(json.dumps(request, ensure_ascii=False).encode('utf-8') + b'\n')
+            await process.stdin.drain()
+            reply = await process.stdout.readline()
+            if reply:
+                returncode = json.loads(reply)['returncode']
+            else:
+                # 工作进程被取消时结束，或者异常退出
+                returncode = await process.wait()
+    except asyncio.CancelledError:
+        # 服务器停止: 结束工作进程，任务保持 running 状态，下次启动时重新排队
+        _terminate(process)
+        del server['running'][job_id]
+        raise
+    except (OSError, ValueError) as e:
+        print(f"任务 {job_id} 无法执行: {e}")
+
+    if process is not None:
+        if state['cancelled'] or returncode is None or process.returncode is not None:
+            # 被中断的任务可能留下未结束的线程和 ffmpeg，不再复用这个工作进程
+            await _retire_worker(process)
+        else:
+            server['idle_workers'].append(process)
+
+    progress = read_progress(server, job_id)
+    if state['cancelled']:
+        status = 'cancelled'
+    else:
+        status = 'done' if returncode == 0 else 'failed'
+    server['db'].execute(
+        "UPDATE jobs SET status=?, finished=?, returncode=?, progress=? WHERE id=?",
+        (status, time.time(), returncode, json.dumps(progress, ensure_ascii=False), job_id))
+    del server['running'][job_id]
+    server['wake'].set()
+    print(f"[{time.strftime('%H:%M:%S')}] 任务 {job_id} ({row['tool']}) {status}")
+
+
+def worker_main():
+    """
+    工作进程: 启动时导入所有工具，之后从标准输入逐行读取任务，在本进程中调用工具的
+    run_cli，每个任务的返回码写一行 JSON 到标准输出
+
+    文件描述符 0/1/2 在任务期间指向空设备和任务日志，工具的提示信息和 ffmpeg 的
+    输出都写入日志；控制通道使用原来的标准输入输出的副本。
+    """
+    import ffmpeg_runner
+    modules = {tool: importlib.import_module(name) for tool, name in TOOLS.items()}
+    # 服务器在后台启动时可能继承了忽略 SIGINT 的设置，取消任务依赖中断信号
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+
+    requests = os.fdopen(os.dup(0), 'r', encoding='utf-8')
+    replies = os.fdopen(os.dup(1), 'w', encoding='utf-8')
+    idle_output = os.dup(2)
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    # 工具不能从控制通道读取输入
+    os.dup2(devnull, 0)
+    os.dup2(idle_output, 1)
+
+    for line in requests:
+        job = json.loads(line)
+        # 指标文件和任务编号在 ffmpeg_runner 导入时读取，每个任务重新设置
+        os.environ['VIDEO_TRIMMER_METRICS'] = job['metrics_file']
+        os.environ['VIDEO_TRIMMER_JOB_ID'] = str(job['id'])
+        ffmpeg_runner.METRICS_FILE = job['metrics_file']
+        ffmpeg_runner.JOB_ID = str(job['id'])
+
+        log_fd = os.open(job['log_file'], os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        os.dup2(log_fd, 1)
+        os.dup2(log_fd, 2)
+        os.close(log_fd)
+        try:
+            returncode = modules[job['tool']].run_cli(job['argv'])
+        except SystemExit as e:
+            returncode = e.code if isinstance(e.code, int) else int(e.code is not None)
+        except KeyboardInterrupt:
+            returncode = 130
+        except Exception:
+            traceback.print_exc()
+            returncode = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os.dup2(idle_output, 1)
+            os.dup2(idle_output, 2)
+
+        replies.write(json.dumps({'returncode': returncode or 0}) + '\n')
+        replies.flush()
+
+
+async def dispatcher(server):
+    """按优先级从队列中取出任务，各类型不超过并发上限"""
+    db = server['db']
+    while True:
+        server['wake'].clear()
+        for kind, limit in server['limits'].items():
+            while sum(1 for state in server['running'].values() if state['kind'] == kind) < limit:
+                row = db.execute("SELECT * FROM jobs WHERE status='queued' AND kind=? "
+                                 "ORDER BY priority DESC, id LIMIT 1", (kind,)).fetchone()
+                if row is None:
+                    break
+                db.execute("UPDATE jobs SET status='running', started=? WHERE id=?",
+                           (time.time(), row['id']))
+                # 先占用并发名额，任务协程开始运行前不会重复取出
+                state = {'process': None, 'kind': kind, 'metrics_file': _metrics_file(server, row['id']),
+                         'offset': 0, 'steps': 0, 'current': None, 'cancelled': False}
+                server['running'][row['id']] = state
+                asyncio.ensure_future(run_job(server, row, state))
+        await server['wake'].wait()
+
+
+def _tail_log(server, job_id, lines=LOG_TAIL_LINES):
+    try:
+        with open(_log_file(server, job_id), 'r', encoding='utf-8', errors='replace') as f:
+            # 进度显示用 \r 刷新同一行，只保留最后一次刷新
+            return ''.join(line.rsplit('\r', 1)[-1] for line in deque(f, maxlen=lines))
+    except OSError:
+        return ''
+
+
+async def handle_request(server, method, path, query, body):
+    """
+    处理一个 API 请求
+
+    返回:
+        (状态码, 返回的对象)
+    """
+    parts = [part for part in path.split('/') if part]
+
+    if parts == ['health']:
+        counts = dict(server['db'].execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        running = {kind: sum(1 for state in server['running'].values() if state['kind'] == kind)
+                   for kind in server['limits']}
+        return 200, {'jobs': counts, 'running': running, 'limits': server['limits']}
+
+    if parts == ['jobs']:
+        if method == 'GET':
+            limit = int(query.get('limit', ['100'])[0])
+            return 200, {'jobs': list_jobs(server, query.get('status', [None])[0], limit)}
+        if method != 'POST':
+            return 405, {'error': "只支持 GET / POST"}
+        try:
+            spec = json.loads(body.decode('utf-8'))
+        except ValueError:
+            return 400, {'error': "请求体不是有效的 JSON"}
+        try:
+            ids = submit_jobs(server, spec if isinstance(spec, list) else [spec])
+        except (ValueError, TypeError) as e:
+            return 400, {'error': str(e)}
+        return 201, {'ids': ids} if isinstance(spec, list) else {'id': ids[0]}
+
+    if len(parts) >= 2 and parts[0] == 'jobs' and parts[1].isdigit():
+        job_id = int(parts[1])
+        if len(parts) == 2 and method == 'GET':
+            job = get_job(server, job_id)
+            return (200, job) if job else (404, {'error': "任务不存在"})
+        if (len(parts) == 2 and method == 'DELETE') or (parts[2:] == ['cancel'] and method == 'POST'):
+            status = await cancel_job(server, job_id)
+            if status is None:
+                return 404, {'error': "任务不存在"}
+            if status not in ('cancelled', 'cancelling'):
+                return 409, {'error': f"任务已结束 ({status})"}
+            return 200, {'id': job_id, 'status': status}
+        if parts[2:] == ['log'] and method == 'GET':
+            if get_job(server, job_id) is None:
+                return 404, {'error': "任务不存在"}
+            return 200, {'id': job_id, 'log': _tail_log(server, job_id)}
+
+    return 404, {'error': "接口不存在"}
+
+
+async def handle_connection(server, reader, writer):
+    """HTTP/1.1 连接，支持 keep-alive 连续提交"""
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line.strip():
+                break
+            try:
+                method, target, _ = request_line.decode('latin-1').split(None, 2)
+            except ValueError:
+                break
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if not line or line in (b'\r\n', b'\n'):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+
+            length = int(headers.get('content-length') or 0)
+            if length > MAX_BODY_BYTES:
+                status, result = 413, {'error': "请求体过大"}
+                keep_alive = False
+            else:
+                body = await reader.readexactly(length) if length else b''
+                url = urlsplit(target)
+                try:
+                    status, result = await handle_request(server, method.upper(), url.path,
+                                                          parse_qs(url.query), body)
+                except Exception as e:
+                    status, result = 500, {'error': str(e)}
+                keep_alive = headers.get('connection', '').lower() != 'close'
+
+            data = json.dumps(result, ensure_ascii=False).encode('utf-8')
+            writer.write(
+                f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+                f"Content-Type: application/json; charset=utf-8\r\n"
+                f"Content-Length: {len(data)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1') + data)
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(server, host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None):
+    """启动 HTTP 服务和任务调度，直到进程结束"""
+    def on_connect(reader, writer):
+        return handle_connection(server, reader, writer)
+
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        listener = await asyncio.start_unix_server(on_connect, path=socket_path)
+        print(f"任务服务器已启动: unix:{socket_path}")
+    else:
+        listener = await asyncio.start_server(on_connect, host, port)
+        print(f"任务服务器已启动: http://{host}:{port}")
+    print(f"状态文件夹: {server['state_dir']}")
+    print(f"并发上限: 流复制 {server['limits']['io']} 个, 重编码 {server['limits']['cpu']} 个")
+
+    # 预先启动工作进程，第一个任务也不用等待导入
+    for _ in range(sum(server['limits'].values())):
+        server['idle_workers'].append(await start_worker())
+
+    async with listener:
+        await asyncio.gather(listener.serve_forever(), dispatcher(server))
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ['--worker']:
+        try:
+            worker_main()
+        except KeyboardInterrupt:
+            # 空闲时收到取消任务的中断信号
+            sys.exit(130)
+        sys.exit(0)
+
+    host = DEFAULT_HOST
+    port = DEFAULT_PORT
+    socket_path = None
+    state_dir = DEFAULT_STATE_DIR
+    io_jobs = DEFAULT_IO_WORKERS
+    cpu_jobs = DEFAULT_CPU_WORKERS
+    for arg in sys.argv[1:]:
+        if arg.startswith('--host='):
+            host = arg.split('=', 1)[1]
+        elif arg.startswith('--port='):
+            port = int(arg.split('=', 1)[1])
+        elif arg.startswith('--socket='):
+            socket_path = arg.split('=', 1)[1]
+        elif arg.startswith('--state-dir='):
+            state_dir = arg.split('=', 1)[1]
+        elif arg.startswith('--jobs='):
+            io_jobs = int(arg.split('=', 1)[1])
+        elif arg.startswith('--cpu-jobs='):
+            cpu_jobs = int(arg.split('=', 1)[1])
+        else:
+            print("用法: python job_server.py [选项]")
+            print("\n选项:")
+            print(f"  --host=地址        监听地址 (默认 {DEFAULT_HOST})")
+            print(f"  --port=端口        监听端口 (默认 {DEFAULT_PORT})")
+            print("  --socket=路径      改为监听 Unix socket")
+            print("  --state-dir=文件夹 任务数据库和日志的位置 (默认 ~/.video_trimmer_server)")
+            print(f"  --jobs=N           流复制任务的并发数 (默认 {DEFAULT_IO_WORKERS})")
+            print(f"  --cpu-jobs=N       重编码任务的并发数 (默认 {DEFAULT_CPU_WORKERS})")
+            print("\n示例:")
+            print("  curl -X POST http://127.0.0.1:8765/jobs -d "
+                  "'{\"tool\": \"trim\", \"args\": {\"input\": \"a.mp4\", \"start\": \"1:00\"}}'")
+            sys.exit(1)
+
+    if socket_path and not hasattr(asyncio, 'start_unix_server'):
+        print("错误: 当前系统不支持 Unix socket")
+        sys.exit(1)
+
+    async def main():
+        await serve(new_server(state_dir, io_jobs, cpu_jobs), host, port, socket_path)
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("\n服务器已停止，未完成的任务会在下次启动时继续")
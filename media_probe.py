@@ -0,0 +1,285 @@
+"""媒体信息探测 (ffprobe) 及持久化缓存
+
+所有工具共用的 ffprobe 封装。一次调用以 JSON 格式取得容器、流、编码和时间基信息，
+需要时再读取关键帧索引。结果保存在 SQLite 缓存中，以 路径 + 文件大小 + 修改时间
+作为键，文件未变化时直接读缓存，不再启动 ffprobe 进程。
+
+同一缓存也用于保存静音/黑场检测等耗时的分析结果 (get_cached_analysis /
+put_cached_analysis)。
+"""
+
+import os
+import json
+import time
+import sqlite3
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+# 缓存目录，可用环境变量 VIDEO_TRIMMER_CACHE_DIR 修改
+CACHE_DIR = os.environ.get('VIDEO_TRIMMER_CACHE_DIR') or os.path.join(
+    os.path.expanduser('~'), '.cache', 'video-trimmer')
+PROBE_CACHE_FILE = os.path.join(CACHE_DIR, 'probe_cache.sqlite')
+
+# 缓存数据总大小上限（字节），超出后按最近使用时间淘汰
+MAX_CACHE_BYTES = 256 * 1024 * 1024
+
+
+def _file_identity(video_file):
+    """返回 (绝对路径, 文件大小, 修改时间 ns)"""
+    stat = os.stat(video_file)
+    return os.path.abspath(video_file), stat.st_size, stat.st_mtime_ns
+
+
+def _open_cache():
+    """打开（必要时创建）缓存数据库"""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    conn = sqlite3.connect(PROBE_CACHE_FILE, timeout=30)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS probe ('
+        ' path TEXT PRIMARY KEY,'
+        ' size INTEGER NOT NULL,'
+        ' mtime_ns INTEGER NOT NULL,'
+        ' has_keyframes INTEGER NOT NULL,'
+        ' data TEXT NOT NULL,'
+        ' data_size INTEGER NOT NULL,'
+        ' last_used REAL NOT NULL)'
+    )
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS analysis ('
+        ' path TEXT NOT NULL,'
+        ' kind TEXT NOT NULL,'
+        ' params TEXT NOT NULL,'
+        ' size INTEGER NOT NULL,'
+        ' mtime_ns INTEGER NOT NULL,'
+        ' data TEXT NOT NULL,'
+        ' data_size INTEGER NOT NULL,'
+        ' last_used REAL NOT NULL,'
+        ' PRIMARY KEY (path, kind, params))'
+    )
+    return conn
+
+
+def _cache_get(identity, keyframes):
+    """读取缓存，文件已变化或缺少关键帧索引时返回 None"""
+    path, size, mtime_ns = identity
+    try:
+        conn = _open_cache()
+        try:
+            row = conn.execute(
+                'SELECT size, mtime_ns, has_keyframes, data FROM probe WHERE path = ?',
+                (path,)).fetchone()
+            if row is None or row[0] != size or row[1] != mtime_ns:
+                return None
+            if keyframes and not row[2]:
+                return None
+            with conn:
+                conn.execute('UPDATE probe SET last_used = ? WHERE path = ?',
+                             (time.time(), path))
+            return json.loads(row[3])
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return None
+
+
+def _cache_put(identity, info):
+    """写入缓存，并在超出大小上限时淘汰最久未使用的记录"""
+    path, size, mtime_ns = identity
+    data = json.dumps(info, separators=(',', ':'))
+    try:
+        conn = _open_cache()
+        try:
+            with conn:
+                conn.execute(
+                    'INSERT OR REPLACE INTO probe VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (path, size, mtime_ns, int('keyframes' in info), data, len(data),
+                     time.time()))
+                _evict_cache(conn, 'probe')
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        print(f"警告: 写入探测缓存失败: {e}")
+
+
+def _evict_cache(conn, table):
+    """表中数据超出大小上限时，按最近使用时间淘汰记录，直到降到上限的 3/4"""
+    total = conn.execute(f'SELECT COALESCE(SUM(data_size), 0) FROM {table}').fetchone()[0]
+    if total <= MAX_CACHE_BYTES:
+        return
+
+    bytes_to_free = total - MAX_CACHE_BYTES * 3 // 4
+    freed = 0
+    rows = conn.execute(f'SELECT rowid, data_size FROM {table} ORDER BY last_used').fetchall()
+    for rowid, data_size in rows:
+        if freed >= bytes_to_free:
+            break
+        conn.execute(f'DELETE FROM {table} WHERE rowid = ?', (rowid,))
+        freed += data_size
+
+
+def get_cached_analysis(video_file, kind, params):
+    """
+    读取缓存的分析结果
+
+    参数:
+        video_file: 媒体文件路径
+        kind: 分析类型，例如 'silence'
+        params: 分析参数（可 JSON 序列化），参数不同的结果分别缓存
+
+    返回:
+        缓存的结果，文件已变化或没有缓存时返回 None
+    """
+    try:
+        path, size, mtime_ns = _file_identity(video_file)
+        conn = _open_cache()
+        try:
+            key = json.dumps(params, sort_keys=True)
+            row = conn.execute(
+                'SELECT size, mtime_ns, data FROM analysis WHERE path = ? AND kind = ? AND params = ?',
+                (path, kind, key)).fetchone()
+            if row is None or row[0] != size or row[1] != mtime_ns:
+                return None
+            with conn:
+                conn.execute(
+                    'UPDATE analysis SET last_used = ? WHERE path = ? AND kind = ? AND params = ?',
+                    (time.time(), path, kind, key))
+            return json.loads(row[2])
+        finally:
+            conn.close()
+    except (OSError, sqlite3.Error):
+        return None
+
+
+def put_cached_analysis(video_file, kind, params, result):
+    """保存分析结果到缓存，参数含义同 get_cached_analysis"""
+    try:
+        path, size, mtime_ns = _file_identity(video_file)
+        data = json.dumps(result, separators=(',', ':'))
+        conn = _open_cache()
+        try:
+            with conn:
+                conn.execute(
+                    'INSERT OR REPLACE INTO analysis VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    (path, kind, json.dumps(params, sort_keys=True), size, mtime_ns, data,
+                     len(data), time.time()))
+                _evict_cache(conn, 'analysis')
+        finally:
+            conn.close()
+    except (OSError, sqlite3.Error) as e:
+        print(f"警告: 写入分析缓存失败: {e}")
+
+
+def _run_ffprobe(video_file):
+    """一次 ffprobe 调用取得容器和所有流的信息"""
+    cmd = [
+        'ffprobe', '-v', 'error',
+        '-show_format', '-show_streams',
+        '-of', 'json',
+        video_file
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True, encoding='utf-8',
+                            errors='ignore', check=True)
+    data = json.loads(result.stdout)
+    return {'format': data.get('format', {}), 'streams': data.get('streams', [])}
+
+
+def _read_keyframes(video_file, start_time):
+    """读取第一条视频流的关键帧时间（只解析数据包，不解码）"""
+    cmd = [
+        'ffprobe', '-v', 'error',
+        '-select_streams', 'v:0',
+        '-show_entries', 'packet=pts_time,flags',
+        '-of', 'csv=p=0',
+        video_file
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+
+    keyframes = []
+    for line in result.stdout.splitlines():
+        parts = line.strip().split(',')
+        if len(parts) < 2 or 'K' not in parts[1]:
+            continue
+        try:
+            keyframes.append(float(parts[0]) - start_time)
+        except ValueError:
+            continue
+
+    keyframes.sort()
+    return keyframes
+
+
+def probe_media(video_file, keyframes=False, use_cache=True):
+    """
+    探测媒体文件信息（带缓存）
+
+    参数:
+        video_file: 媒体文件路径
+        keyframes: 是否同时读取关键帧索引
+        use_cache: 是否使用持久化缓存
+
+    返回:
+        字典 {'format': {...}, 'streams': [...], 'keyframes': [...]}，
+        keyframes 为相对文件起始时间的秒数（与 -ss 一致），失败时返回 None
+    """
+    try:
+        identity = _file_identity(video_file)
+    except OSError as e:
+        print(f"探测媒体信息失败: {e}")
+        return None
+
+    if use_cache:
+        info = _cache_get(identity, keyframes)
+        if info is not None:
+            return info
+
+    try:
+        info = _run_ffprobe(video_file)
+        if keyframes:
+            start_time = float(info['format'].get('start_time') or 0)
+            info['keyframes'] = _read_keyframes(video_file, start_time)
+    except Exception as e:
+        print(f"探测媒体信息失败: {e}")
+        return None
+
+    if use_cache:
+        _cache_put(identity, info)
+    return info
+
+
+def probe_many(video_files, keyframes=False, workers=8):
+    """
+    并行探测多个文件
+
+    返回:
+        与 video_files 顺序一致的探测结果列表（失败的为 None）
+    """
+    if not video_files:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(video_files)))) as executor:
+        return list(executor.map(lambda f: probe_media(f, keyframes), video_files))
+
+
+def get_stream(info, codec_type):
+    """返回指定类型 ('video'/'audio'/'subtitle') 的第一条流，没有则返回 None"""
+    if not info:
+        return None
+    return next((s for s in info['streams'] if s.get('codec_type') == codec_type), None)
+
+
+def get_video_duration(video_file):
+    """
+    获取视频时长（秒）
+
+    参数:
+        video_file: 视频文件路径
+
+    返回:
+        视频时长（秒）
+    """
+    info = probe_media(video_file)
+    try:
+        return float(info['format']['duration'])
+    except (TypeError, KeyError, ValueError):
+        print(f"获取视频时长失败: {video_file}")
+        return None
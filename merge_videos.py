@@ -1,62 +1,149 @@
 import os
+import json
+import shutil
 import subprocess
 import sys
+import tempfile
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from batch_scheduler import DEFAULT_CPU_WORKERS
+from chunk_encode import chunk_encode
+from chunk_encode import VIDEO_ARGS as CHUNK_VIDEO_ARGS, AUDIO_ARGS as CHUNK_AUDIO_ARGS
+from encoders import hardware_video_args, calibrate, parse_codecs, DEFAULT_GPU_JOBS
+from ffmpeg_runner import run_ffmpeg, start_ffmpeg, finish_ffmpeg, new_summary, summarize_stderr, format_summary
+from job_journal import partial_path, commit_output, discard_partial, is_partial_file
+from media_probe import probe_media, probe_many, get_stream, get_video_duration
+from output_profile import PROFILES, STDOUT_OUTPUT, output_target, is_stream_output, use_stdout_for_data
+from smart_cut import VIDEO_ENCODERS, AUDIO_ENCODERS, H264_PROFILES
+from subtitles import pick_sidecar, burn_filter, combine_subtitles
+from transcode_cache import transcode_cached, evict_cache, fingerprint
+
+# 流式合并时每次从转换进程搬运到合并进程的数据量
+PIPE_CHUNK_SIZE = 1024 * 1024
+
+# 默认输出文件名；追加模式默认输出 MPEG-TS，追加时只写新数据，不重写已有内容
+DEFAULT_OUTPUT_NAME = "merged_output.mp4"
+DEFAULT_APPEND_OUTPUT_NAME = "merged_output.ts"
 
 def get_video_files(directory):
     """获取目录中的所有视频文件并按名称排序"""
     video_extensions = ('.mp4', '.avi', '.mkv', '.mov', '.flv', '.wmv', '.webm', '.ts')
-    files = [f for f in os.listdir(directory) if f.lower().endswith(video_extensions)]
+    files = [f for f in os.listdir(directory)
+             if f.lower().endswith(video_extensions) and not is_partial_file(f)]
     files.sort()
     return files
 
-def convert_to_mp4(input_file, output_file, encoder='cpu'):
-    """将视频转换为标准 MP4 格式
+def build_convert_args(encoder='cpu', threads=None):
+    """转换为标准格式使用的编码参数
     
     Args:
-        input_file: 输入文件路径
-        output_file: 输出文件路径
-        encoder: 编码器类型 ('cpu' 或 'gpu')
+        encoder: 编码器类型 ('cpu' 或 'gpu')，或 encoders.calibrate 选出的编码方案
+        threads: 编码线程数（仅 CPU 编码），None 表示由 ffmpeg 自动决定
     """
     if encoder == 'gpu':
-        # AMD 显卡加速
-        cmd = [
-            'ffmpeg',
-            '-i', input_file,
-            '-c:v', 'h264_amf',
-            '-quality', 'balanced',
-            '-rc', 'cqp',
-            '-qp', '23',
-            '-c:a', 'aac',
-            '-b:a', '128k',
-            '-y',
-            output_file
-        ]
+        # 显卡加速，没有可用的显卡编码器时回退到 libx264
+        args = hardware_video_args()[1]
+    elif isinstance(encoder, dict):
+        # 试编码后自动选择的编码器、预设和线程数
+        args = list(encoder['video_args'])
+        threads = threads or encoder.get('threads')
+        if threads:
+            args += ['-threads', str(threads)]
     else:
         # CPU 编码
-        cmd = [
-            'ffmpeg',
-            '-i', input_file,
+        args = [
             '-c:v', 'libx264',
             '-crf', '23',
             '-preset', 'medium',
-            '-c:a', 'aac',
-            '-b:a', '128k',
-            '-y',
-            output_file
         ]
+        if threads:
+            # 多个转换并行时限制每个 ffmpeg 的线程数，避免线程过多互相争抢
+            args += ['-threads', str(threads)]
+    
+    return args + ['-c:a', 'aac', '-b:a', '128k']
+
+def describe_encoder(encoder):
+    """编码器的显示名称"""
+    if isinstance(encoder, dict):
+        return f"自动选择 ({encoder['codec']} {encoder['preset']})"
+    if encoder == 'gpu':
+        name = hardware_video_args()[0]
+        return f"显卡加速 ({name})" if name != 'libx264' else "CPU (libx264，没有可用的显卡编码器)"
+    if encoder == 'chunked':
+        return "CPU 分块并行 (libx264)"
+    return "CPU (libx264)"
+
+def autotune_encoder(directory, video_files, target_speed, jobs=1, max_bitrate=None, codecs=None):
+    """试编码最长的一个文件，选择满足目标速度和码率上限的编码器、预设和线程数
+    
+    Args:
+        directory: 视频目录
+        video_files: 视频文件列表
+        target_speed: 目标编码速度（相对实时的倍数），None 表示 1 倍
+        jobs: 同时转换的文件数，试编码时每个文件最多使用的线程数与实际转换相同
+        max_bitrate: 码率上限 (kbits/s)，None 表示不限
+        codecs: 允许选择的软件编码器，None 表示只用 libx264
+    
+    Returns:
+        encoders.calibrate 的编码方案，无法试编码时返回 'cpu'
+    """
+    video_paths = [os.path.join(directory, video) for video in video_files]
+    durations = []
+    for info in probe_many(video_paths):
+        try:
+            durations.append(float(info['format']['duration']))
+        except (TypeError, KeyError, ValueError):
+            durations.append(0.0)
+    sample = video_paths[durations.index(max(durations))]
+    threads = max(1, (os.cpu_count() or 1) // max(1, jobs))
+    plan = calibrate(sample, target_speed or 1.0, max_bitrate, codecs, threads=threads)
+    if plan is None:
+        print("⚠️  无法试编码，使用默认 CPU 编码参数")
+        return 'cpu'
+    return plan
+
+def total_duration(video_paths):
+    """所有文件的总时长（秒），用于显示合并进度，有文件无法获取时长时返回 None"""
+    total = 0.0
+    for info in probe_many(video_paths):
+        try:
+            total += float(info['format']['duration'])
+        except (TypeError, KeyError, ValueError):
+            return None
+    return total
+
+def convert_to_mp4(input_file, output_file, encoder='cpu', threads=None, cancel_event=None,
+                   subtitle_file=None):
+    """将视频转换为标准 MP4 格式
+    
+    Args:
+        input_file: 输入文件路径
+        output_file: 输出文件路径
+        encoder: 编码器类型 ('cpu'、'gpu' 或 'chunked'，后者为 CPU 分块并行编码)
+        threads: 编码线程数（仅 CPU 编码），None 表示由 ffmpeg 自动决定
+        cancel_event: threading.Event，被设置时终止正在运行的 ffmpeg
+        subtitle_file: 在同一次编码中烧录到画面中的字幕文件
+    """
+    if encoder == 'chunked':
+        # 单个文件内部已经用满所有核心
+        return chunk_encode(input_file, output_file, subtitle_file=subtitle_file)
     
-    result = subprocess.run(
-        cmd,
-        capture_output=True,
-        text=True,
-        encoding='utf-8',
-        errors='ignore'
-    )
+    filter_args = ['-vf', burn_filter(subtitle_file)] if subtitle_file else []
+    cmd = (['ffmpeg', '-i', input_file] + filter_args + build_convert_args(encoder, threads)
+           + ['-y', output_file])
     
+    result = run_ffmpeg(cmd, label=os.path.basename(input_file),
+                        duration=get_video_duration(input_file), cancel_event=cancel_event)
     return result.returncode == 0
 
-def merge_videos_fast(directory, video_files, output_file):
-    """模式1：快速合并（直接复制流）"""
+def merge_videos_fast(directory, video_files, output_file, output_profile=None):
+    """模式1：快速合并（直接复制流）
+    
+    各模式的合并函数都返回 (是否成功, 错误统计)，错误统计为 ffmpeg_runner 在运行过程中
+    对全部日志的分类统计 (result.summary)，不受 stderr 只保留末尾的影响
+    """
     list_file = os.path.join(directory, "filelist.txt")
     
     try:
@@ -70,6 +157,7 @@ def merge_videos_fast(directory, video_files, output_file):
         print(f"\n🚀 开始快速合并视频...")
         
         # ffmpeg 命令 - 使用快速复制模式
+        target_args, stdout = output_target(output_file, output_profile)
         cmd = [
             'ffmpeg',
             '-f', 'concat',
@@ -77,36 +165,39 @@ def merge_videos_fast(directory, video_files, output_file):
             '-i', list_file,
             '-c', 'copy',
             '-y',
-            output_file
-        ]
+        ] + target_args
         
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            encoding='utf-8',
-            errors='ignore'
-        )
+        result = run_ffmpeg(cmd, label="合并",
+                            duration=total_duration([os.path.join(directory, v) for v in video_files]),
+                            stdout=stdout)
         
         # 清理临时文件
         if os.path.exists(list_file):
             os.remove(list_file)
         
-        return result.returncode == 0, result.stderr
+        return result.returncode == 0, result.summary
         
     except Exception as e:
         if os.path.exists(list_file):
             os.remove(list_file)
         raise e
 
-def merge_videos_convert(directory, video_files, output_file, encoder='cpu'):
+def merge_videos_convert(directory, video_files, output_file, encoder='cpu', jobs=1,
+                         output_profile=None, subtitle_files=None):
     """模式2/3：转换后合并（先转换为标准格式再合并）
     
+    转换结果保存在转码缓存中，内容和参数都未变化的文件（重新运行、只新增了几个文件、
+    换一个文件夹合并同一批片段）直接复用，不再重新编码。
+    
     Args:
         directory: 视频目录
         video_files: 视频文件列表
         output_file: 输出文件路径
-        encoder: 编码器类型 ('cpu' 或 'gpu')
+        encoder: 编码器类型 ('cpu'、'gpu'、'chunked') 或自动选择的编码方案
+        jobs: 同时转换的文件数，CPU 编码时每个 ffmpeg 平分 CPU 核心
+        output_profile: MP4 输出格式 (output_profile.PROFILES)，None 表示默认格式
+        subtitle_files: 与 video_files 对应的字幕文件列表（没有字幕的为 None），
+                        转换每个文件时把它自己的字幕烧录到画面中，拼接后时间自然对齐
     """
     temp_dir = os.path.join(directory, "temp")
     
@@ -114,25 +205,79 @@ def merge_videos_convert(directory, video_files, output_file, encoder='cpu'):
     if not os.path.exists(temp_dir):
         os.makedirs(temp_dir)
     
+    # 缓存键只包含影响结果的编码参数（线程数不影响）
+    if encoder == 'chunked':
+        cache_params = {'args': CHUNK_VIDEO_ARGS + CHUNK_AUDIO_ARGS, 'chunked': True}
+    else:
+        cache_params = {'args': build_convert_args(encoder), 'chunked': False}
+    
     try:
-        converted_files = []
+        total = len(video_files)
+        # 按输入顺序保存转换结果，与完成顺序无关
+        converted_files = [None] * total
         
-        encoder_name = "AMD 显卡加速 (h264_amf)" if encoder == 'gpu' else "CPU (libx264)"
-        print(f"\n🔄 开始转换视频为标准 MP4 格式 [{encoder_name}]...")
+        print(f"\n🔄 开始转换视频为标准 MP4 格式 [{describe_encoder(encoder)}]...")
         
-        # 转换每个视频
-        for i, video in enumerate(video_files, 1):
+        jobs = max(1, min(jobs, total))
+        software = encoder == 'cpu' or isinstance(encoder, dict)
+        if isinstance(encoder, dict):
+            # 试编码选出的线程数
+            threads = encoder['threads']
+        else:
+            threads = max(1, (os.cpu_count() or 1) // jobs) if jobs > 1 and software else None
+        if jobs > 1:
+            thread_info = f"，每个 {threads} 线程" if threads else ""
+            print(f"  并行转换 {jobs} 个文件{thread_info}")
+        
+        # 任一文件转换失败时设置，其余正在运行的 ffmpeg 会被终止
+        cancel_event = threading.Event()
+        
+        def convert_one(task):
+            i, video = task
+            if cancel_event.is_set():
+                return None, False
             input_path = os.path.join(directory, video)
-            temp_output = os.path.join(temp_dir, f"temp_{i:03d}.mp4")
+            subtitle_file = subtitle_files[i - 1] if subtitle_files else None
+            params = cache_params
+            if subtitle_file:
+                # 烧录字幕的结果按字幕内容单独缓存
+                params = dict(cache_params, subtitles=fingerprint(subtitle_file))
             
-            print(f"  [{i}/{len(video_files)}] 转换中: {video}")
+            def produce(write_file):
+                print(f"  [{i}/{total}] 转换中: {video}")
+                return convert_to_mp4(input_path, write_file, encoder, threads, cancel_event,
+                                      subtitle_file)
             
-            if convert_to_mp4(input_path, temp_output, encoder):
-                converted_files.append(temp_output)
-                print(f"  ✅ 完成")
-            else:
-                print(f"  ❌ 转换失败: {video}")
-                raise Exception(f"转换失败: {video}")
+            return transcode_cached(input_path, params, produce)
+        
+        failed_video = None
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            tasks = list(enumerate(video_files, 1))
+            futures = {executor.submit(convert_one, task): task for task in tasks}
+            try:
+                for future in as_completed(futures):
+                    if future.cancelled():
+                        continue
+                    i, video = futures[future]
+                    cached_file, hit = future.result()
+                    if cached_file is not None:
+                        converted_files[i - 1] = cached_file
+                        status = "已有缓存，跳过" if hit else "完成"
+                        print(f"  ✅ [{i}/{total}] {status}: {video}")
+                    elif failed_video is None and not cancel_event.is_set():
+                        failed_video = video
+                        print(f"  ❌ 转换失败: {video}")
+                        cancel_event.set()
+                        for other in futures:
+                            other.cancel()
+            except BaseException:
+                cancel_event.set()
+                for other in futures:
+                    other.cancel()
+                raise
+        
+        if failed_video is not None:
+            raise Exception(f"转换失败: {failed_video}")
         
         # 创建文件列表
         list_file = os.path.join(temp_dir, "filelist.txt")
@@ -144,6 +289,7 @@ def merge_videos_convert(directory, video_files, output_file, encoder='cpu'):
         print(f"\n🚀 开始合并转换后的视频...")
         
         # 合并转换后的文件
+        target_args, stdout = output_target(output_file, output_profile)
         cmd = [
             'ffmpeg',
             '-f', 'concat',
@@ -151,44 +297,58 @@ def merge_videos_convert(directory, video_files, output_file, encoder='cpu'):
             '-i', list_file,
             '-c', 'copy',
             '-y',
-            output_file
-        ]
+        ] + target_args
         
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            encoding='utf-8',
-            errors='ignore'
-        )
+        result = run_ffmpeg(cmd, label="合并", duration=total_duration(converted_files),
+                            stdout=stdout)
         
-        success = result.returncode == 0
-        
-        # 清理临时文件
-        print(f"\n🧹 清理临时文件...")
-        for temp_file in converted_files:
-            if os.path.exists(temp_file):
-                os.remove(temp_file)
-        if os.path.exists(list_file):
-            os.remove(list_file)
-        if os.path.exists(temp_dir):
-            os.rmdir(temp_dir)
+        # 合并完成后再淘汰缓存，保证本次用到的文件都还在
+        evict_cache(keep=converted_files)
         
-        return success, result.stderr
+        return result.returncode == 0, result.summary
         
     except Exception as e:
-        # 清理临时文件
-        if os.path.exists(temp_dir):
-            for file in os.listdir(temp_dir):
-                os.remove(os.path.join(temp_dir, file))
-            os.rmdir(temp_dir)
+        # 已转换的文件保留在缓存中，重新运行时直接复用
+        print(f"\nℹ️ 已转换的文件保存在转码缓存中，重新运行将跳过这些文件")
         raise e
+        
+    finally:
+        # 清理临时文件
+        shutil.rmtree(temp_dir, ignore_errors=True)
 
-def merge_videos_direct_gpu(directory, video_files, output_file):
-    """模式4：直接GPU合并（利用ffmpeg concat demuxer + GPU重编码，修复时间戳问题）"""
+def merge_videos_direct_gpu(directory, video_files, output_file, output_profile=None,
+                            subtitle_files=None):
+    """模式4：直接GPU合并（利用ffmpeg concat demuxer + GPU重编码，修复时间戳问题）
+    
+    指定字幕时，各文件的字幕按文件在合并结果中的开始时间偏移，合并为一条字幕，
+    在同一次编码中烧录到画面中。
+    
+    Args:
+        subtitle_files: 与 video_files 对应的字幕文件列表（没有字幕的为 None）
+    """
     list_file = os.path.join(directory, "filelist.txt")
+    video_paths = [os.path.join(directory, v) for v in video_files]
+    durations = []
+    for video, info in zip(video_files, probe_many(video_paths)):
+        try:
+            durations.append(float(info['format']['duration']))
+        except (TypeError, KeyError, ValueError):
+            if subtitle_files:
+                return False, summarize_stderr(f"error: 无法获取视频时长，不能对齐字幕: {video}")
+            durations = None
+            break
     
+    subtitle_file = None
     try:
+        filter_args = []
+        if subtitle_files:
+            fd, subtitle_file = tempfile.mkstemp(prefix='subtitles_', suffix='.ass', dir=directory)
+            os.close(fd)
+            count = combine_subtitles(zip(subtitle_files, durations), subtitle_file)
+            print(f"\n📝 已合并 {len(subtitle_files) - subtitle_files.count(None)} 个文件的字幕，"
+                  f"共 {count} 条")
+            filter_args = ['-vf', burn_filter(subtitle_file)]
+        
         # 写入文件列表
         with open(list_file, 'w', encoding='utf-8') as f:
             for video in video_files:
@@ -201,54 +361,536 @@ def merge_videos_direct_gpu(directory, video_files, output_file):
         
         # ffmpeg 命令 - 使用 concat demuxer 但进行 GPU 重编码
         # 使用与 convert_to_mp4 相同的参数以保持一致性
+        target_args, stdout = output_target(output_file, output_profile)
         cmd = [
             'ffmpeg',
             '-f', 'concat',
             '-safe', '0',
             '-i', list_file,
-            '-c:v', 'h264_amf',
-            '-quality', 'balanced',
-            '-rc', 'cqp',
-            '-qp', '23',
+        ] + filter_args + hardware_video_args()[1] + [
             '-c:a', 'aac',
             '-b:a', '128k',
             '-y',
-            output_file
-        ]
+        ] + target_args
         
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            encoding='utf-8',
-            errors='ignore'
-        )
+        result = run_ffmpeg(cmd, label="GPU 合并",
+                            duration=sum(durations) if durations else None,
+                            stdout=stdout)
         
+        return result.returncode == 0, result.summary
+        
+    finally:
         # 清理临时文件
-        if os.path.exists(list_file):
-            os.remove(list_file)
+        for temp_file in (list_file, subtitle_file):
+            if temp_file and os.path.exists(temp_file):
+                os.remove(temp_file)
+
+def stream_profile(info):
+    """
+    提取决定能否直接拼接的流参数
+    
+    Returns:
+        (视频参数, 音频参数) 元组，视频参数为 (编码, 宽, 高, 帧率, 像素格式, 时间基)，
+        音频参数为 (编码, 采样率, 声道数, 声道布局)，没有音频时为 None
+    """
+    video = get_stream(info, 'video')
+    audio = get_stream(info, 'audio')
+    video_profile = None
+    if video:
+        video_profile = (video.get('codec_name'), video.get('width'), video.get('height'),
+                         video.get('r_frame_rate'), video.get('pix_fmt'), video.get('time_base'))
+    audio_profile = None
+    if audio:
+        audio_profile = (audio.get('codec_name'), audio.get('sample_rate'), audio.get('channels'),
+                         audio.get('channel_layout'))
+    return video_profile, audio_profile
+
+def preflight(directory, video_files):
+    """并行探测所有输入，按流参数分组
+    
+    Returns:
+        (多数文件的参数, 每个文件的参数列表, 每个文件的视频流信息列表)，
+        有文件无法探测时返回 (None, None, None)
+    """
+    infos = probe_many([os.path.join(directory, video) for video in video_files])
+    if any(info is None or get_stream(info, 'video') is None for info in infos):
+        return None, None, None
+    
+    profiles = [stream_profile(info) for info in infos]
+    groups = Counter(profiles)
+    majority = groups.most_common(1)[0][0]
+    
+    print(f"\n🔍 预检：{len(groups)} 种流参数")
+    for profile, count in groups.most_common():
+        (codec, width, height, fps, pix_fmt, _), audio = profile
+        audio_desc = f"{audio[0]} {audio[1]}Hz {audio[2]}ch" if audio else "无音频"
+        mark = "（多数）" if profile == majority else ""
+        print(f"  {count} 个: {codec} {width}x{height} {fps}fps {pix_fmt}, {audio_desc}{mark}")
+    
+    return majority, profiles, [get_stream(info, 'video') for info in infos]
+
+def build_match_args(majority, reference_video):
+    """生成把离群文件转码为多数文件参数的 ffmpeg 输出参数，无法匹配时返回 None"""
+    (codec, width, height, fps, pix_fmt, time_base), audio = majority
+    encoder = VIDEO_ENCODERS.get(codec)
+    if encoder is None:
+        return None
+    
+    args = [
+        '-c:v', encoder,
+        '-vf', (f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+                f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1"),
+        '-r', fps,
+        '-pix_fmt', pix_fmt,
+    ]
+    if encoder in ('libx264', 'libx265'):
+        args += ['-crf', '20', '-preset', 'medium']
+    profile = H264_PROFILES.get(reference_video.get('profile'))
+    if codec == 'h264' and profile:
+        args += ['-profile:v', profile]
+    if time_base and '/' in time_base:
+        args += ['-video_track_timescale', time_base.split('/')[1]]
+    
+    if audio:
+        audio_encoder = AUDIO_ENCODERS.get(audio[0])
+        if audio_encoder is None:
+            return None
+        args += ['-c:a', audio_encoder, '-ar', str(audio[1]), '-ac', str(audio[2])]
+    else:
+        args += ['-an']
+    return args
+
+def transcode_to_match(input_file, profile, majority, match_args, progress, name):
+    """把一个文件转码为多数文件的参数，结果保存在转码缓存中
+    
+    Args:
+        input_file: 输入文件
+        profile: 该文件的流参数 (stream_profile)
+        majority: 目标流参数
+        match_args: build_match_args 生成的编码参数
+        progress, name: 显示用的进度和文件名
+    
+    Returns:
+        (缓存文件路径, 是否命中缓存, 错误统计)，转码失败时路径为 None
+    """
+    args = []
+    if majority[1] and profile[1] is None:
+        # 多数文件有音频而该文件没有，补一条静音音轨
+        args += ['-f', 'lavfi', '-i',
+                 f"anullsrc=r={majority[1][1]}:cl={majority[1][3] or 'stereo'}",
+                 '-map', '0:v:0', '-map', '1:a:0', '-shortest']
+    else:
+        args += ['-map', '0:v:0', '-map', '0:a:0?']
+    args += match_args
+    
+    summaries = []
+    
+    def produce(write_file):
+        print(f"  {progress} 转码中: {name}")
+        result = run_ffmpeg(['ffmpeg', '-i', input_file] + args + ['-y', write_file],
+                            label=name, duration=get_video_duration(input_file))
+        summaries.append(result.summary)
+        return result.returncode == 0
+    
+    cached_file, hit = transcode_cached(input_file, {'args': args}, produce)
+    return cached_file, hit, summaries[-1] if summaries else new_summary()
+
+def merge_videos_preflight(directory, video_files, output_file, output_profile=None):
+    """模式5：智能合并（预检流参数，只转码与多数文件不一致的文件，其余直接复制）"""
+    majority, profiles, video_streams = preflight(directory, video_files)
+    if majority is None:
+        print("❌ 预检失败：有文件无法读取视频流信息")
+        return False, new_summary()
+    
+    reference_video = video_streams[profiles.index(majority)]
+    match_args = build_match_args(majority, reference_video)
+    outliers = [i for i, profile in enumerate(profiles) if profile != majority]
+    if outliers and match_args is None:
+        print("❌ 多数文件的编码格式不支持自动匹配，请使用模式 2/3/4")
+        return False, new_summary()
+    
+    temp_dir = os.path.join(directory, "temp_preflight")
+    list_file = os.path.join(temp_dir, "filelist.txt")
+    os.makedirs(temp_dir, exist_ok=True)
+    
+    try:
+        merge_files = [os.path.join(directory, video) for video in video_files]
         
-        return result.returncode == 0, result.stderr
+        if outliers:
+            print(f"\n🔄 转码 {len(outliers)} 个参数不一致的文件，其余 {len(video_files) - len(outliers)} 个直接复制...")
+        for n, i in enumerate(outliers, 1):
+            video = video_files[i]
+            cached_file, hit, summary = transcode_to_match(merge_files[i], profiles[i], majority,
+                                                          match_args, f"[{n}/{len(outliers)}]", video)
+            if cached_file is None:
+                print(f"  ❌ 转码失败: {video}")
+                return False, summary
+            merge_files[i] = cached_file
+            if hit:
+                print(f"  [{n}/{len(outliers)}] 已有缓存，跳过: {video}")
+            else:
+                print(f"  ✅ 完成")
         
-    except Exception as e:
-        if os.path.exists(list_file):
-            os.remove(list_file)
-        raise e
+        with open(list_file, 'w', encoding='utf-8') as f:
+            for merge_file in merge_files:
+                escaped_path = os.path.abspath(merge_file).replace("\\", "/").replace("'", "'\\''")
+                f.write(f"file '{escaped_path}'\n")
+        
+        print(f"\n🚀 开始合并视频...")
+        target_args, stdout = output_target(output_file, output_profile)
+        cmd = [
+            'ffmpeg',
+            '-f', 'concat',
+            '-safe', '0',
+            '-i', list_file,
+            '-c', 'copy',
+            '-y',
+        ] + target_args
+        
+        result = run_ffmpeg(cmd, label="合并", duration=total_duration(merge_files), stdout=stdout)
+        
+        evict_cache(keep=merge_files)
+        
+        return result.returncode == 0, result.summary
+        
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+def merge_videos_stream(directory, video_files, output_file, encoder='cpu', output_profile=None,
+                        subtitle_files=None):
+    """模式7：流式转换合并（不生成临时文件）
+    
+    每个文件依次转换为 MPEG-TS 写入管道，时间戳按之前所有文件的累计时长偏移，
+    同一个合并进程从 stdin 连续读取这些 TS 流并直接写出 MP4。
+    
+    Args:
+        directory: 视频目录
+        video_files: 视频文件列表
+        output_file: 输出文件路径
+        encoder: 编码器类型 ('cpu' 或 'gpu') 或自动选择的编码方案
+        output_profile: MP4 输出格式，选择 'fragmented' 或输出到标准输出时边转换边写出可播放的数据
+        subtitle_files: 与 video_files 对应的字幕文件列表（没有字幕的为 None），转换时烧录到画面中
+    """
+    video_paths = [os.path.join(directory, video) for video in video_files]
+    durations = []
+    for video, info in zip(video_files, probe_many(video_paths)):
+        try:
+            durations.append(float(info['format']['duration']))
+        except (TypeError, KeyError, ValueError):
+            return False, summarize_stderr(f"error: 无法获取视频时长: {video}")
+    
+    print(f"\n🔄 开始流式转换合并 [{describe_encoder(encoder)}]，不生成临时文件...")
+    
+    target_args, stdout = output_target(output_file, output_profile)
+    muxer_cmd = [
+        'ffmpeg', '-v', 'error',
+        '-f', 'mpegts', '-i', 'pipe:0',
+        '-map', '0', '-c', 'copy',
+        '-bsf:a', 'aac_adtstoasc',
+        '-y',
+    ] + target_args
+    # 进度由转换进程显示，合并进程只收集日志
+    muxer = start_ffmpeg(muxer_cmd, label="合并", stdin=subprocess.PIPE, stdout=stdout,
+                         show_progress=False)
+    
+    converter = None
+    try:
+        offset = 0.0
+        for i, (video, video_path, duration) in enumerate(zip(video_files, video_paths, durations), 1):
+            print(f"  [{i}/{len(video_files)}] 转换中: {video}")
+            
+            subtitle_file = subtitle_files[i - 1] if subtitle_files else None
+            filter_args = ['-vf', burn_filter(subtitle_file)] if subtitle_file else []
+            cmd = (['ffmpeg', '-v', 'error', '-nostdin', '-i', video_path] + filter_args
+                   + build_convert_args(encoder)
+                   + ['-f', 'mpegts', '-output_ts_offset', f"{offset:.6f}", 'pipe:1'])
+            converter = start_ffmpeg(cmd, label=video, duration=duration, stdout=subprocess.PIPE)
+            
+            try:
+                shutil.copyfileobj(converter['process'].stdout, muxer['process'].stdin, PIPE_CHUNK_SIZE)
+            except BrokenPipeError:
+                # 合并进程已退出，错误信息在合并进程的 stderr 中
+                converter['process'].kill()
+                finish_ffmpeg(converter)
+                return False, finish_ffmpeg(muxer).summary
+            
+            result = finish_ffmpeg(converter)
+            if result.returncode != 0:
+                print(f"  ❌ 转换失败: {video}")
+                if not result.summary['error']['count']:
+                    return False, summarize_stderr(f"error: 转换失败: {video}")
+                return False, result.summary
+            
+            offset += duration
+            print(f"  ✅ 完成")
+        
+        muxer['process'].stdin.close()
+        result = finish_ffmpeg(muxer)
+        return result.returncode == 0, result.summary
+        
+    finally:
+        for job in (converter, muxer):
+            if job is not None and job['process'].poll() is None:
+                job['process'].kill()
+                job['process'].wait()
+
+def append_manifest_path(output_file):
+    """追加记录文件: 输出文件同目录下的隐藏 JSON 文件"""
+    directory, name = os.path.split(output_file)
+    return os.path.join(directory, f".{name}.append.json")
+
+def file_identity(video_path):
+    """返回 [文件大小, 修改时间 ns]，用于判断文件是否已追加过"""
+    stat = os.stat(video_path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+def load_append_manifest(output_file):
+    """读取已追加到输出文件的输入列表
+    
+    Returns:
+        {输入文件绝对路径: [大小, 修改时间]}，没有记录或输出文件已被其他程序修改时返回 None
+    """
+    try:
+        with open(append_manifest_path(output_file), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if os.path.getsize(output_file) != manifest.get('output_size'):
+        return None
+    return manifest.get('inputs', {})
+
+def save_append_manifest(output_file, inputs):
+    """保存追加记录，先写临时文件再重命名"""
+    manifest_file = append_manifest_path(output_file)
+    write_file = manifest_file + '.tmp'
+    with open(write_file, 'w', encoding='utf-8') as f:
+        json.dump({'output_size': os.path.getsize(output_file), 'inputs': inputs},
+                  f, ensure_ascii=False, indent=2)
+    os.replace(write_file, manifest_file)
+
+def merge_videos_append(directory, video_files, output_file):
+    """模式8：追加合并（只把新增的文件追加到已有的输出文件末尾）
+    
+    输出为 .ts 时直接把新文件转封装后的数据追加到文件末尾，不读写已有内容；
+    输出为 .mp4 时索引 (moov) 必须覆盖全部数据，需要流复制重写一遍整个文件。
+    新文件的流参数与输出文件不一致时先转码为输出文件的参数。
+    
+    Args:
+        directory: 视频目录
+        video_files: 视频文件列表
+        output_file: 输出文件路径（不存在时新建）
+    """
+    video_paths = [os.path.abspath(os.path.join(directory, video)) for video in video_files]
+    exists = os.path.exists(output_file)
+    is_ts = output_file.lower().endswith('.ts')
+    
+    included = load_append_manifest(output_file) if exists else {}
+    if included is None:
+        # 输出文件由其他模式生成，视修改时间早于输出文件的视频为已包含
+        output_mtime = os.stat(output_file).st_mtime_ns
+        included = {path: file_identity(path) for path in video_paths
+                    if os.stat(path).st_mtime_ns <= output_mtime}
+        print("ℹ️ 没有找到追加记录，只追加修改时间晚于输出文件的视频")
+    
+    new_indexes = [i for i, path in enumerate(video_paths) if included.get(path) != file_identity(path)]
+    if not new_indexes:
+        print("\n✅ 没有需要追加的新文件")
+        return True, new_summary()
+    
+    print(f"\n➕ 需要追加 {len(new_indexes)} 个新文件：")
+    for i in new_indexes:
+        print(f"  {video_files[i]}")
+    
+    new_paths = [video_paths[i] for i in new_indexes]
+    new_infos = probe_many(new_paths)
+    if any(info is None or get_stream(info, 'video') is None for info in new_infos):
+        print("❌ 预检失败：有文件无法读取视频流信息")
+        return False, new_summary()
+    new_profiles = [stream_profile(info) for info in new_infos]
+    
+    # 目标参数: 已有输出文件的参数，新建时为新文件中的多数参数
+    if exists:
+        target_info = probe_media(output_file)
+        if target_info is None or get_stream(target_info, 'video') is None:
+            print("❌ 无法读取输出文件的流信息")
+            return False, new_summary()
+        target = stream_profile(target_info)
+    else:
+        target = Counter(new_profiles).most_common(1)[0][0]
+        target_info = new_infos[new_profiles.index(target)]
+    
+    def comparable(profile):
+        # MPEG-TS 的时间基固定为 1/90000，不需要一致
+        if is_ts:
+            return (profile[0][:5], profile[1])
+        return profile
+    
+    sources = list(new_paths)
+    mismatched = [n for n, profile in enumerate(new_profiles) if comparable(profile) != comparable(target)]
+    if mismatched:
+        match_args = build_match_args(target, get_stream(target_info, 'video'))
+        if match_args is None:
+            print("❌ 输出文件的编码格式不支持自动匹配，请使用其他模式重新合并")
+            return False, new_summary()
+        print(f"\n🔄 {len(mismatched)} 个新文件与输出文件的流参数不一致，转码后再追加...")
+        for k, n in enumerate(mismatched, 1):
+            name = os.path.basename(new_paths[n])
+            cached_file, hit, summary = transcode_to_match(new_paths[n], new_profiles[n], target,
+                                                          match_args, f"[{k}/{len(mismatched)}]", name)
+            if cached_file is None:
+                print(f"  ❌ 转码失败: {name}")
+                return False, summary
+            sources[n] = cached_file
+            if hit:
+                print(f"  [{k}/{len(mismatched)}] 已有缓存，跳过: {name}")
+            else:
+                print(f"  ✅ 完成")
+    
+    if is_ts:
+        success, summary = append_ts(output_file, sources, new_infos, exists)
+    else:
+        success, summary = append_remux(output_file, sources, exists)
+    
+    if success:
+        for path in new_paths:
+            included[path] = file_identity(path)
+        save_append_manifest(output_file, included)
+        evict_cache(keep=sources)
+    return success, summary
+
+def append_ts(output_file, sources, infos, exists):
+    """把新文件转封装为 MPEG-TS 后直接追加到输出文件末尾，失败时截断回原来的大小
+    
+    输出文件还不存在时先写到临时文件，全部写完后再重命名，失败时不留下输出文件
+    （否则没有追加记录的空文件会让下次运行把所有视频当作已追加）
+    """
+    offset = 0.0
+    if exists:
+        offset = get_video_duration(output_file)
+        if offset is None:
+            return False, summarize_stderr("error: 无法获取输出文件时长")
+    original_size = os.path.getsize(output_file) if exists else 0
+    write_file = output_file if exists else partial_path(output_file)
+    
+    print(f"\n🚀 开始追加到 {os.path.basename(output_file)}（不重写已有内容）...")
+    success = False
+    try:
+        with open(write_file, 'ab' if exists else 'wb') as out:
+            try:
+                for n, (source, info) in enumerate(zip(sources, infos), 1):
+                    print(f"  [{n}/{len(sources)}] 追加中: {os.path.basename(source)}")
+                    out.flush()
+                    # ffmpeg 直接写入已打开的输出文件，时间戳接在已有内容之后
+                    cmd = [
+                        'ffmpeg', '-v', 'error', '-nostdin',
+                        '-i', source,
+                        '-map', '0:v:0', '-map', '0:a:0?',
+                        '-c', 'copy',
+                        '-f', 'mpegts', '-output_ts_offset', f"{offset:.6f}",
+                        'pipe:1'
+                    ]
+                    result = run_ffmpeg(cmd, label=os.path.basename(source),
+                                        duration=float(info['format'].get('duration') or 0), stdout=out)
+                    if result.returncode != 0:
+                        out.truncate(original_size)
+                        return False, result.summary
+                    offset += float(info['format'].get('duration') or 0)
+                out.flush()
+                os.fsync(out.fileno())
+            except BaseException:
+                out.truncate(original_size)
+                raise
+        commit_output(write_file, output_file)
+        success = True
+    finally:
+        if not success and not exists:
+            discard_partial(write_file)
+    return True, new_summary()
 
-def merge_videos(directory, mode=1):
+def append_remux(output_file, sources, exists):
+    """已有输出文件 + 新文件流复制拼接为新文件，完成后替换原文件"""
+    inputs = ([output_file] if exists else []) + sources
+    fd, list_file = tempfile.mkstemp(prefix='.append_', suffix='.txt',
+                                     dir=os.path.dirname(output_file) or '.')
+    write_file = partial_path(output_file)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            for input_file in inputs:
+                escaped_path = os.path.abspath(input_file).replace("\\", "/").replace("'", "'\\''")
+                f.write(f"file '{escaped_path}'\n")
+        
+        print(f"\n🚀 开始追加（MP4 需要流复制重写整个文件）...")
+        cmd = [
+            'ffmpeg',
+            '-f', 'concat',
+            '-safe', '0',
+            '-i', list_file,
+            '-map', '0',
+            '-c', 'copy',
+            '-y',
+            write_file
+        ]
+        result = run_ffmpeg(cmd, label="追加", duration=total_duration(inputs))
+        if result.returncode != 0:
+            discard_partial(write_file)
+            return False, result.summary
+        commit_output(write_file, output_file)
+        return True, result.summary
+    finally:
+        os.remove(list_file)
+
+def print_error_lines(summary):
+    """显示合并函数返回的错误统计（相同的错误只显示一次并标出次数）"""
+    for line in format_summary(summary, 'error'):
+        print(f"   {line}")
+    if summary['warning']['count']:
+        print(f"   (另有 {summary['warning']['count']} 条警告)")
+
+def merge_videos(directory, mode=1, jobs=None, encoder='cpu', output_name=None,
+                 overwrite=None, target_speed=None, output_profile=None, burn_subtitles=False,
+                 subtitle_language=None, max_bitrate=None, codecs=None):
     """合并视频主函数
     
     Args:
         directory: 视频目录
-        mode: 合并模式 (1=快速, 2=CPU转换, 3=GPU转换, 4=直接GPU合并)
+        mode: 合并模式 (1=快速, 2=CPU转换, 3=GPU转换, 4=直接GPU合并, 5=智能合并,
+              6=CPU分块并行转换, 7=流式转换, 8=追加)
+        jobs: 模式2/3同时转换的文件数，None 表示使用默认值
+        encoder: 模式7使用的编码器类型 ('cpu' 或 'gpu')
+        output_name: 输出文件名（保存在视频目录中），'-' 表示写到标准输出，
+                     None 表示默认文件名（追加模式为 merged_output.ts，其他模式为 merged_output.mp4）
+        overwrite: 输出文件已存在时是否覆盖，None 表示询问用户（追加模式不覆盖）
+        target_speed: 模式2/7使用 CPU 编码时，先试编码并选择满足该速度（相对实时的倍数）
+                      的编码器和预设，None 表示使用默认的 libx264 medium
+        output_profile: MP4 输出格式 ('plain'、'faststart'、'fragmented')，None 表示默认格式
+        burn_subtitles: 是否把各文件的外挂字幕 (video.srt 等) 在合并编码时烧录到画面中
+                        （模式 2/3/4/6/7）
+        subtitle_language: 烧录字幕的语言后缀，例如 'zh' 选择 video.zh.srt，None 表示默认字幕
+        max_bitrate: 模式2/7试编码选择预设时的码率上限 (kbits/s)，只指定码率上限时目标速度为 1 倍
+        codecs: 模式2/7试编码时允许选择的软件编码器，例如 ('libx264', 'libx265')，
+                None 表示只用 libx264
     """
-    video_files = get_video_files(directory)
+    # 输出文件路径
+    if output_name is None:
+        output_name = DEFAULT_APPEND_OUTPUT_NAME if mode == 8 else DEFAULT_OUTPUT_NAME
+    if output_name == STDOUT_OUTPUT:
+        output_file = STDOUT_OUTPUT
+    else:
+        output_file = os.path.join(directory, output_name)
+    streaming = is_stream_output(output_file)
+    if output_profile is not None and output_profile not in PROFILES:
+        print(f"❌ 错误：未知的输出格式 {output_profile}")
+        return False
+    
+    # 输出文件本身和其他追加模式的输出文件不作为输入
+    video_files = [f for f in get_video_files(directory) if f != output_name
+                   and not os.path.exists(append_manifest_path(os.path.join(directory, f)))]
     
     if len(video_files) == 0:
         print("❌ 错误：目录中没有找到视频文件")
         return False
     
-    if len(video_files) == 1:
+    if len(video_files) == 1 and mode != 8:
         print("⚠️  只找到一个视频文件，无需合并")
         return False
     
@@ -256,46 +898,114 @@ def merge_videos(directory, mode=1):
     for i, file in enumerate(video_files, 1):
         print(f"  {i}. {file}")
     
-    # 输出文件路径
-    output_file = os.path.join(directory, "merged_output.mp4")
+    subtitle_files = None
+    if burn_subtitles:
+        if mode in (1, 5, 8):
+            print("❌ 错误：烧录字幕需要重新编码，请选择模式 2/3/4/6/7")
+            return False
+        subtitle_files = [pick_sidecar(os.path.join(directory, f), subtitle_language)
+                          for f in video_files]
+        found = len(subtitle_files) - subtitle_files.count(None)
+        if found:
+            print(f"📝 烧录字幕：{found} 个文件找到外挂字幕，{len(subtitle_files) - found} 个文件没有字幕")
+        else:
+            print("⚠️  没有找到外挂字幕，不烧录字幕")
+            subtitle_files = None
+    
+    if mode == 8:
+        if streaming:
+            print("❌ 错误：追加模式只能输出到普通文件")
+            return False
+        print(f"📁 输出文件：{output_file}")
+        if not output_file.lower().endswith('.ts'):
+            print("⚠️  追加到 MP4 文件每次都要重写整个文件，经常追加请使用 .ts 输出文件")
+        try:
+            success, summary = merge_videos_append(directory, video_files, output_file)
+        except Exception as e:
+            print(f"\n❌ 发生错误：{str(e)}")
+            return False
+        if success:
+            file_size = os.path.getsize(output_file) / (1024 * 1024)  # MB
+            print(f"\n✅ 追加完成！")
+            print(f"📦 文件大小：{file_size:.2f} MB")
+            print(f"📂 保存位置：{output_file}")
+        else:
+            print(f"\n❌ 追加失败")
+            print_error_lines(summary)
+        return success
     
     # 检查输出文件是否已存在
-    if os.path.exists(output_file):
-        response = input(f"\n⚠️  输出文件已存在，是否覆盖？(y/n): ").strip().lower()
-        if response != 'y':
+    if not streaming and os.path.exists(output_file):
+        if overwrite is None:
+            response = input(f"\n⚠️  输出文件已存在，是否覆盖？(y/n): ").strip().lower()
+            overwrite = response == 'y'
+        if not overwrite:
             print("操作已取消")
             return False
     
     print(f"📁 输出文件：{output_file}")
     
+    # 先写入临时文件，完成后再重命名，中途中断不会留下不完整的输出文件
+    write_file = partial_path(output_file)
+    
     try:
         # 根据模式选择合并方式
         if mode == 1:
-            success, stderr = merge_videos_fast(directory, video_files, output_file)
+            success, summary = merge_videos_fast(directory, video_files, write_file, output_profile)
         elif mode == 2:
-            success, stderr = merge_videos_convert(directory, video_files, output_file, encoder='cpu')
+            cpu_encoder = 'cpu'
+            if target_speed or max_bitrate or codecs:
+                cpu_encoder = autotune_encoder(directory, video_files, target_speed,
+                                               min(jobs or DEFAULT_CPU_WORKERS, len(video_files)),
+                                               max_bitrate, codecs)
+                if isinstance(cpu_encoder, dict) and not jobs:
+                    # 试编码选出的线程数较少时，空出的核心同时转换更多文件
+                    jobs = max(DEFAULT_CPU_WORKERS, (os.cpu_count() or 1) // cpu_encoder['threads'])
+            jobs = jobs or DEFAULT_CPU_WORKERS
+            success, summary = merge_videos_convert(directory, video_files, write_file,
+                                                   encoder=cpu_encoder, jobs=jobs,
+                                                   output_profile=output_profile,
+                                                   subtitle_files=subtitle_files)
         elif mode == 3:
-            success, stderr = merge_videos_convert(directory, video_files, output_file, encoder='gpu')
+            success, summary = merge_videos_convert(directory, video_files, write_file, encoder='gpu',
+                                                   jobs=jobs or DEFAULT_GPU_JOBS,
+                                                   output_profile=output_profile,
+                                                   subtitle_files=subtitle_files)
+        elif mode == 5:
+            success, summary = merge_videos_preflight(directory, video_files, write_file,
+                                                     output_profile)
+        elif mode == 6:
+            success, summary = merge_videos_convert(directory, video_files, write_file, encoder='chunked',
+                                                   output_profile=output_profile,
+                                                   subtitle_files=subtitle_files)
+        elif mode == 7:
+            if encoder == 'cpu' and (target_speed or max_bitrate or codecs):
+                encoder = autotune_encoder(directory, video_files, target_speed,
+                                           max_bitrate=max_bitrate, codecs=codecs)
+            success, summary = merge_videos_stream(directory, video_files, write_file, encoder,
+                                                  output_profile, subtitle_files)
         else:  # mode == 4
-            success, stderr = merge_videos_direct_gpu(directory, video_files, output_file)
+            success, summary = merge_videos_direct_gpu(directory, video_files, write_file,
+                                                      output_profile, subtitle_files)
         
-        if success:
+        if success and streaming:
+            print(f"\n✅ 合并成功！已输出到 {output_file}")
+            return True
+        elif success:
+            commit_output(write_file, output_file)
             file_size = os.path.getsize(output_file) / (1024 * 1024)  # MB
             print(f"\n✅ 合并成功！")
             print(f"� 合文件大小：{file_size:.2f} MB")
             print(f"📂 保存位置：{output_file}")
             return True
         else:
+            discard_partial(write_file)
             print(f"\n❌ 合并失败")
-            # 只显示关键错误信息
-            if stderr:
-                error_lines = stderr.split('\n')
-                for line in error_lines:
-                    if 'error' in line.lower() or 'failed' in line.lower():
-                        print(f"   {line.strip()}")
+            print_error_lines(summary)
             return False
             
     except Exception as e:
+        discard_partial(write_file)
         print(f"\n❌ 发生错误：{str(e)}")
         return False
 
@@ -320,26 +1030,190 @@ def main():
     print("\n请选择合并模式：")
     print("  1. 快速合并（默认，直接合并，速度快但兼容性较差）")
     print("  2. CPU 转换合并（libx264，兼容性好但速度慢）")
-    print("  3. GPU 转换合并（h264_amf，AMD 显卡加速，速度快，兼容性好）")
+    print("  3. GPU 转换合并（AMD/NVIDIA/Intel 显卡加速，速度快，兼容性好；没有显卡时自动改用 CPU）")
     print("  4. 直接 GPU 合并（不生成临时文件，直接合并重编码，强烈推荐！修复卡顿）")
+    print("  5. 智能合并（预检所有文件，只转码参数不一致的文件，其余直接复制）")
+    print("  6. CPU 分块并行转换合并（libx264，每个文件切块后多进程同时编码，适合多核无显卡的机器）")
+    print("  7. 流式转换合并（转换结果通过管道直接写入输出文件，不占用临时磁盘空间）")
+    print("  8. 追加合并（只把新增的视频追加到已有的输出文件末尾）")
     
-    mode_input = input("\n请输入模式编号 (1/2/3/4，默认为1): ").strip()
+    mode_input = input("\n请输入模式编号 (1/2/3/4/5/6/7/8，默认为1): ").strip()
     
     if mode_input == '2':
         mode = 2
         print("\n✨ 已选择：CPU 转换合并模式")
     elif mode_input == '3':
         mode = 3
-        print("\n✨ 已选择：GPU 转换合并模式 (AMD 显卡加速)")
+        print("\n✨ 已选择：GPU 转换合并模式 (显卡加速)")
     elif mode_input == '4':
         mode = 4
         print("\n✨ 已选择：直接 GPU 合并模式 (推荐，修复卡顿)")
+    elif mode_input == '5':
+        mode = 5
+        print("\n✨ 已选择：智能合并模式")
+    elif mode_input == '6':
+        mode = 6
+        print("\n✨ 已选择：CPU 分块并行转换合并模式")
+    elif mode_input == '7':
+        mode = 7
+        print("\n✨ 已选择：流式转换合并模式")
+    elif mode_input == '8':
+        mode = 8
+        print("\n✨ 已选择：追加合并模式")
     else:
         mode = 1
         print("\n✨ 已选择：快速合并模式")
     
+    jobs = None
+    if mode in (2, 3):
+        default_jobs = DEFAULT_CPU_WORKERS if mode == 2 else DEFAULT_GPU_JOBS
+        jobs_input = input(f"\n同时转换的文件数 (默认为{default_jobs}): ").strip()
+        if jobs_input.isdigit() and int(jobs_input) > 0:
+            jobs = int(jobs_input)
+    
+    encoder = 'cpu'
+    if mode == 7:
+        encoder_input = input("\n编码器 (1=CPU, 2=显卡加速，默认为1): ").strip()
+        if encoder_input == '2':
+            encoder = 'gpu'
+    
+    target_speed = None
+    if mode == 2 or (mode == 7 and encoder == 'cpu'):
+        speed_input = input("\n目标编码速度 (例如 2 表示 2 倍实时速度，先试编码一小段再自动选择编码预设；"
+                            "留空使用 libx264 medium): ").strip()
+        try:
+            target_speed = float(speed_input) if speed_input else None
+        except ValueError:
+            print("⚠️  无效的速度，使用默认编码参数")
+    
+    max_bitrate = None
+    if mode == 2 or (mode == 7 and encoder == 'cpu'):
+        bitrate_input = input("\n码率上限 (kbits/s，例如 4000，试编码时只选择不超过该码率的预设；"
+                              "留空不限): ").strip()
+        try:
+            max_bitrate = float(bitrate_input) if bitrate_input else None
+        except ValueError:
+            print("⚠️  无效的码率，不限制码率")
+    
+    output_name = None
+    if mode == 8:
+        name_input = input(f"\n追加到的文件名 (默认为{DEFAULT_APPEND_OUTPUT_NAME}，"
+                           f".mp4 文件每次追加都要重写整个文件): ").strip()
+        if name_input:
+            output_name = name_input
+    
+    output_profile = None
+    if mode != 8:
+        profile_input = input("\n输出格式 (1=普通, 2=快速启动 适合网页播放, 3=分片 适合边写边播，"
+                              "默认为1): ").strip()
+        output_profile = {'2': 'faststart', '3': 'fragmented'}.get(profile_input)
+    
+    burn_subtitles = False
+    subtitle_language = None
+    if mode in (2, 3, 4, 6, 7):
+        burn_input = input("\n是否把各视频的外挂字幕 (同名 .srt/.vtt/.ass) 烧录到画面中？"
+                           "(y/N，也可以输入语言后缀，例如 zh): ").strip()
+        if burn_input.lower() == 'y':
+            burn_subtitles = True
+        elif burn_input and burn_input.lower() != 'n':
+            burn_subtitles = True
+            subtitle_language = burn_input
+    
     # 执行合并
-    merge_videos(directory, mode)
+    merge_videos(directory, mode, jobs, encoder, output_name, target_speed=target_speed,
+                 output_profile=output_profile, burn_subtitles=burn_subtitles,
+                 subtitle_language=subtitle_language, max_bitrate=max_bitrate)
+
+def run_cli(argv):
+    """
+    命令行合并（不询问，供脚本和任务服务器调用）
+    
+    Returns:
+        退出码，成功为 0
+    """
+    mode = 1
+    jobs = None
+    encoder = 'cpu'
+    output_name = None
+    overwrite = False
+    target_speed = None
+    max_bitrate = None
+    codecs = None
+    output_profile = None
+    burn_subtitles = False
+    subtitle_language = None
+    args = []
+    invalid = None
+    for arg in argv:
+        try:
+            if arg.startswith('--mode='):
+                mode = int(arg.split('=', 1)[1])
+            elif arg.startswith('--output='):
+                output_name = arg.split('=', 1)[1]
+            elif arg.startswith('--jobs='):
+                jobs = int(arg.split('=', 1)[1])
+            elif arg.startswith('--encoder='):
+                encoder = arg.split('=', 1)[1]
+            elif arg.startswith('--speed='):
+                target_speed = float(arg.split('=', 1)[1])
+            elif arg.startswith('--max-bitrate='):
+                max_bitrate = float(arg.split('=', 1)[1])
+            elif arg.startswith('--codecs='):
+                codecs = parse_codecs(arg.split('=', 1)[1])
+            elif arg.startswith('--profile='):
+                output_profile = arg.split('=', 1)[1]
+            elif arg == '--burn-subtitles':
+                burn_subtitles = True
+            elif arg.startswith('--burn-subtitles='):
+                burn_subtitles = True
+                subtitle_language = arg.split('=', 1)[1] or None
+            elif arg == '--overwrite':
+                overwrite = True
+            else:
+                args.append(arg)
+        except ValueError:
+            invalid = invalid or f"无效的参数值: {arg}"
+    if invalid is None and jobs is not None and jobs < 1:
+        invalid = "--jobs 必须大于 0"
+    elif invalid is None and any(value is not None and value <= 0 for value in (target_speed, max_bitrate)):
+        invalid = "--speed / --max-bitrate 必须大于 0"
+    
+    if invalid or len(args) != 1 or not 1 <= mode <= 8 or encoder not in ('cpu', 'gpu'):
+        if invalid:
+            print(f"错误: {invalid}")
+        print("用法: python merge_videos.py <视频文件夹> [选项]")
+        print("      不带参数运行时进入交互模式")
+        print("\n选项:")
+        print("  --mode=N          合并模式 1-8 (默认 1 快速合并，各模式说明见交互模式)")
+        print("  --output=文件名   输出文件名，保存在视频文件夹中 (默认 merged_output.mp4，")
+        print("                    模式 8 默认 merged_output.ts)，- 表示标准输出")
+        print("  --jobs=N          模式 2/3 同时转换的文件数")
+        print("  --encoder=cpu|gpu 模式 7 使用的编码器")
+        print("  --speed=N         模式 2/7 的目标编码速度 (相对实时的倍数)，先试编码再选择预设")
+        print("  --max-bitrate=N   模式 2/7 试编码选择预设时的码率上限 (kbits/s)")
+        print("  --codecs=列表     模式 2/7 试编码时可选择的编码器，逗号分隔 (默认 libx264)，")
+        print("                    例如 libx264,libx265")
+        print("  --profile=plain|faststart|fragmented  MP4 输出格式")
+        print("  --burn-subtitles[=语言]  模式 2/3/4/6/7 在合并编码时烧录各视频的外挂字幕，")
+        print("                    可指定语言后缀，例如 --burn-subtitles=zh 使用 video.zh.srt")
+        print("  --overwrite       输出文件已存在时覆盖")
+        return 1
+    
+    directory = args[0]
+    if not os.path.isdir(directory):
+        print(f"❌ 错误：不是有效的文件夹 - {directory}")
+        return 1
+    if output_name == STDOUT_OUTPUT:
+        # 视频数据写到标准输出，提示信息改为写到标准错误
+        use_stdout_for_data()
+    
+    success = merge_videos(directory, mode, jobs, encoder, output_name, overwrite=overwrite,
+                           target_speed=target_speed, output_profile=output_profile,
+                           burn_subtitles=burn_subtitles, subtitle_language=subtitle_language,
+                           max_bitrate=max_bitrate, codecs=codecs)
+    return 0 if success else 1
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        sys.exit(run_cli(sys.argv[1:]))
     main()
@@ -0,0 +1,106 @@
+"""MP4 输出格式（所有工具共用）
+
+- plain: ffmpeg 默认格式，文件索引 (moov) 写在文件末尾，网页播放器要先读到末尾才能播放
+- faststart: 写完后由同一个 ffmpeg 进程把 moov 移到文件开头，不需要再单独处理一遍
+- fragmented: 分片 MP4，边编码边写出可播放的片段，可以直接输出到标准输出或管道
+
+输出文件为 '-' 时写到标准输出（强制使用 fragmented），程序自身的提示信息改为写到
+标准错误，避免混进视频数据。也可以用环境变量 VIDEO_TRIMMER_OUTPUT_PROFILE 设置
+默认格式。
+"""
+
+import os
+import sys
+import stat
+import subprocess
+
+PROFILES = {
+    'plain': [],
+    'faststart': ['-movflags', '+faststart'],
+    'fragmented': ['-movflags', '+frag_keyframe+empty_moov+default_base_moof'],
+}
+
+DEFAULT_PROFILE = os.environ.get('VIDEO_TRIMMER_OUTPUT_PROFILE') or 'plain'
+
+# 表示标准输出的输出文件名
+STDOUT_OUTPUT = '-'
+
+# 这些扩展名的输出才使用 MP4 的 movflags
+MP4_EXTENSIONS = ('.mp4', '.m4v', '.mov')
+
+# 标准输出被视频数据占用后，原来的二进制标准输出
+_data_stdout = None
+
+
+def is_stream_output(output_file):
+    """输出是否为标准输出或命名管道（不能先写临时文件再重命名）"""
+    if output_file == STDOUT_OUTPUT:
+        return True
+    try:
+        return stat.S_ISFIFO(os.stat(output_file).st_mode)
+    except (OSError, TypeError, ValueError):
+        return False
+
+
+def use_stdout_for_data():
+    """把标准输出留给视频数据，之后的 print 都写到标准错误"""
+    global _data_stdout
+    if _data_stdout is None:
+        sys.stdout.flush()
+        _data_stdout = sys.stdout.buffer
+        sys.stdout = sys.stderr
+    return _data_stdout
+
+
+def resolve_profile(output_file, profile=None):
+    """
+    确定实际使用的输出格式: 未指定时使用默认格式，流式输出强制使用 fragmented
+
+    返回:
+        PROFILES 中的名称
+    """
+    profile = profile or DEFAULT_PROFILE
+    if profile not in PROFILES:
+        raise ValueError(f"未知的输出格式: {profile} (可选: {', '.join(PROFILES)})")
+    if is_stream_output(output_file) and profile != 'fragmented':
+        if profile == 'faststart':
+            print("注意: 输出到管道时无法把索引移到开头，改用分片格式")
+        profile = 'fragmented'
+    return profile
+
+
+def output_args(output_file, profile=None):
+    """
+    写最终输出时放在输出文件名之前的参数
+
+    参数:
+        output_file: 最终输出文件（可以是 partial_path 生成的临时文件，扩展名不变）
+        profile: 输出格式，None 表示默认格式
+
+    返回:
+        参数列表，非 MP4 输出（例如 .ts）为空列表
+    """
+    profile = resolve_profile(output_file, profile)
+    if output_file == STDOUT_OUTPUT:
+        return ['-f', 'mp4'] + PROFILES[profile]
+    if not output_file.lower().endswith(MP4_EXTENSIONS):
+        return []
+    args = list(PROFILES[profile])
+    if is_stream_output(output_file):
+        # 命名管道没有扩展名时也按 MP4 输出
+        args = ['-f', 'mp4'] + args
+    return args
+
+
+def output_target(output_file, profile=None):
+    """
+    最终输出在 ffmpeg 命令中的写法
+
+    返回:
+        (放在命令末尾的参数列表, 传给 run_ffmpeg 的 stdout)
+        输出到标准输出时 ffmpeg 写入 pipe:1，stdout 为原来的标准输出
+    """
+    args = output_args(output_file, profile)
+    if output_file == STDOUT_OUTPUT:
+        return args + ['pipe:1'], use_stdout_for_data()
+    return args + [output_file], subprocess.DEVNULL
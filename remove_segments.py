@@ -1,30 +1,26 @@
 import os
 import sys
+import json
+import hashlib
 import subprocess
-import re
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 
-def parse_time(time_str):
-    """
-    解析时间字符串为秒数
-    支持格式: HH:MM:SS, MM:SS, SS
-    
-    参数:
-        time_str: 时间字符串，例如 "1:30", "1:30:45"
-    
-    返回:
-        秒数（浮点数）
-    """
-    parts = time_str.strip().split(':')
-    parts = [float(p) for p in parts]
-    
-    if len(parts) == 1:  # SS
-        return parts[0]
-    elif len(parts) == 2:  # MM:SS
-        return parts[0] * 60 + parts[1]
-    elif len(parts) == 3:  # HH:MM:SS
-        return parts[0] * 3600 + parts[1] * 60 + parts[2]
-    else:
-        raise ValueError(f"无效的时间格式: {time_str}")
+from batch_scheduler import make_job, run_batch, DEFAULT_IO_WORKERS, DEFAULT_CPU_WORKERS
+from cut_list import (
+    parse_time, merge_intervals, compute_keep_segments, batch_keep_segments,
+    load_cut_list, is_cut_list_file,
+)
+from ffmpeg_runner import run_ffmpeg
+from job_journal import (
+    partial_path, commit_output, discard_partial, is_partial_file,
+    journal_path_for, load_journal, input_identity, is_completed, journal_outputs, run_journaled,
+)
+from media_probe import get_video_duration, probe_many
+from output_profile import PROFILES, DEFAULT_PROFILE, STDOUT_OUTPUT, output_target, use_stdout_for_data
+from smart_cut import smart_cut
+from subtitles import retime_sidecars
 
 def parse_segments(segments_str):
     """
@@ -57,88 +53,146 @@ def parse_segments(segments_str):
     segments.sort(key=lambda x: x[0])
     return segments
 
-def get_video_duration(video_file):
+def load_remove_segments(segments, fps=None):
     """
-    获取视频时长（秒）
+    读取要删除的时间段，并合并重叠部分
     
     参数:
-        video_file: 视频文件路径
+        segments: 时间段字符串（例如 "1:00-2:00,5:00-6:00"）、
+                  剪切列表文件（.csv / .json / .edl）或时间段列表
+        fps: CMX3600 EDL 时间码的帧率，None 表示按文件中的 FCM 标记判断
     
     返回:
-        视频时长（秒）
+        合并后的时间段列表
     """
-    cmd = [
-        'ffprobe', '-v', 'error',
-        '-show_entries', 'format=duration',
-        '-of', 'default=noprint_wrappers=1:nokey=1',
-        video_file
-    ]
+    if isinstance(segments, (list, tuple)):
+        return merge_intervals(segments)
+    if is_cut_list_file(segments):
+        return merge_intervals(load_cut_list(segments, fps))
+    return merge_intervals(parse_segments(segments))
+
+def print_segments(title, segments, limit=20):
+    """打印时间段列表，数量过多时只显示前 limit 个"""
+    print(f"\n{title} (共 {len(segments)} 个):")
+    for start, end in segments[:limit]:
+        print(f"  {start:.2f}s - {end:.2f}s ({start/60:.2f}min - {end/60:.2f}min)")
+    if len(segments) > limit:
+        print(f"  ... 省略其余 {len(segments) - limit} 个")
+
+def build_concat_script(input_file, keep_segments):
+    """
+    生成 concat demuxer 脚本，用 inpoint/outpoint 直接引用源文件中的保留段
     
-    try:
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        return float(result.stdout.strip())
-    except Exception as e:
-        print(f"获取视频时长失败: {e}")
-        return None
+    参数:
+        input_file: 输入视频文件
+        keep_segments: 要保留的时间段列表 [(start, end), ...]
+    
+    返回:
+        脚本内容字符串
+    """
+    # 脚本通过管道传给 ffmpeg，必须使用绝对路径
+    path = os.path.abspath(input_file).replace("\\", "/").replace("'", "'\\''")
+    lines = ["ffconcat version 1.0"]
+    for start, end in keep_segments:
+        lines.append(f"file '{path}'")
+        lines.append(f"inpoint {start:.6f}")
+        lines.append(f"outpoint {end:.6f}")
+    return '\n'.join(lines) + '\n'
 
-def calculate_keep_segments(remove_segments, duration):
+def extract_segment(input_file, start, end, temp_file):
     """
-    根据要删除的时间段，计算要保留的时间段
+    提取单个保留段到临时文件（流复制）
     
     参数:
-        remove_segments: 要删除的时间段列表 [(start, end), ...]
-        duration: 视频总时长
+        input_file: 输入视频文件
+        start: 开始时间（秒）
+        end: 结束时间（秒）
+        temp_file: 输出的临时片段文件
     
     返回:
-        要保留的时间段列表 [(start, end), ...]
+        temp_file
+    """
+    cmd = [
+        'ffmpeg', '-i', input_file,
+        '-ss', str(start),
+        '-t', str(end - start),
+        '-c', 'copy',
+        '-y',
+        temp_file
+    ]
+    run_ffmpeg(cmd, label=f"片段 {start:.0f}s-{end:.0f}s", duration=end - start, check=True)
+    return temp_file
+
+def default_output_file(input_file, output_dir=None):
     """
-    keep_segments = []
-    current_time = 0
+    默认输出文件
     
-    for start, end in remove_segments:
-        # 添加删除段之前的保留段
-        if current_time < start:
-            keep_segments.append((current_time, start))
-        current_time = max(current_time, end)
+    参数:
+        input_file: 输入视频文件
+        output_dir: 输出文件夹
     
-    # 添加最后一个保留段
-    if current_time < duration:
-        keep_segments.append((current_time, duration))
+    返回:
+        指定了输出文件夹时为 输出文件夹/原文件名.mp4，
+        否则为原文件旁的 原文件名_processed.mp4（原文件保留）
+    """
+    base_name = os.path.splitext(os.path.basename(input_file))[0]
+    if output_dir:
+        return os.path.join(output_dir, f"{base_name}.mp4")
+    input_dir = os.path.dirname(input_file) if os.path.dirname(input_file) else '.'
+    return os.path.join(input_dir, f"{base_name}_processed.mp4")
+
+def finish_output(write_file, output_file, input_file, keep_original, keep_segments=None):
+    """
+    输出成功后的收尾：把写完的临时文件原子重命名为输出文件
     
-    return keep_segments
+    参数:
+        write_file: ffmpeg 实际写入的临时文件
+        output_file: 最终输出文件
+        input_file: 输入视频文件
+        keep_original: 输出是否写在原文件旁（原文件保留）
+        keep_segments: 保留段，提供时按它调整原视频旁外挂字幕的时间并写到输出文件旁
+    """
+    commit_output(write_file, output_file)
+    print(f"\n视频处理成功! 输出文件: {output_file}")
+    if keep_original:
+        print(f"原始文件已保留: {input_file}")
+    if keep_segments:
+        retime_sidecars(input_file, output_file, keep_segments)
 
-def remove_video_segments(input_file, remove_segments_str, output_file=None, output_dir=None):
+def remove_video_segments(input_file, remove_segments_str, output_file=None, output_dir=None,
+                          cut_mode='copy', workers=1, min_keep=0.0, keep_segments=None, profile=None,
+                          subtitles=True):
     """
     删除视频中的指定时间段并合并剩余部分
     
     参数:
         input_file: 输入视频文件
-        remove_segments_str: 要删除的时间段字符串，例如 "1:00-2:00,5:00-6:00"
-        output_file: 输出文件名，默认为 input_trimmed.mp4
+        remove_segments_str: 要删除的时间段字符串，例如 "1:00-2:00,5:00-6:00"，
+                             也可以是剪切列表文件 (.csv / .json / .edl) 或时间段列表
+        output_file: 输出文件名，默认为 input_trimmed.mp4，'-' 表示输出到标准输出
         output_dir: 输出文件夹，默认为输入文件所在文件夹
+        cut_mode: 'copy' 直接复制流（剪切点落在关键帧上）；
+                  'smart' 智能裁剪（只重编码剪切点附近的不完整 GOP，帧级精确）；
+                  'single_pass' 单进程直接从源文件拼接保留段，不生成中间文件
+        workers: 'copy' 模式下并行提取保留段的进程数
+        min_keep: 短于该时长（秒）的保留段会被并入删除段
+        keep_segments: 已计算好的保留段（批处理时由 batch_keep_segments 预先计算），
+                       提供时忽略 remove_segments_str
+        profile: MP4 输出格式 ('plain' / 'faststart' / 'fragmented')，None 表示默认格式
+        subtitles: 是否同时调整视频旁同名外挂字幕 (.srt / .vtt / .ass) 的时间
     """
     # 检查输入文件
     if not os.path.exists(input_file):
         print(f"错误: 文件 '{input_file}' 不存在")
         return False
     
-    # 设置输出文件名
-    base_name = os.path.splitext(os.path.basename(input_file))[0]
-    input_dir = os.path.dirname(input_file) if os.path.dirname(input_file) else '.'
-    
-    # 标记是否需要替换原文件
-    replace_original = False
-    
+    # 设置输出文件名，没有指定输出文件夹时输出到原文件旁并保留原文件
+    keep_original = output_file is None and not output_dir
     if output_file is None:
-        if output_dir:
-            # 指定了输出文件夹，直接输出
-            output_file = os.path.join(output_dir, f"{base_name}.mp4")
-        else:
-            # 没有指定输出文件夹，使用临时文件，稍后替换原文件
-            import tempfile
-            temp_fd, output_file = tempfile.mkstemp(suffix='.mp4', dir=input_dir)
-            os.close(temp_fd)
-            replace_original = True
+        output_file = default_output_file(input_file, output_dir)
+    
+    # 先写入临时文件，完成后再重命名，中途中断不会留下不完整的输出文件
+    write_file = partial_path(output_file)
     
     # 创建输出文件夹
     output_dir = os.path.dirname(output_file)
@@ -146,149 +200,207 @@ def remove_video_segments(input_file, remove_segments_str, output_file=None, out
         os.makedirs(output_dir)
         print(f"已创建输出文件夹: {output_dir}")
     
-    # 解析要删除的时间段
-    try:
-        remove_segments = parse_segments(remove_segments_str)
-    except Exception as e:
-        print(f"解析时间段失败: {e}")
-        return False
-    
-    if not remove_segments:
-        print("错误: 没有有效的时间段需要删除")
-        return False
-    
-    print(f"\n要删除的时间段:")
-    for start, end in remove_segments:
-        print(f"  {start:.2f}s - {end:.2f}s ({start/60:.2f}min - {end/60:.2f}min)")
+    if keep_segments is None:
+        # 解析要删除的时间段
+        try:
+            remove_segments = load_remove_segments(remove_segments_str)
+        except Exception as e:
+            print(f"解析时间段失败: {e}")
+            return False
+        
+        if not remove_segments:
+            print("错误: 没有有效的时间段需要删除")
+            return False
+        
+        print_segments("要删除的时间段", remove_segments)
+        
+        # 获取视频时长
+        duration = get_video_duration(input_file)
+        if duration is None:
+            return False
+        
+        print(f"\n视频总时长: {duration:.2f}s ({duration/60:.2f}min)")
+        
+        # 计算要保留的时间段
+        keep_segments = compute_keep_segments(remove_segments, duration, min_keep)
     
-    # 获取视频时长
-    duration = get_video_duration(input_file)
-    if duration is None:
+    if not keep_segments:
+        print("错误: 删除所有时间段后没有剩余内容")
         return False
     
-    print(f"\n视频总时长: {duration:.2f}s ({duration/60:.2f}min)")
-    
-    # 计算要保留的时间段
-    keep_segments = calculate_keep_segments(remove_segments, duration)
+    print_segments("要保留的时间段", keep_segments)
+    keep_duration = sum(end - start for start, end in keep_segments)
+    sidecar_segments = keep_segments if subtitles else None
     
-    if not keep_segments:
-        print("错误: 删除所有时间段后没有剩余内容")
+    # 智能裁剪：复制完整 GOP，只重编码剪切点附近的片段
+    if cut_mode == 'smart':
+        if smart_cut(input_file, keep_segments, write_file, profile):
+            finish_output(write_file, output_file, input_file, keep_original, sidecar_segments)
+            return True
+        discard_partial(write_file)
         return False
     
-    print(f"\n要保留的时间段:")
-    for start, end in keep_segments:
-        print(f"  {start:.2f}s - {end:.2f}s ({start/60:.2f}min - {end/60:.2f}min)")
+    # 单进程模式：一个 concat 脚本描述所有保留段，数据从源文件直接流向输出文件
+    if cut_mode == 'single_pass':
+        target_args, stdout = output_target(write_file, profile)
+        cmd = [
+            'ffmpeg', '-y', '-f', 'concat', '-safe', '0',
+            '-i', 'pipe:0',
+            '-map', '0', '-c', 'copy',
+        ] + target_args
+        
+        print(f"\n单进程拼接 {len(keep_segments)} 个保留段...")
+        try:
+            run_ffmpeg(cmd, label=os.path.basename(input_file), duration=keep_duration,
+                       input_data=build_concat_script(input_file, keep_segments), check=True,
+                       stdout=stdout)
+            finish_output(write_file, output_file, input_file, keep_original, sidecar_segments)
+            return True
+        except subprocess.CalledProcessError as e:
+            print(f"视频处理失败: {e}")
+            discard_partial(write_file)
+            return False
+        except FileNotFoundError:
+            print("错误: 未找到 ffmpeg，请确保已安装 ffmpeg 并添加到系统 PATH")
+            return False
     
     # 如果只有一个保留段，直接裁剪
     if len(keep_segments) == 1:
         start, end = keep_segments[0]
         duration_seg = end - start
         
+        target_args, stdout = output_target(write_file, profile)
         cmd = [
             'ffmpeg', '-y', '-i', input_file,
             '-ss', str(start),
             '-t', str(duration_seg),
             '-c', 'copy',
-            output_file
-        ]
+        ] + target_args
         
         print(f"\n执行命令: {' '.join(cmd)}")
         try:
-            subprocess.run(cmd, check=True)
-            
-            # 如果需要替换原文件
-            if replace_original:
-                final_output = os.path.join(input_dir, f"{base_name}_processed.mp4")
-                # 不删除原文件，直接重命名输出文件
-                # if os.path.exists(input_file):
-                #     os.remove(input_file)
-                os.rename(output_file, final_output)
-                print(f"\n视频处理成功! 输出文件: {final_output}")
-                print(f"原始文件已保留: {input_file}")
-            else:
-                print(f"\n视频处理成功! 输出文件: {output_file}")
+            run_ffmpeg(cmd, label=os.path.basename(input_file), duration=duration_seg, check=True,
+                       stdout=stdout)
+            finish_output(write_file, output_file, input_file, keep_original, sidecar_segments)
             return True
         except subprocess.CalledProcessError as e:
             print(f"视频处理失败: {e}")
-            if replace_original and os.path.exists(output_file):
-                os.remove(output_file)
+            discard_partial(write_file)
+            return False
+        except FileNotFoundError:
+            print("错误: 未找到 ffmpeg，请确保已安装 ffmpeg 并添加到系统 PATH")
             return False
     
     # 多个保留段，需要分别提取然后合并
-    temp_dir = 'trimmed'
-    if not os.path.exists(temp_dir):
-        os.makedirs(temp_dir)
-    
-    temp_files = []
-    list_file = 'segments_list.txt'
+    # 每个任务使用独立的临时文件夹，同一目录下的多个任务互不干扰
+    temp_dir = tempfile.mkdtemp(prefix='segments_', dir=os.path.dirname(output_file) or '.')
+    list_file = os.path.join(temp_dir, 'segments_list.txt')
+    workers = max(1, min(workers, len(keep_segments)))
     
     try:
         # 提取每个保留段
-        print(f"\n开始提取视频片段...")
-        for i, (start, end) in enumerate(keep_segments):
-            temp_file = os.path.join(temp_dir, f"segment_{i:03d}.mp4")
-            duration_seg = end - start
-            
-            cmd = [
-                'ffmpeg', '-i', input_file,
-                '-ss', str(start),
-                '-t', str(duration_seg),
-                '-c', 'copy',
-                '-y',
-                temp_file
-            ]
-            
-            print(f"  提取片段 {i+1}/{len(keep_segments)}: {start:.2f}s - {end:.2f}s")
-            subprocess.run(cmd, check=True, capture_output=True)
-            temp_files.append(temp_file)
+        print(f"\n开始提取视频片段... (并行数: {workers})")
+        temp_files = [os.path.join(temp_dir, f"segment_{i:03d}.mp4") for i in range(len(keep_segments))]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = []
+            for i, (start, end) in enumerate(keep_segments):
+                print(f"  提取片段 {i+1}/{len(keep_segments)}: {start:.2f}s - {end:.2f}s")
+                futures.append(executor.submit(extract_segment, input_file, start, end, temp_files[i]))
+            try:
+                for future in futures:
+                    future.result()
+            except Exception:
+                # 一个片段失败，取消尚未开始的片段
+                for future in futures:
+                    future.cancel()
+                raise
         
-        # 创建合并列表文件
+        # 创建合并列表文件，按片段序号排列
         with open(list_file, 'w', encoding='utf-8') as f:
             for temp_file in temp_files:
-                f.write(f"file '{temp_file}'\n")
+                f.write(f"file '{os.path.basename(temp_file)}'\n")
         
         # 合并所有片段
         print(f"\n开始合并视频片段...")
+        target_args, stdout = output_target(write_file, profile)
         cmd = [
             'ffmpeg', '-y', '-f', 'concat', '-safe', '0',
             '-i', list_file,
             '-c', 'copy',
-            output_file
-        ]
+        ] + target_args
         
-        subprocess.run(cmd, check=True)
-        
-        # 如果需要替换原文件
-        if replace_original:
-            final_output = os.path.join(input_dir, f"{base_name}_processed.mp4")
-            # 不删除原文件，直接重命名输出文件
-            # if os.path.exists(input_file):
-            #     os.remove(input_file)
-            os.rename(output_file, final_output)
-            print(f"\n视频处理成功! 输出文件: {final_output}")
-            print(f"原始文件已保留: {input_file}")
-        else:
-            print(f"\n视频处理成功! 输出文件: {output_file}")
+        run_ffmpeg(cmd, label="合并", duration=keep_duration, check=True, stdout=stdout)
+        finish_output(write_file, output_file, input_file, keep_original, sidecar_segments)
         return True
         
     except subprocess.CalledProcessError as e:
         print(f"视频处理失败: {e}")
+        discard_partial(write_file)
         return False
     except FileNotFoundError:
         print("错误: 未找到 ffmpeg，请确保已安装 ffmpeg 并添加到系统 PATH")
         return False
     finally:
         # 清理临时文件
-        for temp_file in temp_files:
-            if os.path.exists(temp_file):
-                os.remove(temp_file)
-        if os.path.exists(list_file):
-            os.remove(list_file)
+        shutil.rmtree(temp_dir, ignore_errors=True)
         print(f"已清理临时文件")
 
-if __name__ == '__main__':
-    if len(sys.argv) < 3:
-        print("用法: python remove_segments.py <输入视频/文件夹> <删除时间段> [输出文件/文件夹]")
+def run_cli(argv):
+    """
+    命令行删除片段（单个文件或批量处理文件夹），任务服务器也在常驻进程中直接调用
+    
+    返回:
+        退出码，成功为 0
+    """
+    # 分离可选参数
+    cut_mode = 'copy'
+    workers = 1
+    io_jobs = DEFAULT_IO_WORKERS
+    cpu_jobs = DEFAULT_CPU_WORKERS
+    resume = True
+    min_keep = 0.0
+    fps = None
+    profile = None
+    subtitles = True
+    args = []
+    invalid = None
+    for arg in argv:
+        try:
+            if arg == '--smart':
+                cut_mode = 'smart'
+            elif arg == '--no-subtitles':
+                subtitles = False
+            elif arg.startswith('--profile='):
+                profile = arg.split('=', 1)[1]
+            elif arg.startswith('--jobs='):
+                io_jobs = int(arg.split('=', 1)[1])
+            elif arg.startswith('--cpu-jobs='):
+                cpu_jobs = int(arg.split('=', 1)[1])
+            elif arg == '--no-resume':
+                resume = False
+            elif arg == '--single-pass':
+                cut_mode = 'single_pass'
+            elif arg.startswith('--workers='):
+                workers = int(arg.split('=', 1)[1])
+            elif arg.startswith('--min-keep='):
+                min_keep = parse_time(arg.split('=', 1)[1])
+            elif arg.startswith('--fps='):
+                fps = float(arg.split('=', 1)[1])
+            else:
+                args.append(arg)
+        except ValueError:
+            invalid = invalid or f"无效的参数值: {arg}"
+    if invalid is None and min(workers, io_jobs, cpu_jobs) < 1:
+        invalid = "--workers / --jobs / --cpu-jobs 必须大于 0"
+    elif invalid is None and min_keep < 0:
+        invalid = "--min-keep 不能为负数"
+    elif invalid is None and fps is not None and fps <= 0:
+        invalid = "--fps 必须大于 0"
+    
+    if invalid or len(args) < 2:
+        if invalid:
+            print(f"错误: {invalid}")
+        print("用法: python remove_segments.py <输入视频/文件夹> <删除时间段> [输出文件/文件夹] [--smart | --single-pass] [--workers=N]")
         print("\n示例:")
         print("  # 处理单个文件，输出到同一文件夹")
         print("  python remove_segments.py video.mp4 \"1:00-2:00,5:00-6:00\"")
@@ -301,20 +413,64 @@ if __name__ == '__main__':
         print()
         print("  # 批量处理并指定输出文件夹")
         print("  python remove_segments.py video_folder \"1:00-2:00,5:00-6:00\" output_folder")
+        print()
+        print("  # 智能裁剪（只重编码剪切点附近的画面，帧级精确）")
+        print("  python remove_segments.py video.mp4 \"1:00-2:00,5:00-6:00\" --smart")
+        print()
+        print("  # 单进程直接拼接（不生成中间片段文件）")
+        print("  python remove_segments.py video.mp4 \"1:00-2:00,5:00-6:00\" --single-pass")
+        print()
+        print("  # 用 4 个进程并行提取保留段")
+        print("  python remove_segments.py video.mp4 \"1:00-2:00,5:00-6:00\" --workers=4")
+        print()
+        print("  # 从剪切列表文件读取删除时间段 (.csv / .json / .edl)，丢弃短于 2 秒的保留段")
+        print("  python remove_segments.py video.mp4 cuts.csv --min-keep=2")
+        print()
+        print("  # 输出分片 MP4 到标准输出")
+        print("  python remove_segments.py video.mp4 \"1:00-2:00\" - --single-pass | other_program")
+        print("\n输出格式:")
+        print("  --profile=plain|faststart|fragmented  MP4 输出格式 (默认 plain)，输出文件为 - 时强制使用 fragmented")
+        print("\n字幕:")
+        print("  视频旁的同名字幕 (video.srt / video.en.ass 等) 会按保留的时间段调整后写到输出文件旁")
+        print("  --no-subtitles  不处理外挂字幕")
+        print("\n剪切列表:")
+        print("  --fps=N         CMX3600 EDL 时间码的帧率 (例如 29.97、30)，默认 25，")
+        print("                  文件标记为 FCM: DROP FRAME 时为 29.97")
+        print("\n批量处理选项:")
+        print(f"  --jobs=N      流复制任务的并发数 (默认 {DEFAULT_IO_WORKERS})")
+        print(f"  --cpu-jobs=N  重编码任务的并发数 (默认 {DEFAULT_CPU_WORKERS})")
+        print("  --no-resume   忽略断点续传日志，重新处理所有文件")
         print("\n时间格式支持:")
         print("  - HH:MM:SS (例如: 1:30:45)")
         print("  - MM:SS (例如: 1:30)")
         print("  - SS (例如: 90)")
-        sys.exit(1)
+        return 1
     
-    input_path = sys.argv[1]
-    remove_segments_str = sys.argv[2]
-    output_path = sys.argv[3] if len(sys.argv) > 3 else None
+    input_path = args[0]
+    remove_segments_str = args[1]
+    output_path = args[2] if len(args) > 2 else None
+    if fps is not None and is_cut_list_file(remove_segments_str):
+        # 按指定的帧率读取剪切列表，之后直接使用解析好的时间段
+        try:
+            remove_segments_str = load_remove_segments(remove_segments_str, fps)
+        except (OSError, ValueError) as e:
+            print(f"解析时间段失败: {e}")
+            return 1
+    
+    if profile is not None and profile not in PROFILES:
+        print(f"错误: 未知的输出格式 '{profile}' (可选: {', '.join(PROFILES)})")
+        return 1
+    if output_path == STDOUT_OUTPUT:
+        # 视频数据写到标准输出，提示信息改为写到标准错误
+        use_stdout_for_data()
     
     # 检查输入是文件还是文件夹
     if os.path.isfile(input_path):
         # 单个文件处理
-        remove_video_segments(input_path, remove_segments_str, output_path)
+        if not remove_video_segments(input_path, remove_segments_str, output_path, cut_mode=cut_mode,
+                                     workers=workers, min_keep=min_keep, profile=profile,
+                                     subtitles=subtitles):
+            return 1
     elif os.path.isdir(input_path):
         # 批量处理文件夹
         print(f"批量处理模式: 扫描文件夹 '{input_path}'")
@@ -325,12 +481,12 @@ if __name__ == '__main__':
         # 获取所有视频文件
         video_files = []
         for filename in os.listdir(input_path):
-            if filename.lower().endswith(video_extensions):
+            if filename.lower().endswith(video_extensions) and not is_partial_file(filename):
                 video_files.append(os.path.join(input_path, filename))
         
         if not video_files:
             print(f"错误: 文件夹 '{input_path}' 中没有找到视频文件")
-            sys.exit(1)
+            return 1
         
         video_files.sort()
         print(f"\n找到 {len(video_files)} 个视频文件:")
@@ -349,24 +505,71 @@ if __name__ == '__main__':
             # 默认输出到输入文件夹
             output_dir = input_path
         
-        print(f"\n开始批量处理...")
-        success_count = 0
-        fail_count = 0
+        # 删除列表只解析、合并一次，所有文件共用
+        try:
+            remove_segments = load_remove_segments(remove_segments_str)
+        except Exception as e:
+            print(f"解析时间段失败: {e}")
+            return 1
+        if not remove_segments:
+            print("错误: 没有有效的时间段需要删除")
+            return 1
+        print_segments("要删除的时间段", remove_segments)
         
-        for i, video_file in enumerate(video_files, 1):
-            print(f"\n{'='*60}")
-            print(f"处理 [{i}/{len(video_files)}]: {os.path.basename(video_file)}")
-            print(f"{'='*60}")
-            
-            if remove_video_segments(video_file, remove_segments_str, output_dir=output_dir):
-                success_count += 1
-            else:
-                fail_count += 1
+        # 断点续传: 跳过日志中已用相同参数完成的文件，以及上次运行的输出文件
+        journal_file = journal_path_for(output_dir)
+        journal = load_journal(journal_file) if resume else {}
+        previous_outputs = journal_outputs(journal)
+        segments_digest = hashlib.sha1(json.dumps(remove_segments).encode('utf-8')).hexdigest()
+        params = {'tool': 'remove_segments', 'segments': segments_digest, 'min_keep': min_keep,
+                  'cut_mode': cut_mode}
+        if (profile or DEFAULT_PROFILE) != 'plain':
+            params['profile'] = profile or DEFAULT_PROFILE
+        pending_files = []
+        skipped_count = 0
+        for video_file in video_files:
+            if os.path.abspath(video_file) in previous_outputs:
+                continue
+            if is_completed(journal, input_identity(video_file, params)):
+                skipped_count += 1
+                continue
+            pending_files.append(video_file)
+        if skipped_count:
+            print(f"\n跳过 {skipped_count} 个已完成的文件 (使用 --no-resume 重新处理)")
+        
+        # 一次性计算所有文件的保留段
+        durations = []
+        for info in probe_many(pending_files):
+            try:
+                durations.append(float(info['format']['duration']))
+            except (TypeError, KeyError, ValueError):
+                durations.append(None)
+        keep_lists = batch_keep_segments(remove_segments, durations, min_keep)
+        
+        print(f"\n开始批量处理...")
+        # 智能裁剪需要重编码，按 CPU 密集型任务调度
+        kind = 'cpu' if cut_mode == 'smart' else 'io'
+        jobs = [
+            make_job(
+                os.path.basename(video_file), run_journaled,
+                (journal_file, video_file, params, default_output_file(video_file, output_dir),
+                 remove_video_segments, video_file, remove_segments),
+                {'output_dir': output_dir, 'cut_mode': cut_mode, 'workers': workers,
+                 'min_keep': min_keep, 'keep_segments': keep_segments, 'profile': profile,
+                 'subtitles': subtitles},
+                kind=kind, input_file=video_file)
+            for video_file, keep_segments in zip(pending_files, keep_lists)
+        ]
+        success_count, fail_count = run_batch(jobs, io_workers=io_jobs, cpu_workers=cpu_jobs)
         
         print(f"\n{'='*60}")
         print(f"批量处理完成!")
-        print(f"成功: {success_count} 个, 失败: {fail_count} 个")
+        print(f"成功: {success_count} 个, 失败: {fail_count} 个, 跳过: {skipped_count} 个")
         print(f"{'='*60}")
     else:
         print(f"错误: 路径 '{input_path}' 不存在")
-        sys.exit(1)
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(run_cli(sys.argv[1:]))
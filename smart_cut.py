@@ -0,0 +1,204 @@
+"""关键帧感知的智能裁剪 (smart cut)
+
+保留片段内部的完整 GOP 直接复制流，只对剪切点两侧不完整的 GOP 重新编码，
+再用 concat demuxer 拼接为一个文件，实现帧级精确、接近流复制速度的裁剪。
+"""
+
+import os
+import bisect
+import shutil
+import subprocess
+import tempfile
+
+from ffmpeg_runner import run_ffmpeg
+from output_profile import output_target
+from media_probe import probe_media, get_stream
+
+# 源视频编码 -> 用于重编码边缘片段的编码器
+VIDEO_ENCODERS = {
+    'h264': 'libx264',
+    'hevc': 'libx265',
+    'mpeg4': 'mpeg4',
+}
+
+# 源音频编码 -> 用于重编码边缘片段的编码器
+AUDIO_ENCODERS = {
+    'aac': 'aac',
+    'mp3': 'libmp3lame',
+    'ac3': 'ac3',
+    'opus': 'libopus',
+}
+
+# ffprobe 报告的 H.264 profile -> libx264 的 profile 参数
+H264_PROFILES = {
+    'Constrained Baseline': 'baseline',
+    'Baseline': 'baseline',
+    'Main': 'main',
+    'High': 'high',
+}
+
+# 剪切点与关键帧之间小于该值（秒）时视为重合
+EPSILON = 0.001
+
+
+def plan_smart_cut(keep_segments, keyframes):
+    """
+    将保留片段拆分为「复制」和「重编码」两类子片段
+
+    参数:
+        keep_segments: 要保留的时间段列表 [(start, end), ...]
+        keyframes: 升序排列的关键帧时间列表
+
+    返回:
+        子片段列表 [('copy' 或 'encode', start, end), ...]
+    """
+    parts = []
+    for start, end in keep_segments:
+        # 片段内的第一个和最后一个关键帧
+        lo = bisect.bisect_left(keyframes, start - EPSILON)
+        hi = bisect.bisect_right(keyframes, end + EPSILON)
+        inner = keyframes[lo:hi]
+        if len(inner) < 2:
+            # 片段内不存在完整的 GOP，整段重编码
+            parts.append(('encode', start, end))
+            continue
+
+        first_key, last_key = inner[0], inner[-1]
+        if first_key - start > EPSILON:
+            parts.append(('encode', start, first_key))
+        parts.append(('copy', first_key, last_key))
+        if end - last_key > EPSILON:
+            parts.append(('encode', last_key, end))
+
+    return parts
+
+
+def build_encode_args(video_stream, audio_stream):
+    """
+    根据源流参数生成边缘片段的重编码参数，使其能与复制的片段无缝拼接
+
+    返回:
+        ffmpeg 参数列表，源编码不受支持时返回 None
+    """
+    codec = video_stream.get('codec_name')
+    encoder = VIDEO_ENCODERS.get(codec)
+    if encoder is None:
+        print(f"错误: 智能裁剪暂不支持视频编码 '{codec}'")
+        return None
+
+    args = ['-c:v', encoder]
+    if encoder in ('libx264', 'libx265'):
+        args += ['-crf', '18', '-preset', 'medium']
+    else:
+        args += ['-q:v', '2']
+    if video_stream.get('pix_fmt'):
+        args += ['-pix_fmt', video_stream['pix_fmt']]
+    profile = H264_PROFILES.get(video_stream.get('profile'))
+    if codec == 'h264' and profile:
+        args += ['-profile:v', profile]
+
+    if audio_stream is not None:
+        audio_codec = audio_stream.get('codec_name')
+        audio_encoder = AUDIO_ENCODERS.get(audio_codec)
+        if audio_encoder is None:
+            print(f"错误: 智能裁剪暂不支持音频编码 '{audio_codec}'")
+            return None
+        args += ['-c:a', audio_encoder]
+        if audio_stream.get('sample_rate'):
+            args += ['-ar', audio_stream['sample_rate']]
+        if audio_stream.get('channels'):
+            args += ['-ac', str(audio_stream['channels'])]
+        if audio_stream.get('bit_rate'):
+            args += ['-b:a', audio_stream['bit_rate']]
+
+    return args
+
+
+def smart_cut(input_file, keep_segments, output_file, profile=None):
+    """
+    智能裁剪：复制完整 GOP，只重编码剪切点两侧的不完整 GOP，再拼接输出
+
+    参数:
+        input_file: 输入视频文件
+        keep_segments: 要保留的时间段列表 [(start, end), ...]
+        output_file: 输出文件，'-' 表示标准输出
+        profile: MP4 输出格式 (output_profile.PROFILES)
+
+    返回:
+        成功返回 True，失败返回 False
+    """
+    info = probe_media(input_file, keyframes=True)
+    if info is None:
+        return False
+
+    video_stream = get_stream(info, 'video')
+    audio_stream = get_stream(info, 'audio')
+    if video_stream is None:
+        print("错误: 没有找到视频流")
+        return False
+
+    encode_args = build_encode_args(video_stream, audio_stream)
+    if encode_args is None:
+        return False
+
+    parts = plan_smart_cut(keep_segments, info['keyframes'])
+    copy_time = sum(end - start for kind, start, end in parts if kind == 'copy')
+    encode_time = sum(end - start for kind, start, end in parts if kind == 'encode')
+    print(f"\n智能裁剪: 复制 {copy_time:.2f}s, 重编码 {encode_time:.2f}s ({len(parts)} 个子片段)")
+
+    # 子片段统一封装为 MPEG-TS，保留每个关键帧前的参数集，拼接后解码器能正确切换
+    map_args = ['-map', '0:v:0', '-map', '0:a:0?']
+    output_dir = os.path.dirname(output_file) or '.'
+    temp_dir = tempfile.mkdtemp(prefix='smartcut_', dir=output_dir)
+
+    try:
+        part_files = []
+        for i, (kind, start, end) in enumerate(parts):
+            part_file = os.path.join(temp_dir, f"part_{i:03d}.ts")
+            if kind == 'copy':
+                # 输入端定位到关键帧，直接复制整段 GOP；时长略短于区间，
+                # 避免把下一段开头的关键帧也复制进来
+                cmd = [
+                    'ffmpeg', '-v', 'error', '-y',
+                    '-ss', f"{start + EPSILON:.6f}", '-i', input_file,
+                    '-t', f"{end - start - 2 * EPSILON:.6f}",
+                ] + map_args + ['-c', 'copy', part_file]
+            else:
+                cmd = [
+                    'ffmpeg', '-v', 'error', '-y',
+                    '-ss', f"{start:.6f}", '-i', input_file,
+                    '-t', f"{end - start:.6f}",
+                ] + map_args + encode_args + [part_file]
+
+            action = "复制" if kind == 'copy' else "重编码"
+            print(f"  [{i+1}/{len(parts)}] {action}: {start:.2f}s - {end:.2f}s")
+            run_ffmpeg(cmd, label=action, duration=end - start, check=True)
+            part_files.append(part_file)
+
+        list_file = os.path.join(temp_dir, 'parts.txt')
+        with open(list_file, 'w', encoding='utf-8') as f:
+            for part_file in part_files:
+                f.write(f"file '{os.path.basename(part_file)}'\n")
+
+        cmd = [
+            'ffmpeg', '-y', '-f', 'concat', '-safe', '0',
+            '-i', list_file,
+            '-map', '0', '-c', 'copy',
+        ]
+        if audio_stream is not None and audio_stream.get('codec_name') == 'aac':
+            cmd += ['-bsf:a', 'aac_adtstoasc']
+        target_args, stdout = output_target(output_file, profile)
+        cmd += target_args
+
+        print(f"\n开始拼接子片段...")
+        run_ffmpeg(cmd, label="拼接", duration=copy_time + encode_time, check=True, stdout=stdout)
+        return True
+
+    except subprocess.CalledProcessError as e:
+        print(f"智能裁剪失败: {e}")
+        return False
+    except FileNotFoundError:
+        print("错误: 未找到 ffmpeg，请确保已安装 ffmpeg 并添加到系统 PATH")
+        return False
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
@@ -1,77 +1,21 @@
 import sys
 import os
-import re
+
+from subtitles import convert_file, convert_tree, format_ass_time, parse_timing
 
 
 def parse_srt_time(time_str):
     """将SRT时间格式转换为ASS时间格式"""
     # SRT格式: 00:00:20,000 -> ASS格式: 0:00:20.00
-    time_str = time_str.replace(',', '.')
-    parts = time_str.split(':')
-    hours = int(parts[0])
-    minutes = parts[1]
-    seconds = parts[2]
-    return f"{hours}:{minutes}:{seconds[:-1]}"  # 去掉最后一位毫秒
+    start, _ = parse_timing(f"{time_str} --> {time_str}")
+    return format_ass_time(start)
 
 
 def srt_to_ass(srt_file, ass_file):
-    """将SRT字幕文件转换为ASS格式"""
-    
-    # ASS文件头部
-    ass_header = """[Script Info]
-Title: Converted from SRT
-ScriptType: v4.00+
-WrapStyle: 1
-PlayResX: 1920
-PlayResY: 1080
-ScaledBorderAndShadow: yes
-
-[V4+ Styles]
-Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding
-Style: Default,文泉驿正黑,48,&H00FFFFFF,&H000000FF,&H00000000,&H80000000,0,0,0,0,100,100,0,0,1,3,3,2,30,30,30,1
-
-[Events]
-Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
-"""
-    
-    try:
-        with open(srt_file, 'r', encoding='utf-8-sig') as f:
-            content = f.read()
-    except UnicodeDecodeError:
-        with open(srt_file, 'r', encoding='gbk') as f:
-            content = f.read()
+    """将SRT字幕文件转换为ASS格式（逐条读写，不把整个文件读入内存）"""
+    count = convert_file(srt_file, ass_file, 'srt', 'ass')
     
-    # 分割字幕块
-    subtitle_blocks = re.split(r'\n\s*\n', content.strip())
-    
-    dialogues = []
-    
-    for block in subtitle_blocks:
-        lines = block.strip().split('\n')
-        if len(lines) < 3:
-            continue
-        
-        # 解析时间轴
-        time_line = lines[1]
-        time_match = re.match(r'(\d{2}:\d{2}:\d{2},\d{3})\s*-->\s*(\d{2}:\d{2}:\d{2},\d{3})', time_line)
-        
-        if time_match:
-            start_time = parse_srt_time(time_match.group(1))
-            end_time = parse_srt_time(time_match.group(2))
-            
-            # 获取字幕文本（可能有多行）
-            text = '\\N'.join(lines[2:])
-            
-            # 创建ASS对话行
-            dialogue = f"Dialogue: 0,{start_time},{end_time},Default,,0,0,0,,{text}"
-            dialogues.append(dialogue)
-    
-    # 写入ASS文件
-    with open(ass_file, 'w', encoding='utf-8') as f:
-        f.write(ass_header)
-        f.write('\n'.join(dialogues))
-    
-    print(f"转换成功！")
+    print(f"转换成功！共 {count} 条字幕")
     print(f"输入文件: {srt_file}")
     print(f"输出文件: {ass_file}")
 
@@ -79,8 +23,19 @@ Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
 if __name__ == "__main__":
     if len(sys.argv) < 2:
         print("用法: python srt_to_ass.py <srt文件路径>")
+        print("      python srt_to_ass.py <文件夹>...   (转换文件夹及子文件夹中的所有 SRT 文件)")
         sys.exit(1)
     
+    # 文件夹或多个文件: 在进程池中批量转换
+    if len(sys.argv) > 2 or os.path.isdir(sys.argv[1]):
+        for path in sys.argv[1:]:
+            if not os.path.exists(path):
+                print(f"错误: 文件不存在 - {path}")
+                sys.exit(1)
+        success_count, fail_count, skipped = convert_tree(sys.argv[1:], 'ass', input_formats=('srt',))
+        print(f"转换完成: 成功 {success_count} 个, 失败 {fail_count} 个, 跳过 {skipped} 个 (已是最新)")
+        sys.exit(1 if fail_count else 0)
+    
     srt_file = sys.argv[1]
     
     if not os.path.exists(srt_file):
@@ -0,0 +1,707 @@
+"""字幕读写: SRT / WebVTT / ASS
+
+解析和输出都是逐行进行的生成器，内存占用与字幕文件大小无关。字幕统一表示为
+(开始毫秒, 结束毫秒, 文本) 的元组，文本用 '\\n' 换行，样式只保留 SRT 中常见的
+<i> / <b> / <u> 标签，输出为 ASS 时转换为 {\\i1} 等覆盖标签。
+
+批量转换时用进程池同时处理整个文件夹树，每个进程连续转换多个文件，避免每个文件
+都重新启动一次 Python。
+"""
+
+import os
+import re
+import sys
+import html
+import bisect
+import codecs
+from concurrent.futures import ProcessPoolExecutor
+
+from job_journal import partial_path, commit_output, discard_partial, is_partial_file
+from output_profile import is_stream_output
+
+FORMATS = ('srt', 'vtt', 'ass')
+
+# 与原 srt_to_ass 相同的 ASS 文件头
+ASS_HEADER = """[Script Info]
+Title: Converted from SRT
+ScriptType: v4.00+
+WrapStyle: 1
+PlayResX: 1920
+PlayResY: 1080
+ScaledBorderAndShadow: yes
+
+[V4+ Styles]
+Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding
+Style: Default,文泉驿正黑,48,&H00FFFFFF,&H000000FF,&H00000000,&H80000000,0,0,0,0,100,100,0,0,1,3,3,2,30,30,30,1
+
+[Events]
+Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
+"""
+
+# SRT 用逗号，WebVTT 用点，WebVTT 可以省略小时
+TIMESTAMP = r'(?:(\d+):)?(\d{1,2}):(\d{1,2})[,.](\d{1,3})'
+TIMING_RE = re.compile(TIMESTAMP + r'\s*-->\s*' + TIMESTAMP)
+ASS_TIME_RE = re.compile(r'(\d+):(\d{1,2}):(\d{1,2})[.:](\d{1,3})')
+
+# 保留的样式标签，其余标签（<font>、WebVTT 的 <c.class> / <v 说话人> / 时间标记）去掉
+STYLE_TAG_RE = re.compile(r'<(/?)([ibu])>', re.IGNORECASE)
+ANY_TAG_RE = re.compile(r'<[^>]*>')
+ASS_OVERRIDE_RE = re.compile(r'\{([^}]*)\}')
+ASS_STYLE_RE = re.compile(r'\\([ibu])(\d)')
+
+# 外挂字幕文件名中视频名和扩展名之间只允许语言标记，例如 en、zh、zh-Hans、pt-BR；
+# 这样 show.mp4 不会用到 show.ep2.mp4 的字幕 show.ep2.srt
+SIDECAR_LANGUAGE_RE = re.compile(r'[A-Za-z]{2,3}(-\w+)?')
+
+# 检测编码时每次读取的字节数
+ENCODING_CHUNK = 64 * 1024
+
+
+def detect_encoding(path):
+    """
+    逐块尝试按 UTF-8 解码，失败时按 GBK 读取（不把整个文件读入内存）
+
+    返回:
+        'utf-8-sig' 或 'gbk'
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    try:
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(ENCODING_CHUNK)
+                decoder.decode(chunk, final=not chunk)
+                if not chunk:
+                    break
+    except UnicodeDecodeError:
+        return 'gbk'
+    return 'utf-8-sig'
+
+
+def format_of(path):
+    """按扩展名判断字幕格式，不支持的格式返回 None"""
+    ext = os.path.splitext(path)[1].lower().lstrip('.')
+    return ext if ext in FORMATS else None
+
+
+def _timestamp_ms(hours, minutes, seconds, fraction):
+    # 小数部分按位数换算: ',5' 为 500 毫秒，'.05' 为 50 毫秒
+    return (((int(hours or 0) * 60 + int(minutes)) * 60 + int(seconds)) * 1000
+            + int(fraction.ljust(3, '0')[:3]))
+
+
+def parse_timing(line):
+    """
+    解析 SRT / WebVTT 时间行 '00:00:20,000 --> 00:00:22,500'
+
+    返回:
+        (开始毫秒, 结束毫秒)，不是时间行时返回 None
+    """
+    match = TIMING_RE.search(line)
+    if match is None:
+        return None
+    groups = match.groups()
+    return _timestamp_ms(*groups[:4]), _timestamp_ms(*groups[4:])
+
+
+def _parse_blocks(lines, vtt=False):
+    """SRT 和 WebVTT 共用的解析: 以时间行为准，不依赖序号行和空行位置"""
+    timing = None
+    text = []
+    skipping = False
+    for line in lines:
+        line = line.rstrip('\r\n')
+        if not line.strip():
+            if timing:
+                yield timing[0], timing[1], '\n'.join(text)
+            timing = None
+            text = []
+            skipping = False
+            continue
+        if skipping:
+            continue
+
+        found = parse_timing(line)
+        if found:
+            if timing:
+                # 缺少空行分隔时，上一条字幕的最后一行可能是下一条的序号
+                if text and text[-1].strip().isdigit():
+                    text.pop()
+                yield timing[0], timing[1], '\n'.join(text)
+            timing = found
+            text = []
+        elif timing:
+            text.append(line)
+        elif vtt and line.split(None, 1)[0] in ('WEBVTT', 'NOTE', 'STYLE', 'REGION'):
+            # 文件头、注释和样式块
+            skipping = True
+    if timing:
+        yield timing[0], timing[1], '\n'.join(text)
+
+
+def _keep_style_tag(match):
+    return match.group(0).lower() if STYLE_TAG_RE.fullmatch(match.group(0)) else ''
+
+
+def _clean_vtt_text(text):
+    # 先还原转义再处理标签会把 &lt;i&gt; 当成标签，所以逐段处理
+    parts = []
+    last = 0
+    for match in ANY_TAG_RE.finditer(text):
+        parts.append(html.unescape(text[last:match.start()]))
+        parts.append(_keep_style_tag(match))
+        last = match.end()
+    parts.append(html.unescape(text[last:]))
+    return ''.join(parts)
+
+
+def parse_srt(lines):
+    """逐条生成 SRT 字幕 (开始毫秒, 结束毫秒, 文本)"""
+    yield from _parse_blocks(lines)
+
+
+def parse_vtt(lines):
+    """逐条生成 WebVTT 字幕，去掉 <c> / <v> 等标签并还原 &amp; 等转义"""
+    for start, end, text in _parse_blocks(lines, vtt=True):
+        yield start, end, _clean_vtt_text(text)
+
+
+def _ass_style_tags(match):
+    tags = []
+    for name, value in ASS_STYLE_RE.findall(match.group(1)):
+        tags.append(f"<{name}>" if value != '0' else f"</{name}>")
+    return ''.join(tags)
+
+
+def parse_ass(lines):
+    """逐条生成 ASS 的 Dialogue 行，按 [Events] 中的 Format 确定字段位置"""
+    in_events = False
+    fields = ['Layer', 'Start', 'End', 'Style', 'Name', 'MarginL', 'MarginR', 'MarginV', 'Effect', 'Text']
+    for line in lines:
+        line = line.strip()
+        if line.startswith('['):
+            in_events = line.lower() == '[events]'
+            continue
+        if not in_events:
+            continue
+        key, _, value = line.partition(':')
+        if key == 'Format':
+            fields = [field.strip() for field in value.split(',')]
+        elif key == 'Dialogue':
+            values = value.lstrip().split(',', len(fields) - 1)
+            if len(values) != len(fields):
+                continue
+            event = dict(zip(fields, values))
+            start = ASS_TIME_RE.match(event.get('Start', '').strip())
+            end = ASS_TIME_RE.match(event.get('End', '').strip())
+            if not start or not end:
+                continue
+            text = ASS_OVERRIDE_RE.sub(_ass_style_tags, event.get('Text', ''))
+            text = text.replace('\\N', '\n').replace('\\n', '\n').replace('\\h', '\u00a0')
+            yield _timestamp_ms(*start.groups()), _timestamp_ms(*end.groups()), text
+
+
+PARSERS = {'srt': parse_srt, 'vtt': parse_vtt, 'ass': parse_ass}
+
+
+def read_cues(path, subtitle_format=None):
+    """
+    逐条读取字幕文件
+
+    参数:
+        path: 字幕文件
+        subtitle_format: 'srt' / 'vtt' / 'ass'，默认按扩展名判断
+    """
+    subtitle_format = subtitle_format or format_of(path)
+    if subtitle_format not in PARSERS:
+        raise ValueError(f"不支持的字幕格式: {path}")
+    with open(path, 'r', encoding=detect_encoding(path), newline='') as f:
+        yield from PARSERS[subtitle_format](f)
+
+
+def format_srt_time(ms):
+    hours, ms = divmod(ms, 3600000)
+    minutes, ms = divmod(ms, 60000)
+    seconds, ms = divmod(ms, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d},{ms:03d}"
+
+
+def format_ass_time(ms):
+    # ASS 精确到百分之一秒，多余的毫秒舍去
+    hours, ms = divmod(ms, 3600000)
+    minutes, ms = divmod(ms, 60000)
+    seconds, ms = divmod(ms, 1000)
+    return f"{hours}:{minutes:02d}:{seconds:02d}.{ms // 10:02d}"
+
+
+def srt_lines(cues):
+    for index, (start, end, text) in enumerate(cues, 1):
+        yield f"{index}\n{format_srt_time(start)} --> {format_srt_time(end)}\n{text}\n\n"
+
+
+def vtt_lines(cues):
+    yield "WEBVTT\n\n"
+    for start, end, text in cues:
+        # 除保留的样式标签外，< 和 & 需要转义
+        text = text.replace('&', '&amp;')
+        text = re.sub(r'<(?!/?[ibu]>)', '&lt;', text)
+        start, end = format_srt_time(start).replace(',', '.'), format_srt_time(end).replace(',', '.')
+        yield f"{start} --> {end}\n{text}\n\n"
+
+
+def ass_lines(cues, header=ASS_HEADER):
+    yield header
+    for start, end, text in cues:
+        text = STYLE_TAG_RE.sub(lambda m: f"{{\\{m.group(2).lower()}{0 if m.group(1) else 1}}}", text)
+        text = ANY_TAG_RE.sub('', text).replace('\n', '\\N')
+        yield f"Dialogue: 0,{format_ass_time(start)},{format_ass_time(end)},Default,,0,0,0,,{text}\n"
+
+
+WRITERS = {'srt': srt_lines, 'vtt': vtt_lines, 'ass': ass_lines}
+
+
+def write_cues(cues, path, subtitle_format=None):
+    """
+    把字幕写入文件（先写临时文件，完成后再重命名）
+
+    返回:
+        写入的字幕条数
+    """
+    subtitle_format = subtitle_format or format_of(path)
+    if subtitle_format not in WRITERS:
+        raise ValueError(f"不支持的字幕格式: {path}")
+    count = 0
+
+    def counted():
+        nonlocal count
+        for cue in cues:
+            count += 1
+            yield cue
+
+    _write_lines(WRITERS[subtitle_format](counted()), path)
+    return count
+
+
+def _write_lines(lines, path):
+    """逐行写入文件，先写临时文件，完成后再重命名"""
+    write_file = partial_path(path)
+    try:
+        with open(write_file, 'w', encoding='utf-8', newline='\n') as f:
+            f.writelines(lines)
+    except BaseException:
+        discard_partial(write_file)
+        raise
+    commit_output(write_file, path)
+
+
+def convert_file(input_file, output_file, input_format=None, output_format=None):
+    """
+    转换一个字幕文件
+
+    返回:
+        转换的字幕条数
+    """
+    return write_cues(read_cues(input_file, input_format), output_file, output_format)
+
+
+def build_offset_table(keep_segments):
+    """
+    由保留段生成时间换算表
+
+    参数:
+        keep_segments: 按时间排列、互不重叠的保留段 [(start, end), ...]（秒）
+
+    返回:
+        (各段开始毫秒, 各段结束毫秒, 各段在输出中的开始毫秒)
+    """
+    starts, ends, offsets = [], [], []
+    position = 0
+    for start, end in keep_segments:
+        start_ms, end_ms = round(start * 1000), round(end * 1000)
+        if end_ms <= start_ms:
+            continue
+        starts.append(start_ms)
+        ends.append(end_ms)
+        offsets.append(position)
+        position += end_ms - start_ms
+    return starts, ends, offsets
+
+
+def retime_cue(table, start, end):
+    """
+    把原视频中的字幕时间换算为剪切后视频中的时间
+
+    字幕的开头或结尾落在删除段中时截到保留段边界，跨过删除段的字幕连续显示，
+    完全落在删除段中的字幕丢弃。每条字幕只需两次二分查找。
+
+    返回:
+        (开始毫秒, 结束毫秒)，字幕被删除时返回 None
+    """
+    starts, ends, offsets = table
+    # 第一个在字幕开始之后结束的保留段，和最后一个在字幕结束之前开始的保留段
+    first = bisect.bisect_right(ends, start)
+    last = bisect.bisect_left(starts, end) - 1
+    if first > last:
+        return None
+    new_start = offsets[first] + max(start, starts[first]) - starts[first]
+    new_end = offsets[last] + min(end, ends[last]) - starts[last]
+    if new_end <= new_start:
+        return None
+    return new_start, new_end
+
+
+def retime_cues(cues, keep_segments):
+    """逐条换算字幕时间，丢弃落在删除段中的字幕"""
+    table = build_offset_table(keep_segments)
+    for start, end, text in cues:
+        retimed = retime_cue(table, start, end)
+        if retimed:
+            yield retimed[0], retimed[1], text
+
+
+def _retime_ass_lines(lines, table):
+    """只改写 ASS 中 Dialogue 行的时间，文件头、样式和其他行原样保留"""
+    in_events = False
+    fields = ['Layer', 'Start', 'End', 'Style', 'Name', 'MarginL', 'MarginR', 'MarginV', 'Effect', 'Text']
+    for line in lines:
+        stripped = line.strip()
+        if stripped.startswith('['):
+            in_events = stripped.lower() == '[events]'
+        elif in_events:
+            key, _, value = stripped.partition(':')
+            if key == 'Format':
+                fields = [field.strip() for field in value.split(',')]
+            elif key in ('Dialogue', 'Comment') and 'Start' in fields and 'End' in fields:
+                values = value.lstrip().split(',', len(fields) - 1)
+                start_index, end_index = fields.index('Start'), fields.index('End')
+                start = end = None
+                if len(values) == len(fields):
+                    start = ASS_TIME_RE.match(values[start_index].strip())
+                    end = ASS_TIME_RE.match(values[end_index].strip())
+                if start and end:
+                    retimed = retime_cue(table, _timestamp_ms(*start.groups()),
+                                         _timestamp_ms(*end.groups()))
+                    if retimed is None:
+                        continue
+                    values[start_index] = format_ass_time(retimed[0])
+                    values[end_index] = format_ass_time(retimed[1])
+                    line = f"{key}: {','.join(values)}\n"
+        yield line
+
+
+def retime_file(input_file, output_file, keep_segments):
+    """
+    按保留段换算字幕文件的时间，输出与输入格式相同
+
+    ASS 只改写时间，保留原有样式；SRT / WebVTT 重新生成。输出文件可以就是输入文件:
+    先写临时文件，读完输入并关闭后才替换
+
+    返回:
+        输出的字幕条数（ASS 为 None）
+    """
+    subtitle_format = format_of(input_file)
+    if subtitle_format != 'ass':
+        return write_cues(retime_cues(read_cues(input_file), keep_segments), output_file)
+    table = build_offset_table(keep_segments)
+    _write_lines(_retime_ass_lines(_read_lines(input_file), table), output_file)
+    return None
+
+
+def _read_lines(path):
+    # 读完后立即关闭文件，原地改写时 Windows 上才能替换原文件
+    with open(path, 'r', encoding=detect_encoding(path)) as f:
+        yield from f
+
+
+def find_sidecars(video_file):
+    """
+    查找视频旁边的同名字幕文件，例如 video.srt、video.en.srt、video.zh.ass
+
+    视频名和扩展名之间只能是语言标记，video.ep2.srt 属于另一个视频 video.ep2.mp4，不算在内
+
+    返回:
+        [(字幕文件, 视频文件名之后的部分，例如 '.en.srt'), ...]
+    """
+    directory = os.path.dirname(video_file) or '.'
+    stem = os.path.splitext(os.path.basename(video_file))[0]
+    sidecars = []
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if (not entry.name.startswith(stem + '.') or not format_of(entry.name)
+                        or is_partial_file(entry.name) or not entry.is_file()):
+                    continue
+                suffix = entry.name[len(stem):]
+                # '.en.srt' -> 'en'，'.srt' -> ''
+                language = suffix[1:].rpartition('.')[0]
+                if not language or SIDECAR_LANGUAGE_RE.fullmatch(language):
+                    sidecars.append((entry.path, suffix))
+    except OSError:
+        return []
+    return sorted(sidecars)
+
+
+def retime_sidecars(input_file, output_file, keep_segments):
+    """
+    剪切视频后，把原视频的外挂字幕按保留段换算时间，写到输出文件旁边
+
+    参数:
+        input_file: 原视频文件
+        output_file: 剪切后的视频文件
+        keep_segments: 保留段 [(start, end), ...]（秒）
+
+    返回:
+        写出的字幕文件列表
+    """
+    if is_stream_output(output_file):
+        return []
+    output_stem = os.path.splitext(output_file)[0]
+    written = []
+    for sidecar, suffix in find_sidecars(input_file):
+        # 输出覆盖原视频时（例如文件夹模式输出到原文件夹）字幕也原地改写
+        target = output_stem + suffix
+        try:
+            retime_file(sidecar, target, keep_segments)
+        except (OSError, ValueError, UnicodeError) as e:
+            print(f"警告: 字幕 {os.path.basename(sidecar)} 调整时间失败: {e}")
+            continue
+        print(f"字幕已同步调整时间: {target}")
+        written.append(target)
+    return written
+
+
+def pick_sidecar(video_file, language=None):
+    """
+    选择要烧录到画面中的外挂字幕
+
+    参数:
+        video_file: 视频文件
+        language: 语言后缀，例如 'zh' 选择 video.zh.srt；None 时优先选择不带语言后缀的
+                  video.srt，没有时使用第一个外挂字幕
+
+    返回:
+        字幕文件，没有合适的字幕时返回 None
+    """
+    candidates = []
+    for sidecar, suffix in find_sidecars(video_file):
+        # '.zh.srt' -> 'zh'，'.srt' -> ''
+        suffix_language = suffix[1:].rpartition('.')[0]
+        if language is None or suffix_language.lower() == language.lower():
+            candidates.append((suffix_language != '', sidecar))
+    return min(candidates)[1] if candidates else None
+
+
+def _escape_filter_value(value):
+    # 先按滤镜选项转义，再按滤镜图转义，Windows 盘符中的 ':' 也需要转义
+    value = re.sub(r"([\\':])", r'\\\1', value)
+    return re.sub(r"([\\'\[\],;])", r'\\\1', value)
+
+
+def burn_filter(subtitle_file, time_offset=0.0):
+    """
+    把字幕烧录到画面中的 ffmpeg 视频滤镜 (-vf)
+
+    subtitles 滤镜由 libass 渲染，ASS 字幕保留原有样式；GBK 编码的字幕指定 charenc，
+    不需要先转换编码。
+
+    参数:
+        subtitle_file: 字幕文件 (SRT / WebVTT / ASS)
+        time_offset: 输入画面在原视频中的开始时间（秒），只编码其中一段时字幕时间随之对齐
+    """
+    path = os.path.abspath(subtitle_file).replace('\\', '/')
+    option = f"filename={_escape_filter_value(path)}"
+    if detect_encoding(subtitle_file) == 'gbk':
+        option += ':charenc=GBK'
+    if time_offset > 0:
+        # 渲染时临时把时间戳换回原视频中的时间，渲染后再从 0 开始
+        return f"setpts=PTS+{time_offset:.6f}/TB,subtitles={option},setpts=PTS-STARTPTS"
+    return f"subtitles={option}"
+
+
+def combine_subtitles(clips, output_file):
+    """
+    按片段在拼接结果中的开始时间偏移各片段的字幕，合并为一条字幕
+
+    超出片段时长的字幕截到片段结尾，不会显示到下一个片段上。ASS 字幕按统一的样式
+    重新生成。
+
+    参数:
+        clips: 按拼接顺序排列的 [(字幕文件或 None, 片段时长秒), ...]
+        output_file: 合并后的字幕文件，格式按扩展名判断
+
+    返回:
+        合并的字幕条数
+    """
+    def shifted():
+        position = 0.0
+        for subtitle_file, duration in clips:
+            offset = round(position * 1000)
+            end_limit = round((position + duration) * 1000)
+            if subtitle_file:
+                for start, end, text in read_cues(subtitle_file):
+                    start, end = start + offset, min(end + offset, end_limit)
+                    if end > start:
+                        yield start, end, text
+            position += duration
+
+    return write_cues(shifted(), output_file)
+
+
+def collect_subtitles(paths, output_format, output_dir=None, recursive=True, input_formats=FORMATS):
+    """
+    展开文件和文件夹，生成 (输入文件, 输出文件) 对
+
+    参数:
+        paths: 文件或文件夹列表
+        output_format: 目标格式，已经是该格式的文件跳过
+        output_dir: 输出文件夹，默认输出到原文件旁；指定时保持子文件夹结构
+        recursive: 是否扫描子文件夹
+        input_formats: 只转换这些格式的文件
+    """
+    for path in paths:
+        if os.path.isfile(path):
+            files = [(path, '')]
+        else:
+            files = []
+            for root, dirs, names in os.walk(path):
+                if not recursive:
+                    dirs[:] = []
+                relative_dir = os.path.relpath(root, path)
+                files += [(os.path.join(root, name), relative_dir) for name in sorted(names)]
+        for input_file, relative_dir in files:
+            subtitle_format = format_of(input_file)
+            if (is_partial_file(input_file) or subtitle_format not in input_formats
+                    or subtitle_format == output_format):
+                continue
+            base_name = os.path.splitext(os.path.basename(input_file))[0] + '.' + output_format
+            if output_dir:
+                yield input_file, os.path.normpath(os.path.join(output_dir, relative_dir, base_name))
+            else:
+                yield input_file, os.path.join(os.path.dirname(input_file), base_name)
+
+
+def _convert_job(pair):
+    """进程池中的任务，返回 (输入文件, 字幕条数或错误信息)"""
+    input_file, output_file = pair
+    try:
+        os.makedirs(os.path.dirname(output_file) or '.', exist_ok=True)
+        return input_file, convert_file(input_file, output_file)
+    except (OSError, ValueError, UnicodeError) as e:
+        return input_file, str(e)
+
+
+def convert_tree(paths, output_format, output_dir=None, recursive=True, workers=None, force=False,
+                 input_formats=FORMATS):
+    """
+    批量转换字幕文件
+
+    参数:
+        paths: 文件或文件夹列表
+        output_format: 目标格式 'srt' / 'vtt' / 'ass'
+        output_dir: 输出文件夹，默认输出到原文件旁
+        recursive: 是否扫描子文件夹
+        workers: 进程数，默认为 CPU 核心数
+        force: 输出文件比输入文件新时也重新转换
+        input_formats: 只转换这些格式的文件
+
+    返回:
+        (成功数, 失败数, 跳过数)
+    """
+    pending = []
+    skipped = 0
+    for input_file, output_file in collect_subtitles(paths, output_format, output_dir, recursive,
+                                                     input_formats):
+        # 每晚重复运行时只转换有变化的文件
+        if (not force and os.path.exists(output_file)
+                and os.path.getmtime(output_file) >= os.path.getmtime(input_file)):
+            skipped += 1
+            continue
+        pending.append((input_file, output_file))
+
+    success_count = 0
+    fail_count = 0
+    if not pending:
+        return success_count, fail_count, skipped
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(pending) == 1:
+        results = map(_convert_job, pending)
+        executor = None
+    else:
+        executor = ProcessPoolExecutor(max_workers=workers)
+        # 字幕文件很小，每次给进程分配一批文件，减少进程间通信
+        chunksize = max(1, min(256, len(pending) // (workers * 4)))
+        results = executor.map(_convert_job, pending, chunksize=chunksize)
+    try:
+        for input_file, result in results:
+            if isinstance(result, int):
+                success_count += 1
+            else:
+                fail_count += 1
+                print(f"转换失败: {input_file}: {result}")
+    finally:
+        if executor:
+            executor.shutdown()
+    return success_count, fail_count, skipped
+
+
+def run_cli(argv):
+    """
+    命令行批量转换字幕，任务服务器也在常驻进程中直接调用
+
+    返回:
+        退出码，全部成功为 0
+    """
+    output_format = None
+    output_dir = None
+    workers = None
+    recursive = True
+    force = False
+    args = []
+    invalid = None
+    for arg in argv:
+        try:
+            if arg.startswith('--to='):
+                output_format = arg.split('=', 1)[1].lower()
+            elif arg.startswith('--output-dir='):
+                output_dir = arg.split('=', 1)[1]
+            elif arg.startswith('--workers='):
+                workers = int(arg.split('=', 1)[1])
+            elif arg == '--no-recursive':
+                recursive = False
+            elif arg == '--force':
+                force = True
+            else:
+                args.append(arg)
+        except ValueError:
+            invalid = invalid or f"无效的参数值: {arg}"
+    if invalid is None and workers is not None and workers < 1:
+        invalid = "--workers 必须大于 0"
+
+    if invalid or not args or output_format not in FORMATS:
+        if invalid:
+            print(f"错误: {invalid}")
+        print("用法: python subtitles.py <字幕文件/文件夹>... --to=srt|vtt|ass [选项]")
+        print("\n选项:")
+        print("  --to=格式            目标格式: srt / vtt / ass")
+        print("  --output-dir=文件夹  输出文件夹 (默认与输入文件相同)，保持子文件夹结构")
+        print("  --workers=N          同时转换的进程数 (默认为 CPU 核心数)")
+        print("  --no-recursive       不扫描子文件夹")
+        print("  --force              输出文件已是最新时也重新转换")
+        print("\n示例:")
+        print("  # 把 captions 文件夹及子文件夹中的 SRT / ASS 字幕都转换为 WebVTT")
+        print("  python subtitles.py captions --to=vtt")
+        return 1
+
+    for path in args:
+        if not os.path.exists(path):
+            print(f"错误: 路径不存在 - {path}")
+            return 1
+
+    success_count, fail_count, skipped = convert_tree(args, output_format, output_dir, recursive,
+                                                      workers, force)
+    print(f"转换完成: 成功 {success_count} 个, 失败 {fail_count} 个, 跳过 {skipped} 个 (已是最新)")
+    return 1 if fail_count else 0
+
+
+if __name__ == '__main__':
+    sys.exit(run_cli(sys.argv[1:]))
@@ -0,0 +1,185 @@
+"""转码结果缓存（按内容寻址）
+
+以输入文件内容指纹 + 编码参数作为键保存转码后的中间文件。同一个片段用相同参数
+再次转码时（重新合并、换一个文件夹合并、单独转换）直接复用缓存，不再编码。
+
+指纹只读取文件大小和开头、中间、结尾各 1MB 的数据 (blake2b)，几 GB 的文件也只需
+几毫秒。缓存总大小超出上限时按最近使用时间淘汰最旧的文件。
+"""
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+
+from job_journal import partial_path, commit_output, discard_partial
+from media_probe import CACHE_DIR
+
+TRANSCODE_CACHE_DIR = os.path.join(CACHE_DIR, 'transcodes')
+
+# 缓存总大小上限（字节），可用环境变量 VIDEO_TRIMMER_TRANSCODE_CACHE_MB 修改
+MAX_TRANSCODE_CACHE_BYTES = int(
+    os.environ.get('VIDEO_TRIMMER_TRANSCODE_CACHE_MB') or 20 * 1024) * 1024 * 1024
+
+# 指纹读取的每块数据大小
+SAMPLE_SIZE = 1024 * 1024
+
+# 超过该时间（秒）仍未完成的临时文件视为上次中断遗留
+STALE_PARTIAL_SECONDS = 24 * 3600
+
+
+def fingerprint(input_file):
+    """
+    计算文件内容指纹: 文件大小 + 开头、中间、结尾各 SAMPLE_SIZE 字节
+
+    返回:
+        十六进制字符串
+    """
+    size = os.path.getsize(input_file)
+    digest = hashlib.blake2b(str(size).encode('ascii'), digest_size=16)
+    with open(input_file, 'rb') as f:
+        if size <= 3 * SAMPLE_SIZE:
+            digest.update(f.read())
+        else:
+            for offset in (0, (size - SAMPLE_SIZE) // 2, size - SAMPLE_SIZE):
+                f.seek(offset)
+                digest.update(f.read(SAMPLE_SIZE))
+    return digest.hexdigest()
+
+
+def cache_key(input_file, params):
+    """
+    缓存键: 内容指纹 + 编码参数
+
+    参数:
+        input_file: 输入文件
+        params: 影响转码结果的参数（可 JSON 序列化），例如完整的编码参数列表
+    """
+    digest = hashlib.blake2b(fingerprint(input_file).encode('ascii'), digest_size=16)
+    digest.update(json.dumps(params, sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def lookup(key, ext='.mp4'):
+    """查找缓存，命中时更新使用时间并返回缓存文件路径，否则返回 None"""
+    cached_file = os.path.join(TRANSCODE_CACHE_DIR, key + ext)
+    try:
+        os.utime(cached_file)
+    except OSError:
+        return None
+    return cached_file
+
+
+def transcode_cached(input_file, params, produce, ext='.mp4'):
+    """
+    取得输入文件的转码结果，没有缓存时调用 produce 转码并存入缓存
+
+    参数:
+        input_file: 输入文件
+        params: 影响转码结果的参数
+        produce: produce(output_file) 把转码结果写入 output_file，成功返回 True
+        ext: 转码结果的扩展名
+
+    返回:
+        (缓存文件路径, 是否命中)，转码失败时路径为 None
+
+    不会自动淘汰缓存，调用方用完结果后再调用 evict_cache，避免一次大批量转码
+    淘汰掉本批次前面刚写入、还没使用的结果
+    """
+    key = cache_key(input_file, params)
+    cached_file = lookup(key, ext)
+    if cached_file is not None:
+        return cached_file, True
+
+    os.makedirs(TRANSCODE_CACHE_DIR, exist_ok=True)
+    # 临时文件名唯一，相同内容的文件同时转码也不会互相覆盖
+    fd, write_file = tempfile.mkstemp(prefix=f".{key}.", suffix=f".partial{ext}",
+                                      dir=TRANSCODE_CACHE_DIR)
+    os.close(fd)
+
+    try:
+        success = produce(write_file)
+    except BaseException:
+        os.remove(write_file)
+        raise
+    if not success:
+        if os.path.exists(write_file):
+            os.remove(write_file)
+        return None, False
+
+    cached_file = os.path.join(TRANSCODE_CACHE_DIR, key + ext)
+    os.replace(write_file, cached_file)
+    return cached_file, False
+
+
+def export_cached(cached_file, output_file):
+    """
+    把缓存文件放到输出位置: 同一磁盘时使用硬链接，不占用额外空间，否则复制
+
+    先链接或复制到临时文件再原子替换，复制中断时已有的输出文件保持不变
+    """
+    write_file = partial_path(output_file)
+    discard_partial(write_file)
+    try:
+        try:
+            os.link(cached_file, write_file)
+        except OSError:
+            shutil.copyfile(cached_file, write_file)
+        commit_output(write_file, output_file)
+    except BaseException:
+        discard_partial(write_file)
+        raise
+
+
+def evict_cache(keep=(), max_bytes=None):
+    """
+    缓存超出大小上限时，按最近使用时间删除最旧的文件，直到降到上限的 3/4
+
+    参数:
+        keep: 不删除的文件（本次刚使用的结果）
+        max_bytes: 大小上限，默认为 MAX_TRANSCODE_CACHE_BYTES
+    """
+    max_bytes = MAX_TRANSCODE_CACHE_BYTES if max_bytes is None else max_bytes
+    keep = {os.path.abspath(path) for path in keep}
+    now = time.time()
+    entries = []
+    total = 0
+    try:
+        names = os.listdir(TRANSCODE_CACHE_DIR)
+    except OSError:
+        return
+
+    for name in names:
+        path = os.path.join(TRANSCODE_CACHE_DIR, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        if name.startswith('.'):
+            # 正在写入的临时文件，只清理中断遗留的
+            if now - stat.st_mtime > STALE_PARTIAL_SECONDS:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+        total += stat.st_size
+
+    if total <= max_bytes:
+        return
+
+    target = max_bytes * 3 // 4
+    for _, size, path in sorted(entries):
+        if total <= target:
+            break
+        if os.path.abspath(path) in keep:
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            # 可能正被其他进程使用
+            continue
+        total -= size
@@ -2,6 +2,17 @@ import os
 import sys
 import subprocess
 
+from batch_scheduler import make_job, run_batch, DEFAULT_IO_WORKERS, DEFAULT_CPU_WORKERS
+from ffmpeg_runner import run_ffmpeg
+from job_journal import (
+    partial_path, commit_output, discard_partial, is_partial_file,
+    journal_path_for, load_journal, input_identity, is_completed, journal_outputs, run_journaled,
+)
+from media_probe import get_video_duration
+from output_profile import PROFILES, DEFAULT_PROFILE, STDOUT_OUTPUT, output_target, use_stdout_for_data
+from smart_cut import smart_cut
+from subtitles import retime_sidecars
+
 def parse_time(time_str):
     """
     解析时间字符串为秒数
@@ -25,31 +36,17 @@ def parse_time(time_str):
     else:
         raise ValueError(f"无效的时间格式: {time_str}")
 
-def get_video_duration(video_file):
+def default_output_file(input_file, output_dir=None):
     """
-    获取视频时长（秒）
-    
-    参数:
-        video_file: 视频文件路径
-    
-    返回:
-        视频时长（秒）
+    默认输出文件: 输出文件夹（默认为输入文件所在文件夹）下的 原文件名_trimmed.mp4
     """
-    cmd = [
-        'ffprobe', '-v', 'error',
-        '-show_entries', 'format=duration',
-        '-of', 'default=noprint_wrappers=1:nokey=1',
-        video_file
-    ]
-    
-    try:
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        return float(result.stdout.strip())
-    except Exception as e:
-        print(f"获取视频时长失败: {e}")
-        return None
+    base_name = os.path.splitext(os.path.basename(input_file))[0]
+    if not output_dir:
+        output_dir = os.path.dirname(input_file) if os.path.dirname(input_file) else '.'
+    return os.path.join(output_dir, f"{base_name}_trimmed.mp4")
 
-def trim_video_edges(input_file, start_trim, end_trim, output_file=None, output_dir=None):
+def trim_video_edges(input_file, start_trim, end_trim, output_file=None, output_dir=None,
+                     cut_mode='copy', profile=None, subtitles=True):
     """
     裁剪视频的开头和结尾
     
@@ -57,8 +54,12 @@ def trim_video_edges(input_file, start_trim, end_trim, output_file=None, output_
         input_file: 输入视频文件
         start_trim: 开头裁剪时间点（从0:00到该时间点的内容会被删除）
         end_trim: 结尾裁剪时间点（从该时间点到结束的内容会被删除）
-        output_file: 输出文件名
+        output_file: 输出文件名，'-' 表示输出到标准输出
         output_dir: 输出文件夹
+        cut_mode: 'copy' 直接复制流（剪切点落在关键帧上）；
+                  'smart' 智能裁剪（只重编码剪切点附近的不完整 GOP，帧级精确）
+        profile: MP4 输出格式 ('plain' / 'faststart' / 'fragmented')，None 表示默认格式
+        subtitles: 是否同时调整视频旁同名外挂字幕 (.srt / .vtt / .ass) 的时间
     """
     # 检查输入文件
     if not os.path.exists(input_file):
@@ -103,14 +104,8 @@ def trim_video_edges(input_file, start_trim, end_trim, output_file=None, output_
     print(f"  保留时长: {keep_duration:.2f}s ({keep_duration/60:.2f}min)")
     
     # 设置输出文件名
-    base_name = os.path.splitext(os.path.basename(input_file))[0]
-    input_dir = os.path.dirname(input_file) if os.path.dirname(input_file) else '.'
-    
     if output_file is None:
-        if output_dir:
-            output_file = os.path.join(output_dir, f"{base_name}_trimmed.mp4")
-        else:
-            output_file = os.path.join(input_dir, f"{base_name}_trimmed.mp4")
+        output_file = default_output_file(input_file, output_dir)
     
     # 创建输出文件夹
     output_dir_path = os.path.dirname(output_file)
@@ -118,30 +113,87 @@ def trim_video_edges(input_file, start_trim, end_trim, output_file=None, output_
         os.makedirs(output_dir_path)
         print(f"已创建输出文件夹: {output_dir_path}")
     
+    # 先写入临时文件，完成后再重命名，中途中断不会留下不完整的输出文件
+    write_file = partial_path(output_file)
+    
+    # 智能裁剪：复制完整 GOP，只重编码剪切点附近的片段
+    if cut_mode == 'smart':
+        if smart_cut(input_file, [(start_time, end_time)], write_file, profile):
+            commit_output(write_file, output_file)
+            print(f"\n视频处理成功! 输出文件: {output_file}")
+            if subtitles:
+                retime_sidecars(input_file, output_file, [(start_time, end_time)])
+            return True
+        discard_partial(write_file)
+        return False
+    
     # 使用 ffmpeg 裁剪视频
+    target_args, stdout = output_target(write_file, profile)
     cmd = [
         'ffmpeg', '-y', '-i', input_file,
         '-ss', str(start_time),
         '-t', str(keep_duration),
         '-c', 'copy',
-        output_file
-    ]
+    ] + target_args
     
     print(f"\n执行命令: {' '.join(cmd)}")
     try:
-        subprocess.run(cmd, check=True)
+        run_ffmpeg(cmd, label=os.path.basename(input_file), duration=keep_duration, check=True,
+                   stdout=stdout)
+        commit_output(write_file, output_file)
         print(f"\n视频处理成功! 输出文件: {output_file}")
+        if subtitles:
+            retime_sidecars(input_file, output_file, [(start_time, end_time)])
         return True
     except subprocess.CalledProcessError as e:
         print(f"视频处理失败: {e}")
+        discard_partial(write_file)
         return False
     except FileNotFoundError:
         print("错误: 未找到 ffmpeg，请确保已安装 ffmpeg 并添加到系统 PATH")
         return False
 
-if __name__ == '__main__':
-    if len(sys.argv) < 2:
-        print("用法: python trim_edges.py <输入视频/文件夹> [开头时间] [结尾时间] [输出文件/文件夹]")
+def run_cli(argv):
+    """
+    命令行裁剪（单个文件或批量处理文件夹），任务服务器也在常驻进程中直接调用
+    
+    返回:
+        退出码，成功为 0
+    """
+    # 分离可选参数
+    cut_mode = 'copy'
+    io_jobs = DEFAULT_IO_WORKERS
+    cpu_jobs = DEFAULT_CPU_WORKERS
+    resume = True
+    profile = None
+    subtitles = True
+    args = []
+    invalid = None
+    for arg in argv:
+        try:
+            if arg == '--smart':
+                cut_mode = 'smart'
+            elif arg == '--no-subtitles':
+                subtitles = False
+            elif arg.startswith('--profile='):
+                profile = arg.split('=', 1)[1]
+            elif arg.startswith('--jobs='):
+                io_jobs = int(arg.split('=', 1)[1])
+            elif arg.startswith('--cpu-jobs='):
+                cpu_jobs = int(arg.split('=', 1)[1])
+            elif arg == '--no-resume':
+                resume = False
+            else:
+                args.append(arg)
+        except ValueError:
+            invalid = invalid or f"无效的参数值: {arg}"
+    if invalid is None and min(io_jobs, cpu_jobs) < 1:
+        invalid = "--jobs / --cpu-jobs 必须大于 0"
+    
+    if invalid or len(args) < 1:
+        if invalid:
+            print(f"错误: {invalid}")
+        print("用法: python trim_edges.py <输入视频/文件夹> [开头时间] [结尾时间] [输出文件/文件夹] [--smart]")
         print("\n示例:")
         print("  # 裁剪开头1分钟和结尾从32分钟开始的部分")
         print("  python trim_edges.py video.mp4 1:00 32:00")
@@ -160,21 +212,48 @@ if __name__ == '__main__':
         print()
         print("  # 批量处理并指定输出文件夹")
         print("  python trim_edges.py video_folder 1:00 32:00 output_folder")
+        print()
+        print("  # 智能裁剪（只重编码剪切点附近的画面，帧级精确）")
+        print("  python trim_edges.py video.mp4 1:00 32:00 --smart")
+        print()
+        print("  # 输出为快速启动的 MP4（索引在文件开头，网页播放器无需下载完即可播放）")
+        print("  python trim_edges.py video.mp4 1:00 32:00 --profile=faststart")
+        print()
+        print("  # 输出分片 MP4 到标准输出，交给其他程序处理")
+        print("  python trim_edges.py video.mp4 1:00 32:00 - | other_program")
+        print("\n输出格式:")
+        print("  --profile=plain|faststart|fragmented  MP4 输出格式 (默认 plain)，输出文件为 - 时强制使用 fragmented")
+        print("\n字幕:")
+        print("  视频旁的同名字幕 (video.srt / video.en.ass 等) 会按保留的时间段调整后写到输出文件旁")
+        print("  --no-subtitles  不处理外挂字幕")
+        print("\n批量处理选项:")
+        print(f"  --jobs=N      流复制任务的并发数 (默认 {DEFAULT_IO_WORKERS})")
+        print(f"  --cpu-jobs=N  重编码任务的并发数 (默认 {DEFAULT_CPU_WORKERS})")
+        print("  --no-resume   忽略断点续传日志，重新处理所有文件")
         print("\n时间格式支持:")
         print("  - HH:MM:SS (例如: 1:30:45)")
         print("  - MM:SS (例如: 1:30)")
         print("  - SS (例如: 90)")
-        sys.exit(1)
+        return 1
     
-    input_path = sys.argv[1]
-    start_trim = sys.argv[2] if len(sys.argv) > 2 else "0"
-    end_trim = sys.argv[3] if len(sys.argv) > 3 else None
-    output_path = sys.argv[4] if len(sys.argv) > 4 else None
+    input_path = args[0]
+    start_trim = args[1] if len(args) > 1 else "0"
+    end_trim = args[2] if len(args) > 2 else None
+    output_path = args[3] if len(args) > 3 else None
+    
+    if profile is not None and profile not in PROFILES:
+        print(f"错误: 未知的输出格式 '{profile}' (可选: {', '.join(PROFILES)})")
+        return 1
+    if output_path == STDOUT_OUTPUT:
+        # 视频数据写到标准输出，提示信息改为写到标准错误
+        use_stdout_for_data()
     
     # 检查输入是文件还是文件夹
     if os.path.isfile(input_path):
         # 单个文件处理
-        trim_video_edges(input_path, start_trim, end_trim, output_path)
+        if not trim_video_edges(input_path, start_trim, end_trim, output_path, cut_mode=cut_mode,
+                                profile=profile, subtitles=subtitles):
+            return 1
     elif os.path.isdir(input_path):
         # 批量处理文件夹
         print(f"批量处理模式: 扫描文件夹 '{input_path}'")
@@ -185,12 +264,12 @@ if __name__ == '__main__':
         # 获取所有视频文件
         video_files = []
         for filename in os.listdir(input_path):
-            if filename.lower().endswith(video_extensions):
+            if filename.lower().endswith(video_extensions) and not is_partial_file(filename):
                 video_files.append(os.path.join(input_path, filename))
         
         if not video_files:
             print(f"错误: 文件夹 '{input_path}' 中没有找到视频文件")
-            sys.exit(1)
+            return 1
         
         video_files.sort()
         print(f"\n找到 {len(video_files)} 个视频文件:")
@@ -207,24 +286,48 @@ if __name__ == '__main__':
         else:
             output_dir = input_path
         
-        print(f"\n开始批量处理...")
-        success_count = 0
-        fail_count = 0
+        # 断点续传: 跳过日志中已用相同参数完成的文件，以及上次运行的输出文件
+        journal_file = journal_path_for(output_dir)
+        journal = load_journal(journal_file) if resume else {}
+        previous_outputs = journal_outputs(journal)
+        params = {'tool': 'trim_edges', 'start': start_trim, 'end': end_trim, 'cut_mode': cut_mode}
+        if (profile or DEFAULT_PROFILE) != 'plain':
+            params['profile'] = profile or DEFAULT_PROFILE
+        pending_files = []
+        skipped_count = 0
+        for video_file in video_files:
+            if os.path.abspath(video_file) in previous_outputs:
+                continue
+            if is_completed(journal, input_identity(video_file, params)):
+                skipped_count += 1
+                continue
+            pending_files.append(video_file)
+        if skipped_count:
+            print(f"\n跳过 {skipped_count} 个已完成的文件 (使用 --no-resume 重新处理)")
         
-        for i, video_file in enumerate(video_files, 1):
-            print(f"\n{'='*60}")
-            print(f"处理 [{i}/{len(video_files)}]: {os.path.basename(video_file)}")
-            print(f"{'='*60}")
-            
-            if trim_video_edges(video_file, start_trim, end_trim, output_dir=output_dir):
-                success_count += 1
-            else:
-                fail_count += 1
+        print(f"\n开始批量处理...")
+        # 智能裁剪需要重编码，按 CPU 密集型任务调度
+        kind = 'cpu' if cut_mode == 'smart' else 'io'
+        jobs = [
+            make_job(
+                os.path.basename(video_file), run_journaled,
+                (journal_file, video_file, params, default_output_file(video_file, output_dir),
+                 trim_video_edges, video_file, start_trim, end_trim),
+                {'output_dir': output_dir, 'cut_mode': cut_mode, 'profile': profile,
+                 'subtitles': subtitles},
+                kind=kind, input_file=video_file)
+            for video_file in pending_files
+        ]
+        success_count, fail_count = run_batch(jobs, io_workers=io_jobs, cpu_workers=cpu_jobs)
         
         print(f"\n{'='*60}")
         print(f"批量处理完成!")
-        print(f"成功: {success_count} 个, 失败: {fail_count} 个")
+        print(f"成功: {success_count} 个, 失败: {fail_count} 个, 跳过: {skipped_count} 个")
         print(f"{'='*60}")
     else:
         print(f"错误: 路径 '{input_path}' 不存在")
-        sys.exit(1)
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(run_cli(sys.argv[1:]))
@@ -0,0 +1,507 @@
+"""监视文件夹，新录制的视频写完后自动裁剪 / 删除片段 / 转换
+
+常驻运行，按配置文件监视多个文件夹。Linux 上通过 inotify 接收文件事件，其他系统
+（或 inotify 不可用时）定时扫描文件夹。文件大小和修改时间稳定、且没有进程正在
+写入后，在同一个进程中调用 trim_edges / remove_segments / convert_to_mp4 的处理
+函数，每个文件不需要重新启动 Python。流复制任务和重编码任务分别使用有并发上限
+的线程池，完成记录写入输出文件夹的断点续传日志，重启后不会重复处理。
+
+配置文件 (JSON) 示例:
+    {
+        "io_jobs": 4,
+        "cpu_jobs": 2,
+        "settle_seconds": 5,
+        "watches": [
+            {"folder": "D:/capture/lecture", "action": "trim",
+             "start": "1:00", "end": "32:00", "output_dir": "D:/processed/lecture"},
+            {"folder": "D:/capture/talk", "action": "remove",
+             "segments": "cuts.csv", "cut_mode": "smart"},
+            {"folder": "D:/capture/raw", "action": "remove", "detect": ["silence", "black"]},
+            {"folder": "D:/capture/legacy", "action": "convert", "mode": "auto",
+             "output_dir": "D:/processed/legacy", "profile": "faststart"}
+        ]
+    }
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import select
+import struct
+import ctypes
+import ctypes.util
+from concurrent.futures import ThreadPoolExecutor
+
+import trim_edges
+import remove_segments
+from batch_scheduler import DEFAULT_IO_WORKERS, DEFAULT_CPU_WORKERS
+from convert_to_mp4 import convert_video, get_output_path, choose_auto_modes, ENCODER_MODES
+from detect_cuts import detect_cuts
+from job_journal import (journal_path_for, is_partial_file, load_journal, journal_outputs,
+                         input_identity, is_completed, run_journaled)
+from output_profile import PROFILES, DEFAULT_PROFILE
+
+# 默认处理的视频格式
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.flv', '.wmv', '.m4v', '.webm', '.ts')
+
+# 文件大小和修改时间保持不变多久（秒）后视为写完
+DEFAULT_SETTLE_SECONDS = 5.0
+
+# 没有 inotify 时扫描文件夹的间隔（秒）
+DEFAULT_POLL_SECONDS = 2.0
+
+ACTIONS = ('trim', 'remove', 'convert')
+
+# inotify 常量 (linux/inotify.h)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+INOTIFY_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+INOTIFY_EVENT = struct.Struct('iIII')
+
+
+def load_config(config_file):
+    """
+    读取并检查配置文件
+
+    返回:
+        配置字典，每个监视项都已填好默认值
+
+    异常:
+        ValueError: 配置内容不正确
+    """
+    with open(config_file, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+
+    watches = config.get('watches')
+    if not watches:
+        raise ValueError("配置文件中没有 watches")
+
+    base_dir = os.path.dirname(os.path.abspath(config_file))
+    folders = set()
+    for watch in watches:
+        action = watch.get('action')
+        if action not in ACTIONS:
+            raise ValueError(f"未知的处理方式: {action} (可选: {', '.join(ACTIONS)})")
+        folder = watch.get('folder')
+        if not folder or not os.path.isdir(folder):
+            raise ValueError(f"监视的文件夹不存在: {folder}")
+        watch['folder'] = os.path.abspath(folder)
+        if watch['folder'] in folders:
+            raise ValueError(f"文件夹重复监视: {folder}")
+        folders.add(watch['folder'])
+
+        if watch.get('output_dir'):
+            watch['output_dir'] = os.path.abspath(watch['output_dir'])
+            os.makedirs(watch['output_dir'], exist_ok=True)
+        if watch.get('profile') is not None and watch['profile'] not in PROFILES:
+            raise ValueError(f"未知的输出格式: {watch['profile']}")
+        watch['extensions'] = tuple(ext.lower() for ext in watch.get('extensions', VIDEO_EXTENSIONS))
+
+        if action == 'remove':
+            if not watch.get('segments') and not watch.get('detect'):
+                raise ValueError(f"{folder}: remove 需要 segments 或 detect")
+            # 剪切列表文件相对配置文件所在的文件夹
+            segments = watch.get('segments')
+            if segments and os.path.isfile(os.path.join(base_dir, segments)):
+                segments = os.path.join(base_dir, segments)
+            if segments:
+                # 启动时就解析，格式错误或文件不存在时不开始监视
+                try:
+                    watch['segments'] = remove_segments.load_remove_segments(segments, watch.get('fps'))
+                except (OSError, ValueError) as e:
+                    raise ValueError(f"{folder}: segments 无效: {e}")
+                if not watch['segments']:
+                    raise ValueError(f"{folder}: segments 中没有有效的时间段 (剪切列表文件不存在?)")
+        elif action == 'convert' and watch.get('mode', 'copy') not in ('copy', 'encode', 'auto'):
+            raise ValueError(f"{folder}: 未知的转换模式 {watch.get('mode')}")
+
+    config.setdefault('io_jobs', DEFAULT_IO_WORKERS)
+    config.setdefault('cpu_jobs', DEFAULT_CPU_WORKERS)
+    config.setdefault('settle_seconds', DEFAULT_SETTLE_SECONDS)
+    config.setdefault('poll_seconds', DEFAULT_POLL_SECONDS)
+    return config
+
+
+def open_inotify(folders):
+    """
+    为文件夹创建 inotify 监视
+
+    返回:
+        {'fd': 文件描述符, 'folders': {wd: 文件夹}}，系统不支持时返回 None
+    """
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    except (OSError, AttributeError):
+        return None
+    if fd < 0:
+        return None
+
+    notifier = {'fd': fd, 'folders': {}}
+    for folder in folders:
+        wd = libc.inotify_add_watch(fd, os.fsencode(folder), INOTIFY_MASK)
+        if wd < 0:
+            print(f"警告: 无法监视 {folder} ({os.strerror(ctypes.get_errno())})，改为定时扫描")
+            os.close(fd)
+            return None
+        notifier['folders'][wd] = folder
+    return notifier
+
+
+def read_inotify(notifier, timeout):
+    """
+    等待 inotify 事件
+
+    返回:
+        (文件列表 [(路径, 是否已关闭)], 是否需要重新扫描所有文件夹)
+    """
+    readable, _, _ = select.select([notifier['fd']], [], [], timeout)
+    if not readable:
+        return [], False
+    try:
+        data = os.read(notifier['fd'], 64 * 1024)
+    except BlockingIOError:
+        return [], False
+
+    events = []
+    overflow = False
+    offset = 0
+    while offset + INOTIFY_EVENT.size <= len(data):
+        wd, mask, _, name_len = INOTIFY_EVENT.unpack_from(data, offset)
+        offset += INOTIFY_EVENT.size
+        name = data[offset:offset + name_len].rstrip(b'\0')
+        offset += name_len
+        if mask & IN_Q_OVERFLOW:
+            # 事件队列溢出，有事件丢失
+            overflow = True
+            continue
+        folder = notifier['folders'].get(wd)
+        if folder is None or mask & IN_ISDIR or not name:
+            continue
+        closed = bool(mask & (IN_CLOSE_WRITE | IN_MOVED_TO))
+        events.append((os.path.join(folder, os.fsdecode(name)), closed))
+    return events, overflow
+
+
+def is_being_written(path):
+    """
+    是否有进程正以写方式打开该文件
+
+    Linux 上检查 /proc 中各进程打开的文件，Windows 上录制软件通常不允许其他进程
+    同时写入，尝试以写方式打开即可判断；其他系统无法判断，只依赖文件稳定时间
+    """
+    if os.name == 'nt':
+        try:
+            with open(path, 'r+b'):
+                return False
+        except PermissionError:
+            return True
+        except OSError:
+            return False
+
+    if not os.path.isdir('/proc'):
+        return False
+    target = os.path.realpath(path)
+    for pid in os.listdir('/proc'):
+        if not pid.isdigit():
+            continue
+        fd_dir = f"/proc/{pid}/fd"
+        try:
+            fds = os.listdir(fd_dir)
+        except OSError:
+            continue
+        for fd in fds:
+            try:
+                if os.readlink(os.path.join(fd_dir, fd)) != target:
+                    continue
+                with open(f"/proc/{pid}/fdinfo/{fd}", 'r') as f:
+                    for line in f:
+                        if line.startswith('flags:'):
+                            # O_WRONLY = 1, O_RDWR = 2
+                            if int(line.split()[1], 8) & 3:
+                                return True
+                            break
+            except (OSError, ValueError):
+                continue
+    return False
+
+
+def plan_job(watch, video_file, claimed):
+    """
+    生成一个文件的处理任务
+
+    参数:
+        watch: 监视项配置
+        video_file: 新的视频文件
+        claimed: 已分配的输出路径集合，新分配的路径会加入其中
+
+    返回:
+        (输出文件, 断点续传参数, 任务类型 'io'/'cpu', 处理函数, 参数, 关键字参数)
+    """
+    output_dir = watch.get('output_dir')
+    profile = watch.get('profile')
+    action = watch['action']
+
+    if action == 'trim':
+        cut_mode = watch.get('cut_mode', 'copy')
+        start, end = watch.get('start', '0'), watch.get('end')
+        output_file = trim_edges.default_output_file(video_file, output_dir)
+        params = {'tool': 'trim_edges', 'start': start, 'end': end, 'cut_mode': cut_mode}
+        kind = 'cpu' if cut_mode == 'smart' else 'io'
+        func, args = trim_edges.trim_video_edges, (video_file, start, end, output_file)
+        kwargs = {'cut_mode': cut_mode, 'profile': profile, 'subtitles': watch.get('subtitles', True)}
+
+    elif action == 'remove':
+        cut_mode = watch.get('cut_mode', 'copy')
+        output_file = remove_segments.default_output_file(video_file, output_dir)
+        params = {'tool': 'remove_segments', 'cut_mode': cut_mode,
+                  'min_keep': watch.get('min_keep', 0.0)}
+        if watch.get('detect'):
+            params['detect'] = list(watch['detect'])
+            func, args = detect_and_remove, (watch, video_file, output_file)
+        else:
+            # 与 remove_segments 批处理相同的参数摘要，两者共用断点续传日志
+            # （load_config 已把 segments 解析为合并后的时间段列表）
+            params['segments'] = hashlib.sha1(json.dumps(watch['segments']).encode('utf-8')).hexdigest()
+            func = remove_segments.remove_video_segments
+            args = (video_file, watch['segments'], output_file)
+        kind = 'cpu' if cut_mode == 'smart' else 'io'
+        kwargs = {'cut_mode': cut_mode, 'min_keep': watch.get('min_keep', 0.0), 'profile': profile,
+                  'subtitles': watch.get('subtitles', True)}
+
+    else:
+        mode_name = watch.get('mode', 'copy')
+        encoder = watch.get('encoder', 'cpu')
+        if mode_name == 'copy':
+            mode = 1
+        elif mode_name == 'encode':
+            mode = ENCODER_MODES[encoder]
+        else:
+            mode = choose_auto_modes([video_file], ENCODER_MODES[encoder])[0]
+        output_file = str(get_output_path(video_file, output_dir, claimed))
+        params = {'tool': 'convert_to_mp4', 'mode': mode_name, 'encoder': encoder}
+        kind = 'io' if mode in (1, 6) else 'cpu'
+        func, args = convert_video, (video_file, mode, watch.get('speed', 1.0), output_file)
+        kwargs = {'profile': profile}
+        if watch.get('max_bitrate'):
+            kwargs['max_bitrate'] = float(watch['max_bitrate'])
+            params['max_bitrate'] = kwargs['max_bitrate']
+
+    if (profile or DEFAULT_PROFILE) != 'plain':
+        params['profile'] = profile or DEFAULT_PROFILE
+    claimed.add(os.path.abspath(output_file))
+    return output_file, params, kind, func, args, kwargs
+
+
+def detect_and_remove(watch, video_file, output_file, **kwargs):
+    """先检测静音 / 黑场，再删除检测到的片段"""
+    cuts = detect_cuts(video_file, tuple(watch['detect']),
+                       min_duration=watch.get('min_duration', 2.0),
+                       padding=watch.get('padding', 0.25))
+    if cuts is None:
+        return False
+    if not cuts:
+        print(f"{os.path.basename(video_file)}: 没有检测到需要删除的片段")
+    return remove_segments.remove_video_segments(video_file, cuts, output_file, **kwargs)
+
+
+def _run_watched_job(name, journal_file, video_file, params, output_file, func, args, kwargs):
+    """在线程池中执行一个任务，异常视为失败"""
+    started = time.time()
+    try:
+        success = bool(run_journaled(journal_file, video_file, params, output_file,
+                                     func, *args, **kwargs))
+    except Exception as e:
+        print(f"任务 '{name}' 发生错误: {e}")
+        success = False
+    status = "完成" if success else "失败"
+    print(f"\n[{time.strftime('%H:%M:%S')}] {status}: {name} ({time.time() - started:.1f}s)")
+    return success
+
+
+def watch_folders(config, use_inotify=True, once=False):
+    """
+    监视文件夹并处理写完的新文件，直到按 Ctrl+C
+
+    参数:
+        config: load_config 返回的配置
+        use_inotify: 是否使用 inotify（不可用时自动改为定时扫描）
+        once: 只处理启动时已有的文件，处理完后退出
+    """
+    watches = {watch['folder']: watch for watch in config['watches']}
+    settle = float(config['settle_seconds'])
+    poll = float(config['poll_seconds'])
+
+    notifier = open_inotify(list(watches)) if use_inotify and not once else None
+    if notifier:
+        print(f"使用 inotify 监视 {len(watches)} 个文件夹")
+    elif not once:
+        print(f"每 {poll:g}s 扫描一次 {len(watches)} 个文件夹")
+
+    # 各输出文件夹的断点续传日志，以及本程序生成的文件（输出到监视文件夹时不能再处理）
+    journals = {}
+    produced = set()
+    for watch in watches.values():
+        journal_file = journal_path_for(watch.get('output_dir') or watch['folder'])
+        watch['journal_file'] = journal_file
+        if journal_file not in journals:
+            journals[journal_file] = load_journal(journal_file)
+            produced |= journal_outputs(journals[journal_file])
+
+    pools = {
+        'io': ThreadPoolExecutor(max_workers=max(1, config['io_jobs'])),
+        'cpu': ThreadPoolExecutor(max_workers=max(1, config['cpu_jobs'])),
+    }
+    # 等待写完的文件: 路径 -> {'size', 'mtime', 'since', 'closed'}
+    candidates = {}
+    # 已提交的文件版本 (路径, 大小, 修改时间)，文件被重新写入后会再次处理
+    dispatched = set()
+    futures = []
+
+    def consider(path, closed=False):
+        folder = os.path.dirname(path)
+        watch = watches.get(folder)
+        if watch is None or os.path.abspath(path) in produced:
+            return
+        name = os.path.basename(path)
+        lower = name.lower()
+        if name.startswith('.') or is_partial_file(name) or not lower.endswith(watch['extensions']):
+            return
+        # 只转换容器时跳过已经是 MP4 的文件
+        if watch['action'] == 'convert' and watch.get('mode', 'copy') == 'copy' and lower.endswith('.mp4'):
+            return
+        candidate = candidates.setdefault(path, {'size': -1, 'mtime': -1, 'since': 0.0, 'closed': False})
+        candidate['closed'] = candidate['closed'] or closed
+
+    def scan():
+        for folder in watches:
+            try:
+                with os.scandir(folder) as entries:
+                    for entry in entries:
+                        if entry.is_file():
+                            consider(entry.path)
+            except OSError as e:
+                print(f"警告: 无法读取文件夹 {folder}: {e}")
+
+    def dispatch(path):
+        watch = watches[os.path.dirname(path)]
+        name = os.path.basename(path)
+        journal_file = watch['journal_file']
+        # 单个文件出错（例如探测失败、文件刚被删除）只跳过这个文件，不影响继续监视
+        try:
+            output_file, params, kind, func, args, kwargs = plan_job(watch, path, produced)
+            if is_completed(journals[journal_file], input_identity(path, params)):
+                return
+            print(f"\n[{time.strftime('%H:%M:%S')}] 开始处理: {name} -> {output_file}")
+            futures.append(pools[kind].submit(_run_watched_job, name, journal_file, path, params,
+                                              output_file, func, args, kwargs))
+        except Exception as e:
+            print(f"\n[{time.strftime('%H:%M:%S')}] 跳过: {name} ({e})")
+
+    def check_candidates():
+        now = time.time()
+        for path in list(candidates):
+            candidate = candidates[path]
+            try:
+                stat = os.stat(path)
+            except OSError:
+                # 文件已被删除或改名
+                del candidates[path]
+                continue
+            if (stat.st_size, stat.st_mtime) != (candidate['size'], candidate['mtime']):
+                candidate.update(size=stat.st_size, mtime=stat.st_mtime, since=now)
+                if not candidate['closed']:
+                    continue
+            # 收到写入关闭事件后只要文件没有再变化即可处理，否则等待稳定时间
+            if not candidate['closed'] and now - candidate['since'] < settle:
+                continue
+            if stat.st_size == 0 or is_being_written(path):
+                candidate['closed'] = False
+                continue
+            del candidates[path]
+            version = (path, stat.st_size, stat.st_mtime)
+            if version not in dispatched:
+                dispatched.add(version)
+                dispatch(path)
+
+    scan()
+    if once:
+        # 启动时已有的文件不需要等待稳定时间，但仍跳过正在写入的文件
+        for candidate in candidates.values():
+            candidate['closed'] = True
+    print("开始监视，按 Ctrl+C 停止")
+
+    try:
+        last_scan = time.time()
+        while True:
+            if notifier:
+                events, overflow = read_inotify(notifier, 1.0)
+                for path, closed in events:
+                    consider(path, closed)
+                if overflow:
+                    scan()
+            else:
+                time.sleep(min(poll, 1.0))
+                if not once and time.time() - last_scan >= poll:
+                    scan()
+                    last_scan = time.time()
+            check_candidates()
+            futures = [future for future in futures if not future.done()]
+            if once and not candidates and not futures:
+                break
+    except KeyboardInterrupt:
+        print("\n停止监视，等待正在处理的文件完成...")
+    finally:
+        if notifier:
+            os.close(notifier['fd'])
+        for pool in pools.values():
+            # 未开始的任务直接取消，重新启动后会再次处理
+            pool.shutdown(wait=True, cancel_futures=True)
+
+
+if __name__ == '__main__':
+    use_inotify = True
+    once = False
+    args = []
+    for arg in sys.argv[1:]:
+        if arg == '--poll':
+            use_inotify = False
+        elif arg == '--once':
+            once = True
+        else:
+            args.append(arg)
+
+    if len(args) != 1:
+        print("用法: python watch_folder.py <配置文件.json> [--poll] [--once]")
+        print("\n选项:")
+        print("  --poll   不使用 inotify，定时扫描文件夹（网络共享文件夹上 inotify 收不到其他机器的写入）")
+        print("  --once   只处理已有的文件，处理完后退出")
+        print("\n配置文件示例:")
+        print('  {"settle_seconds": 5, "cpu_jobs": 2,')
+        print('   "watches": [{"folder": "capture", "action": "trim", "start": "1:00", "end": "32:00",')
+        print('                "output_dir": "processed"}]}')
+        print("\n监视项:")
+        print("  folder        监视的文件夹")
+        print("  action        trim (start / end) | remove (segments 或 detect) | convert (mode / encoder)")
+        print("  output_dir    输出文件夹 (默认为监视的文件夹)")
+        print("  cut_mode      trim / remove 的裁剪方式: copy | smart | single_pass")
+        print("  profile       MP4 输出格式: plain | faststart | fragmented")
+        print("  subtitles     trim / remove 是否同时调整外挂字幕的时间 (默认 true)")
+        print("  fps           remove 的 segments 为 CMX3600 EDL 时的时间码帧率")
+        print("  extensions    处理的扩展名列表 (默认为常见视频格式)")
+        sys.exit(1)
+
+    try:
+        config = load_config(args[0])
+    except (OSError, ValueError) as e:
+        print(f"错误: 配置文件无效: {e}")
+        sys.exit(1)
+
+    watch_folders(config, use_inotify=use_inotify, once=once)